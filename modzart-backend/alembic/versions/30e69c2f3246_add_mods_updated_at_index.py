@@ -0,0 +1,28 @@
+"""add_mods_updated_at_index
+
+Revision ID: 30e69c2f3246
+Revises: 5e64138c7f5b
+Create Date: 2026-10-19 10:41:52.870163
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '30e69c2f3246'
+down_revision: Union[str, None] = '5e64138c7f5b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_mods_updated_at_id', 'mods', ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mods_updated_at_id', table_name='mods')
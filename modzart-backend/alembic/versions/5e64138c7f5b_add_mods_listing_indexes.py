@@ -0,0 +1,31 @@
+"""add_mods_listing_indexes
+
+Revision ID: 5e64138c7f5b
+Revises: f9e7f1489eba
+Create Date: 2026-10-19 10:03:17.552914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e64138c7f5b'
+down_revision: Union[str, None] = 'f9e7f1489eba'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Found missing by test_query_plans.py: read_mods sorts by created_at and filters by user_id
+    op.create_index('ix_mods_created_at', 'mods', ['created_at'], unique=False)
+    op.create_index('ix_mods_user_id_created_at', 'mods', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mods_user_id_created_at', table_name='mods')
+    op.drop_index('ix_mods_created_at', table_name='mods')
@@ -0,0 +1,41 @@
+"""add_mod_changes_table
+
+Revision ID: b7d41c9e2a58
+Revises: 30e69c2f3246
+Create Date: 2026-10-19 14:21:06.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d41c9e2a58'
+down_revision: Union[str, None] = '30e69c2f3246'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('mod_changes',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('mod_id', sa.Integer(), nullable=False),
+    sa.Column('change_type', sa.String(length=16), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_mod_changes_mod_id'), 'mod_changes', ['mod_id'], unique=False)
+    # Seed the feed with every existing mod so a client starting from cursor 0 gets the full catalog
+    op.execute(
+        "INSERT INTO mod_changes (mod_id, change_type, changed_at) "
+        "SELECT id, 'upsert', COALESCE(updated_at, created_at, CURRENT_TIMESTAMP) FROM mods ORDER BY id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_mod_changes_mod_id'), table_name='mod_changes')
+    op.drop_table('mod_changes')
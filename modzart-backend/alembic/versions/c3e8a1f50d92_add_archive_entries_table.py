@@ -0,0 +1,45 @@
+"""add_archive_entries_table
+
+Revision ID: c3e8a1f50d92
+Revises: b7d41c9e2a58
+Create Date: 2026-10-19 16:02:41.377015
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e8a1f50d92'
+down_revision: Union[str, None] = 'b7d41c9e2a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('archive_entries',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('mod_id', sa.Integer(), nullable=False),
+    sa.Column('object_key', sa.String(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('compressed_size', sa.BigInteger(), nullable=False),
+    sa.Column('crc32', sa.BigInteger(), nullable=True),
+    sa.ForeignKeyConstraint(['mod_id'], ['mods.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archive_entries_mod_id_object_key_path', 'archive_entries', ['mod_id', 'object_key', 'path'], unique=False)
+    op.create_index('ix_archive_entries_name_mod_id', 'archive_entries', ['name', 'mod_id'], unique=False)
+    op.create_index('ix_archive_entries_object_key', 'archive_entries', ['object_key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_archive_entries_object_key', table_name='archive_entries')
+    op.drop_index('ix_archive_entries_name_mod_id', table_name='archive_entries')
+    op.drop_index('ix_archive_entries_mod_id_object_key_path', table_name='archive_entries')
+    op.drop_table('archive_entries')
@@ -0,0 +1,37 @@
+"""add_stored_objects_table
+
+Revision ID: d4a7c9e1f263
+Revises: c3e8a1f50d92
+Create Date: 2026-10-19 17:11:05.604128
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a7c9e1f263'
+down_revision: Union[str, None] = 'c3e8a1f50d92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stored_objects',
+    sa.Column('object_key', sa.String(), nullable=False),
+    sa.Column('access_count', sa.BigInteger(), nullable=False),
+    sa.Column('last_accessed_at', sa.DateTime(), nullable=True),
+    sa.Column('tier', sa.String(length=8), nullable=False),
+    sa.Column('tier_changed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('object_key')
+    )
+    op.create_index('ix_stored_objects_tier_last_accessed_at', 'stored_objects', ['tier', 'last_accessed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stored_objects_tier_last_accessed_at', table_name='stored_objects')
+    op.drop_table('stored_objects')
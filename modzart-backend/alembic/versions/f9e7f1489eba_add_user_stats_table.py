@@ -0,0 +1,41 @@
+"""add_user_stats_table
+
+Revision ID: f9e7f1489eba
+Revises: 927a408dea02
+Create Date: 2026-10-19 09:12:44.318202
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f9e7f1489eba'
+down_revision: Union[str, None] = '927a408dea02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('mod_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('total_downloads', sa.BigInteger(), nullable=False, server_default='0'),
+    sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.func.now()),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Backfill the counters from existing mods
+    op.execute(
+        "INSERT INTO user_stats (user_id, mod_count, total_downloads) "
+        "SELECT user_id, COUNT(*), COALESCE(SUM(downloads), 0) FROM mods "
+        "WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
@@ -0,0 +1,249 @@
+# archive_manifest.py
+"""Upload-time index of the files inside mod archives.
+
+Reads the archive's central directory without extracting anything and stores
+one `archive_entries` row per file (path, sizes, CRC-32). Served by
+GET /mods/{mod_id}/manifest and searchable across all mods by file name
+(GET /mods/manifest/search) to spot mods replacing the same files.
+
+Zip (and OpenIV .oiv) central directories are parsed incrementally, including
+Zip64, and rows are inserted in batches, so memory stays constant however many
+entries an archive has. 7z archives are listed with py7zr when it is installed.
+
+Existing uploads can be indexed with:
+
+    python archive_manifest.py --backfill
+"""
+import os
+import struct
+import logging
+from typing import Iterator, NamedTuple, Optional
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import ArchiveEntry
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 1000
+
+EOCD = struct.Struct("<IHHHHIIH")
+EOCD_SIGNATURE = 0x06054B50
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+ZIP64_LOCATOR_SIGNATURE = 0x07064B50
+ZIP64_EOCD = struct.Struct("<IQHHIIQQQQ")
+ZIP64_EOCD_SIGNATURE = 0x06064B50
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+ZIP64_EXTRA_ID = 0x0001
+MAX_COMMENT = 65535
+
+
+class Entry(NamedTuple):
+    path: str
+    size: int
+    compressed_size: int
+    crc32: Optional[int]
+
+
+def _find_central_directory(f) -> tuple:
+    """Return (offset of the first central directory header, number of entries)."""
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    tail_size = min(file_size, EOCD.size + MAX_COMMENT)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    # The comment may contain the signature itself: prefer the record whose comment reaches exactly to the
+    # end, else the last one that fits (some writers leave trailing bytes after the comment)
+    eocd_signature = struct.pack("<I", EOCD_SIGNATURE)
+    found = None
+    position = tail.rfind(eocd_signature)
+    while position >= 0:
+        if len(tail) - position >= EOCD.size:
+            if position + EOCD.size + EOCD.unpack_from(tail, position)[7] == len(tail):
+                found = position
+                break
+            if found is None:
+                found = position
+        position = tail.rfind(eocd_signature, 0, position)
+    if found is None:
+        raise ValueError("Not a zip archive (no end of central directory record)")
+    position = found
+    eocd_offset = file_size - tail_size + position
+    _, _, _, _, entries, cd_size, cd_offset, _ = EOCD.unpack_from(tail, position)
+
+    locator_offset = eocd_offset - ZIP64_LOCATOR.size
+    if locator_offset >= 0:
+        f.seek(locator_offset)
+        locator = f.read(ZIP64_LOCATOR.size)
+        signature, _, zip64_offset, _ = ZIP64_LOCATOR.unpack(locator)
+        if signature == ZIP64_LOCATOR_SIGNATURE:
+            # The Zip64 record sits right before the locator; trust that over the stored offset
+            zip64_eocd_offset = locator_offset - ZIP64_EOCD.size
+            f.seek(zip64_eocd_offset)
+            record = ZIP64_EOCD.unpack(f.read(ZIP64_EOCD.size))
+            if record[0] != ZIP64_EOCD_SIGNATURE:
+                raise ValueError("Corrupt Zip64 end of central directory record")
+            entries, cd_size = record[7], record[8]
+            return zip64_eocd_offset - cd_size, entries
+    # Measured back from the end, which also works for archives with data prepended (e.g. self-extractors)
+    return eocd_offset - cd_size, entries
+
+
+def iter_zip_entries(path: str) -> Iterator[Entry]:
+    """Yield the files listed in a zip central directory, one header at a time."""
+    with open(path, "rb") as f:
+        cd_start, count = _find_central_directory(f)
+        f.seek(cd_start)
+        for _ in range(count):
+            header = f.read(CENTRAL_HEADER.size)
+            if len(header) < CENTRAL_HEADER.size:
+                raise ValueError("Truncated central directory")
+            (signature, _, _, flags, _, _, _, crc, compressed_size, size,
+             name_length, extra_length, comment_length, _, _, _, _) = CENTRAL_HEADER.unpack(header)
+            if signature != CENTRAL_HEADER_SIGNATURE:
+                raise ValueError("Corrupt central directory header")
+            raw_name = f.read(name_length)
+            extra = f.read(extra_length)
+            f.seek(comment_length, os.SEEK_CUR)
+
+            if size == 0xFFFFFFFF or compressed_size == 0xFFFFFFFF:
+                size, compressed_size = _zip64_sizes(extra, size, compressed_size)
+            # Bit 11: the name is UTF-8; otherwise it is CP437
+            name = raw_name.decode("utf-8" if flags & 0x800 else "cp437", "replace")
+            if name.endswith("/"):
+                continue
+            yield Entry(name, size, compressed_size, crc)
+
+
+def _zip64_sizes(extra: bytes, size: int, compressed_size: int) -> tuple:
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_size = struct.unpack_from("<HH", extra, position)
+        if field_id == ZIP64_EXTRA_ID:
+            data = extra[position + 4:position + 4 + field_size]
+            # Only the fields saturated in the header are present, in this order
+            offset = 0
+            if size == 0xFFFFFFFF:
+                (size,) = struct.unpack_from("<Q", data, offset)
+                offset += 8
+            if compressed_size == 0xFFFFFFFF:
+                (compressed_size,) = struct.unpack_from("<Q", data, offset)
+            break
+        position += 4 + field_size
+    return size, compressed_size
+
+
+def iter_7z_entries(path: str) -> Iterator[Entry]:
+    try:
+        import py7zr
+    except ImportError:
+        logger.warning("py7zr is not installed; 7z archives are not indexed.")
+        return
+    with py7zr.SevenZipFile(path, mode="r") as archive:
+        for info in archive.list():
+            if not info.is_directory:
+                yield Entry(info.filename, info.uncompressed or 0, info.compressed or 0, info.crc32)
+
+
+def iter_entries(path: str) -> Iterator[Entry]:
+    """Entries of a zip or 7z archive; nothing for other files (e.g. a single .asi)."""
+    with open(path, "rb") as f:
+        header = f.read(6)
+    if header.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return iter_zip_entries(path)
+    if header == b"7z\xbc\xaf\x27\x1c":
+        return iter_7z_entries(path)
+    return iter(())
+
+
+def index_archive(db: Session, file_path: str, mod_id: int, object_key: str) -> int:
+    """Replace the stored manifest of `object_key` with the entries of `file_path`.
+
+    Runs in a savepoint and does not commit; a broken archive leaves the upload
+    without a manifest instead of failing it. Returns the number of entries indexed.
+    Blocking.
+    """
+    count = 0
+    try:
+        with db.begin_nested():
+            db.execute(delete(ArchiveEntry).where(ArchiveEntry.object_key == object_key))
+            batch = []
+            for entry in iter_entries(file_path):
+                batch.append({
+                    "mod_id": mod_id,
+                    "object_key": object_key,
+                    "path": entry.path,
+                    "name": entry.path.rsplit("/", 1)[-1].rsplit("\\", 1)[-1].lower(),
+                    "size": entry.size,
+                    "compressed_size": entry.compressed_size,
+                    "crc32": entry.crc32,
+                })
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    db.execute(insert(ArchiveEntry), batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                db.execute(insert(ArchiveEntry), batch)
+                count += len(batch)
+    except Exception as e:
+        logger.error(f"Failed to index archive {object_key} (mod_id: {mod_id}): {e}", exc_info=True)
+        return 0
+    logger.info(f"Indexed {count} archive entries for {object_key} (mod_id: {mod_id}).")
+    return count
+
+
+def backfill(db: Session) -> int:
+    """Index stored mod files that have no manifest yet. Returns the number of files indexed."""
+    import tempfile
+    from sqlalchemy import select, exists
+    from models import Mod
+    from storage import backend
+
+    missing = db.execute(
+        select(Mod.id, Mod.filename)
+        .where(Mod.filename.is_not(None), ~Mod.filename.in_(("PENDING_UPLOAD", "NO_FILE")), ~Mod.filename.startswith("project:"))
+        .where(~exists().where(ArchiveEntry.object_key == Mod.filename))
+        .order_by(Mod.id)
+    ).all()
+    indexed = 0
+    for mod_id, object_key in missing:
+        with tempfile.TemporaryDirectory(dir=settings.TEMP_UPLOAD_DIR) as tmp_dir:
+            if settings.STORAGE_MODE == "local":
+                file_path = backend.path_for(object_key)
+            else:
+                file_path = os.path.join(tmp_dir, "archive")
+                try:
+                    backend.fetch(object_key, file_path)
+                except FileNotFoundError:
+                    logger.warning(f"Stored file {object_key} of mod {mod_id} is missing; skipped.")
+                    continue
+            if not os.path.exists(file_path):
+                logger.warning(f"Stored file {object_key} of mod {mod_id} is missing; skipped.")
+                continue
+            if index_archive(db, file_path, mod_id, object_key):
+                indexed += 1
+            db.commit()
+    return indexed
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from db_config import SessionLocal
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Archive manifest maintenance.")
+    parser.add_argument("--backfill", action="store_true", help="Index stored mod files without a manifest")
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    if args.backfill:
+        db = SessionLocal()
+        try:
+            print(f"Indexed {backfill(db)} archive(s).")
+        finally:
+            db.close()
+    else:
+        parser.print_help()
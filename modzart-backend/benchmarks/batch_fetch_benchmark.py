@@ -0,0 +1,63 @@
+"""Compare 50 single mod/user fetches against one batch fetch on a running server.
+
+Usage: python benchmarks/batch_fetch_benchmark.py [--base-url http://localhost:8000] [--count 50] [--rounds 10]
+
+Needs a server with at least --count mods (e.g. seeded with test_endpoints.py).
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+
+def time_singles(session: requests.Session, base_url: str, path: str, ids: list) -> float:
+    started = time.perf_counter()
+    for item_id in ids:
+        session.get(f"{base_url}/{path}/{item_id}").raise_for_status()
+    return time.perf_counter() - started
+
+
+def time_batch(session: requests.Session, base_url: str, path: str, ids: list) -> float:
+    started = time.perf_counter()
+    response = session.get(f"{base_url}/{path}/batch", params={"ids": ",".join(map(str, ids))})
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def report(label: str, singles: list, batches: list):
+    single_ms = statistics.median(singles) * 1000
+    batch_ms = statistics.median(batches) * 1000
+    print(f"{label:<6} singles: {single_ms:8.1f} ms  batch: {batch_ms:8.1f} ms  ({single_ms / batch_ms:.1f}x faster)")
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    session = requests.Session()
+    mods = session.get(f"{args.base_url}/mods/", params={"limit": args.count}).json()
+    if len(mods) < args.count:
+        print(f"Only {len(mods)} mods available; seed at least {args.count} first.")
+        return
+    mod_ids = [mod["id"] for mod in mods]
+    user_ids = list(dict.fromkeys(mod["user_id"] for mod in mods))
+
+    print(f"Fetching {len(mod_ids)} mods and {len(user_ids)} users, median of {args.rounds} rounds:")
+    report(
+        "mods",
+        [time_singles(session, args.base_url, "mods", mod_ids) for _ in range(args.rounds)],
+        [time_batch(session, args.base_url, "mods", mod_ids) for _ in range(args.rounds)],
+    )
+    report(
+        "users",
+        [time_singles(session, args.base_url, "users", user_ids) for _ in range(args.rounds)],
+        [time_batch(session, args.base_url, "users", user_ids) for _ in range(args.rounds)],
+    )
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,99 @@
+"""Compare bulk_import.import_mods against one ORM insert and commit per mod.
+
+Usage: python benchmarks/bulk_import_benchmark.py [--rows 20000] [--users 100] [--database-url URL]
+
+Defaults to a temporary SQLite database. Pass --database-url with an empty
+PostgreSQL database to measure the COPY path.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from db_config import Base  # noqa: E402
+from models import Mod, User  # noqa: E402
+from bulk_import import import_mods  # noqa: E402
+
+
+def synthetic_rows(rows: int, users: int) -> str:
+    rng = random.Random(42)
+    return "".join(
+        json.dumps({
+            "title": f"Imported mod {i}",
+            "uploader": f"importer{rng.randint(1, users)}",
+            "description": "Synthetic import",
+            "downloads": rng.randint(0, 1000),
+        }) + "\n"
+        for i in range(rows)
+    )
+
+
+def time_per_row(session, payload: str) -> float:
+    usernames = dict(session.query(User.username, User.id).all())
+    started = time.perf_counter()
+    for line in payload.splitlines():
+        record = json.loads(line)
+        session.add(Mod(
+            title=record["title"],
+            description=record["description"],
+            filename="PENDING_UPLOAD",
+            downloads=record["downloads"],
+            user_id=usernames[record["uploader"]],
+        ))
+        session.commit()
+    return time.perf_counter() - started
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bulk_import_bench_")
+    url = args.database_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    engine = create_engine(url)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    payload = synthetic_rows(args.rows, args.users)
+
+    results = {}
+    for label in ("per-row ORM", "bulk import"):
+        Base.metadata.drop_all(engine)
+        Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(User), [
+                {"username": f"importer{i}", "email": f"importer{i}@example.com", "password": "x"}
+                for i in range(1, args.users + 1)
+            ])
+        session = Session()
+        try:
+            if label == "bulk import":
+                report = import_mods(session, io.StringIO(payload), "ndjson")
+                assert report["failed"] == 0, report["errors"][:5]
+                results[label] = report["seconds"]
+            else:
+                results[label] = time_per_row(session, payload)
+        finally:
+            session.close()
+
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+    print(f"Importing {args.rows} mods into {engine.dialect.name}:")
+    for label, seconds in results.items():
+        print(f"{label:<12} {seconds:8.2f} s  {args.rows / seconds:10.0f} rows/s")
+    print(f"Bulk import is {results['per-row ORM'] / results['bulk import']:.1f}x faster")
+
+
+if __name__ == "__main__":
+    run_benchmark()
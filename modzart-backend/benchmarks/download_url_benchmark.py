@@ -0,0 +1,78 @@
+"""Measure download-URL generation throughput with and without caching.
+
+Usage: python benchmarks/download_url_benchmark.py [--objects 1000] [--calls 50000]
+
+Runs generate-download-URL calls for a popular-skewed mix of objects against
+the local backend (stat cache) and the S3 backend (presigned URL cache). Presigning
+happens offline, so no S3 server is needed. Run it from the modzart-backend directory.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+from config import settings  # noqa: E402
+from storage_backends import LocalStorageBackend, S3StorageBackend  # noqa: E402
+from ttl_cache import TTLCache  # noqa: E402
+
+
+def object_keys(count: int) -> list:
+    return [f"mods/{i}/mod_{i}.zip" for i in range(count)]
+
+
+def workload(keys: list, calls: int) -> list:
+    # Downloads follow a long tail: a few mods get most of the traffic
+    rng = random.Random(42)
+    return [keys[min(int(rng.paretovariate(1.2)) - 1, len(keys) - 1)] for _ in range(calls)]
+
+
+def calls_per_second(backend, requests_: list) -> float:
+    started = time.perf_counter()
+    for key in requests_:
+        backend.download_url(key, 3600)
+    return len(requests_) / (time.perf_counter() - started)
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=1000)
+    parser.add_argument("--calls", type=int, default=50000)
+    args = parser.parse_args()
+
+    keys = object_keys(args.objects)
+    requests_ = workload(keys, args.calls)
+
+    root = tempfile.mkdtemp(prefix="modzart_bench_")
+    settings.LOCAL_STORAGE_PATH = root
+    try:
+        for key in keys:
+            path = os.path.join(root, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+
+        local = LocalStorageBackend()
+        cached = calls_per_second(local, requests_)
+        local._exists_cache = TTLCache(0, 0)
+        uncached = calls_per_second(local, requests_)
+        print(f"Local  (os.path.exists): {uncached:>10,.0f} calls/s -> {cached:>10,.0f} calls/s with stat cache "
+              f"({cached / uncached:.1f}x)")
+    finally:
+        shutil.rmtree(root)
+
+    s3 = S3StorageBackend()
+    cached = calls_per_second(s3, requests_)
+    s3._url_cache = TTLCache(0, 0)
+    uncached = calls_per_second(s3, requests_)
+    print(f"S3     (presigned URL):  {uncached:>10,.0f} calls/s -> {cached:>10,.0f} calls/s with URL cache "
+          f"({cached / uncached:.1f}x)")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,91 @@
+"""Measure image variant rendering throughput: images/sec overall and per core.
+
+Usage: python benchmarks/image_variants_benchmark.py [--images 24] [--processes 1,2,4] [--width 640]
+
+Renders synthetic screenshots (4000x3000 JPEG photos and 2560x1440 PNGs) to
+every configured format at --width through render_variant in a spawn process
+pool, as the variant route does on a first request, and reports the variant
+size next to the original's, i.e. the bandwidth a client saves per image.
+Requires Pillow.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings  # noqa: E402
+from image_variants import render_variant, variant_formats  # noqa: E402
+
+
+def make_images(tmp_dir: str, count: int) -> list:
+    from PIL import Image
+
+    paths = []
+    for index in range(count):
+        if index % 2:
+            size, name = (2560, 1440), f"screenshot-{index}.png"
+        else:
+            size, name = (4000, 3000), f"photo-{index}.jpg"
+        # Noise over gradients compresses like a real screenshot rather than a flat fill
+        noise = Image.effect_noise(size, 32)
+        gradient = Image.linear_gradient("L").resize(size)
+        rings = Image.radial_gradient("L").resize(size)
+        img = Image.merge("RGB", (noise, gradient, rings))
+        path = os.path.join(tmp_dir, name)
+        img.save(path, quality=92) if name.endswith(".jpg") else img.save(path)
+        paths.append(path)
+    return paths
+
+
+def quality_for(variant_format: str) -> int:
+    return settings.IMAGE_WEBP_QUALITY if variant_format == "webp" else settings.IMAGE_JPEG_QUALITY
+
+
+def run_case(paths: list, out_dir: str, processes: int, width: int, variant_format: str) -> tuple:
+    """(seconds, total output bytes) to render every image once."""
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Start the processes and import Pillow before timing, as a warm worker would have
+        list(pool.map(render_variant, paths[:processes], [os.path.join(out_dir, "warm")] * processes,
+                      [64] * processes, [variant_format] * processes, [quality_for(variant_format)] * processes))
+        dests = [os.path.join(out_dir, f"{index}.{variant_format}") for index in range(len(paths))]
+        started = time.perf_counter()
+        futures = [
+            pool.submit(render_variant, path, dest, width, variant_format, quality_for(variant_format))
+            for path, dest in zip(paths, dests)
+        ]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+    return elapsed, sum(os.path.getsize(dest) for dest in dests)
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--processes", default=f"1,{os.cpu_count()}", help="Comma-separated pool sizes")
+    parser.add_argument("--width", type=int, default=640)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_dir = os.path.join(tmp_dir, "out")
+        os.makedirs(out_dir)
+        paths = make_images(tmp_dir, args.images)
+        source_bytes = sum(os.path.getsize(path) for path in paths)
+        print(f"{args.images} images, {source_bytes / args.images / 1024:.0f} KB on average, rendered at {args.width}px:")
+        for variant_format in variant_formats():
+            for processes in sorted({int(value) for value in args.processes.split(",") if value.strip()}):
+                elapsed, output_bytes = run_case(paths, out_dir, processes, args.width, variant_format)
+                rate = args.images / elapsed
+                print(f"  {variant_format:<5} {processes:>3} process(es): {rate:7.1f} images/s, "
+                      f"{rate / processes:6.1f} images/s per core, "
+                      f"{output_bytes / args.images / 1024:6.1f} KB per variant "
+                      f"({output_bytes / source_bytes:.1%} of the originals)")
+
+
+if __name__ == "__main__":
+    run_benchmark()
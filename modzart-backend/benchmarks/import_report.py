@@ -0,0 +1,102 @@
+"""Report API import time and memory, failing when they regress past a budget.
+
+Usage: python benchmarks/import_report.py [--max-ms 1500] [--max-rss-mb 120] [--top 15]
+
+Imports `main` in a fresh interpreter with `python -X importtime`, prints the
+slowest modules by cumulative import time and the resulting peak RSS, and exits
+non-zero if a budget is exceeded or if a lazily-loaded dependency (boto3,
+botocore, requests) was imported while STORAGE_MODE is local. Run it from the
+modzart-backend directory.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported at startup in local mode
+LAZY_MODULES = ("boto3", "botocore", "requests")
+
+RSS_SNIPPET = (
+    "import resource, sys, main; "
+    "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; "
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    "print(rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024)"
+)
+
+
+def parse_importtime(stderr: str) -> list:
+    """Parse `-X importtime` output into (module, self_us, cumulative_us) tuples."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((module.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_depth(module: str) -> int:
+    """Nesting depth of a parsed module column: one separator space, then two per level."""
+    return (len(module) - len(module.lstrip(" ")) - 1) // 2
+
+
+def total_import_ms(rows: list) -> float:
+    """Time to import everything, the sum of the top-level rows' cumulative times."""
+    return sum(cumulative for module, _, cumulative in rows if import_depth(module) == 0) / 1000
+
+
+def measure_imports(env: dict) -> list:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def measure_rss_mb(env: dict) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", RSS_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def run_report():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-ms", type=float, default=1500.0, help="Budget for total import time of main")
+    parser.add_argument("--max-rss-mb", type=float, default=120.0, help="Budget for peak RSS after import")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    rows = measure_imports(env)
+    total_ms = total_import_ms(rows)
+    rss_mb = measure_rss_mb(env)
+
+    print(f"Slowest {args.top} imports by cumulative time:")
+    for module, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  (self {self_us / 1000:6.1f} ms)  {module.strip()}")
+    print(f"\nTotal import time: {total_ms:.0f} ms (budget {args.max_ms:.0f} ms)")
+    print(f"Peak RSS after import: {rss_mb:.1f} MB (budget {args.max_rss_mb:.0f} MB)")
+
+    failures = []
+    if total_ms > args.max_ms:
+        failures.append(f"import time {total_ms:.0f} ms exceeds {args.max_ms:.0f} ms")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB exceeds {args.max_rss_mb:.0f} MB")
+    if env.get("STORAGE_MODE", "local") == "local":
+        imported = {module.strip().split(".")[0] for module, _, _ in rows}
+        for module in LAZY_MODULES:
+            if module in imported:
+                failures.append(f"'{module}' was imported at startup in local mode")
+
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    run_report()
@@ -0,0 +1,110 @@
+"""Measure what INFO logging on the hot paths costs the event loop, with and without the queue pipeline.
+
+Usage: python benchmarks/logging_benchmark.py [--requests 20000] [--concurrency 100] [--sink-delay-ms 0.05]
+
+Simulates request handlers that each log like a download: one access line and two
+storage/router INFO lines. The sink sleeps --sink-delay-ms per write to stand in
+for a terminal or log shipper that cannot keep up with stdout.
+"""
+import argparse
+import asyncio
+import logging
+import logging.config
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings  # noqa: E402
+import log_pipeline  # noqa: E402
+
+
+class SlowStream:
+    """File-like sink that takes a fixed time per write."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, data: str) -> int:
+        self.writes += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def configure(sink: SlowStream, log_format: str):
+    text = {"format": "%(levelname)s %(asctime)s [%(name)s] %(message)s"}
+    formatter = {"()": "log_pipeline.JsonFormatter"} if log_format == "json" else text
+    logging.config.dictConfig({
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {"bench": formatter},
+        "handlers": {"sink": {"class": "logging.StreamHandler", "formatter": "bench", "stream": sink}},
+        "loggers": {
+            name: {"handlers": ["sink"], "level": "INFO", "propagate": False}
+            for name in ("uvicorn.access", "storage", "routers")
+        },
+    })
+
+
+async def handle_request(request_id: int):
+    access = logging.getLogger("uvicorn.access")
+    storage = logging.getLogger("storage")
+    routers = logging.getLogger("routers.mods")
+    routers.info(f"Generated download URL for mod {request_id}.")
+    await asyncio.sleep(0)
+    storage.info(f"Temporarily saved uploaded file to: temp_uploads/{request_id}_mod.zip")
+    access.info('%s - "%s %s HTTP/%s" %d', "127.0.0.1:50000", "GET", f"/mods/{request_id}/download", "1.1", 200)
+
+
+async def run_load(requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(request_id: int):
+        async with semaphore:
+            await handle_request(request_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - started
+
+
+def run_case(label: str, args, log_format: str, queued: bool, sample_rates: str = ""):
+    sink = SlowStream(args.sink_delay_ms / 1000)
+    configure(sink, log_format)
+    if queued:
+        settings.LOG_SAMPLE_RATES = sample_rates
+        log_pipeline.start_queue_logging(max_queue=args.requests * 3)
+    elapsed = asyncio.run(run_load(args.requests, args.concurrency))
+    if queued:
+        drain_started = time.perf_counter()
+        log_pipeline.stop_queue_logging()
+        drain = time.perf_counter() - drain_started
+    else:
+        drain = 0.0
+    print(f"{label:<30} {args.requests / elapsed:10.0f} req/s on the loop   "
+          f"{sink.writes:7d} lines written   {drain:6.2f} s to drain the queue")
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--sink-delay-ms", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"{args.requests} simulated requests, 3 INFO lines each, sink delay {args.sink_delay_ms} ms/line:")
+    run_case("sync StreamHandler (text)", args, "text", queued=False)
+    run_case("sync StreamHandler (json)", args, "json", queued=False)
+    run_case("queue (json)", args, "json", queued=True)
+    run_case("queue (json) + 10% sampling", args, "json", queued=True,
+             sample_rates="uvicorn.access=0.1,storage=0.1,routers=0.1")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,95 @@
+"""Compare default boto3 uploads with the tuned S3 backend against a local S3 stand-in.
+
+Usage:
+    # Start an S3-compatible server first, e.g. `moto_server -p 5000` or MinIO
+    S3_ENDPOINT_URL=http://127.0.0.1:5000 AWS_ACCESS_KEY_ID=test AWS_SECRET_ACCESS_KEY=test \
+        python benchmarks/s3_transfer_benchmark.py [--size-mb 256] [--files 4]
+
+Uploads --files files of --size-mb each, first one at a time with boto3's default
+client and TransferConfig, then concurrently through the storage I/O pool with
+the configured TransferConfig and connection pool. Run it from the
+modzart-backend directory.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORAGE_MODE"] = "s3"
+
+import boto3  # noqa: E402
+
+from config import settings  # noqa: E402
+import storage  # noqa: E402
+
+
+def make_test_file(size_mb: int) -> str:
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    return path
+
+
+def ensure_bucket(client):
+    try:
+        client.head_bucket(Bucket=settings.S3_BUCKET_NAME)
+    except Exception:
+        client.create_bucket(Bucket=settings.S3_BUCKET_NAME)
+
+
+def upload_default(paths: list) -> float:
+    """Sequential uploads with an untuned client, as the old code path did."""
+    client = boto3.client("s3", region_name=settings.S3_REGION, endpoint_url=settings.S3_ENDPOINT_URL)
+    ensure_bucket(client)
+    started = time.perf_counter()
+    for i, path in enumerate(paths):
+        client.upload_file(path, settings.S3_BUCKET_NAME, f"benchmark/default/{i}.bin")
+    return time.perf_counter() - started
+
+
+async def upload_tuned(paths: list) -> float:
+    """Concurrent uploads through the storage I/O pool with the tuned backend."""
+    ensure_bucket(storage.backend.client)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        storage.run_in_io_pool(storage.upload_file_to_storage, path, f"benchmark/tuned/{i}.bin")
+        for i, path in enumerate(paths)
+    ))
+    return time.perf_counter() - started
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--files", type=int, default=4)
+    args = parser.parse_args()
+
+    if not settings.S3_ENDPOINT_URL:
+        print("Set S3_ENDPOINT_URL to a local S3-compatible server (moto_server, MinIO) first.")
+        sys.exit(1)
+
+    print(f"Creating {args.files} test file(s) of {args.size_mb} MB...")
+    paths = [make_test_file(args.size_mb) for _ in range(args.files)]
+    total_mb = args.size_mb * args.files
+    try:
+        default_seconds = upload_default(paths)
+        print(f"Default client, sequential: {default_seconds:.2f}s ({total_mb / default_seconds:.1f} MB/s)")
+
+        tuned_seconds = asyncio.run(upload_tuned(paths))
+        print(
+            f"Tuned client, I/O pool:     {tuned_seconds:.2f}s ({total_mb / tuned_seconds:.1f} MB/s) "
+            f"[part {settings.S3_MULTIPART_CHUNKSIZE_MB} MB, concurrency {settings.S3_MAX_CONCURRENCY}, "
+            f"pool {settings.S3_MAX_POOL_CONNECTIONS}, threads {settings.STORAGE_IO_THREADS}]"
+        )
+        print(f"Speedup: {default_seconds / tuned_seconds:.2f}x")
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,65 @@
+"""Measure how long the API takes to start accepting requests.
+
+Usage: python benchmarks/startup_benchmark.py [--runs 5] [--dev]
+
+By default this starts the production launcher (serve.py); --dev starts a single
+uvicorn process for comparison. Run it from the modzart-backend directory.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 8765
+READY_URL = f"http://127.0.0.1:{PORT}/openapi.json"
+
+
+def start_server(dev: bool) -> subprocess.Popen:
+    """Start the server in a subprocess."""
+    env = dict(os.environ, PORT=str(PORT), HOST="127.0.0.1")
+    if dev:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "serve.py"]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def time_to_ready(dev: bool, timeout: float = 60.0) -> float:
+    """Seconds from process start until the first successful response."""
+    started = time.perf_counter()
+    process = start_server(dev)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if requests.get(READY_URL, timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError("Server did not become ready in time")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--dev", action="store_true", help="Benchmark a single uvicorn process instead")
+    args = parser.parse_args()
+
+    label = "uvicorn (single process)" if args.dev else "serve.py"
+    print(f"Measuring startup time of {label} over {args.runs} run(s)...")
+    timings = [time_to_ready(args.dev) for _ in range(args.runs)]
+    for i, timing in enumerate(timings, 1):
+        print(f"  Run {i}: {timing * 1000:.0f} ms")
+    print(f"Min: {min(timings) * 1000:.0f} ms, Median: {statistics.median(timings) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    run_benchmark()
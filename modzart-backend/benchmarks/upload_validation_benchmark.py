@@ -0,0 +1,139 @@
+"""Measure the I/O saved by rejecting bad uploads before the temp copy, scan and storage.
+
+Usage: python benchmarks/upload_validation_benchmark.py [--size-mb 512]
+
+For each bad upload (disallowed type, zip bomb) this compares the old path (copy
+the whole spooled file into TEMP_UPLOAD_DIR before anything can reject it) with
+validate_file on the spooled file, and reports bytes written and time. Then it
+feeds oversized and disallowed-type bodies through UploadLimitMiddleware and
+reports how much of each was received before the 413 or 415. Zip bombs are
+only caught after spooling, by validate_file: the central directory is at the
+end of the archive.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException  # noqa: E402
+
+from upload_validation import UploadLimitMiddleware, validate_file, MB  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def make_files(tmp_dir: str, size_mb: int) -> dict:
+    files = {}
+    disallowed = os.path.join(tmp_dir, "payload.zip")
+    with open(disallowed, "wb") as f:
+        # An executable script renamed to .zip
+        f.write(b"#!/bin/sh\n")
+        for _ in range(size_mb):
+            f.write(os.urandom(MB))
+    files["disallowed type"] = disallowed
+
+    bomb = os.path.join(tmp_dir, "bomb.zip")
+    with zipfile.ZipFile(bomb, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("zeros.bin", "w", force_zip64=True) as entry:
+            zeros = bytes(MB)
+            for _ in range(size_mb * 4):
+                entry.write(zeros)
+    files["zip bomb"] = bomb
+    return files
+
+
+def old_path(path: str, temp_dir: str) -> tuple:
+    """Copy the upload to the temp dir, as save_upload_file_temp did before validation existed."""
+    started = time.perf_counter()
+    dest = os.path.join(temp_dir, os.path.basename(path))
+    shutil.copyfile(path, dest)
+    written = os.path.getsize(dest)
+    os.remove(dest)
+    return time.perf_counter() - started, written
+
+
+def new_path(path: str) -> tuple:
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        try:
+            validate_file(f, os.path.basename(path))
+            outcome = "accepted"
+        except HTTPException as e:
+            outcome = f"{e.status_code}"
+    return time.perf_counter() - started, outcome
+
+
+async def body_received_before_reject(total_bytes: int, limit_mb: float, declare_length: bool,
+                                      prefix: bytes = b"", headers: list = ()) -> int:
+    """Feed a request body through UploadLimitMiddleware; return how many bytes were consumed."""
+    consumed = 0
+
+    async def app(scope, receive, send):
+        # Stands in for the multipart parser: read the whole body
+        while True:
+            message = await receive()
+            if not message.get("more_body"):
+                break
+
+    async def receive():
+        nonlocal consumed
+        chunk = min(CHUNK, total_bytes - consumed)
+        body = (prefix + b"\0" * chunk)[:chunk] if consumed == 0 else b"\0" * chunk
+        consumed += chunk
+        return {"type": "http.request", "body": body, "more_body": consumed < total_bytes}
+
+    async def send(message):
+        pass
+
+    headers = list(headers) + ([(b"content-length", str(total_bytes).encode())] if declare_length else [])
+    scope = {"type": "http", "method": "POST", "path": "/mods/", "headers": headers}
+    middleware = UploadLimitMiddleware(app, limits=f"/mods/={limit_mb}")
+    await middleware(scope, receive, send)
+    return consumed
+
+
+def run_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=512)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="upload_validation_bench_")
+    temp_uploads = os.path.join(tmp_dir, "temp_uploads")
+    os.makedirs(temp_uploads)
+    try:
+        files = make_files(tmp_dir, args.size_mb)
+        print(f"{'upload':<18} {'size':>10} {'old: copy to temp':>20} {'new: validate':>16}  result")
+        for label, path in files.items():
+            old_seconds, written = old_path(path, temp_uploads)
+            new_seconds, outcome = new_path(path)
+            print(f"{label:<18} {os.path.getsize(path) / MB:8.1f}MB {old_seconds:9.3f}s {written / MB:7.1f}MB "
+                  f"{new_seconds:15.4f}s  {outcome}")
+
+        total = args.size_mb * MB
+        limit_mb = args.size_mb / 8
+        for declare_length in (True, False):
+            consumed = asyncio.run(body_received_before_reject(total, limit_mb, declare_length))
+            how = "Content-Length" if declare_length else "chunked body"
+            print(f"oversized ({how:<14}) body {args.size_mb} MB, limit {limit_mb:.0f} MB: "
+                  f"read {consumed / MB:.1f} MB before the 413 (was {args.size_mb} MB)")
+
+        # A browser-style multipart body whose file part is a shell script named .zip
+        boundary = b"----benchmark"
+        prefix = (b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="payload.zip"\r\n'
+                  b"Content-Type: application/zip\r\n\r\n#!/bin/sh\n")
+        content_type = [(b"content-type", b"multipart/form-data; boundary=" + boundary)]
+        consumed = asyncio.run(body_received_before_reject(total, args.size_mb * 2, True, prefix, content_type))
+        print(f"disallowed type (multipart body) {args.size_mb} MB: "
+              f"read {consumed / 1024:.0f} KB before the 415 (was {args.size_mb} MB)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,265 @@
+# bulk_import.py
+"""Bulk ingestion of mod metadata from NDJSON or CSV.
+
+Rows are validated as they are read and loaded in batches: PostgreSQL uses
+COPY, other databases a batched executemany INSERT. Uploader usernames are
+resolved to ids with one query per batch, and invalid rows are reported by line
+number without stopping the import. Imported mods are added to the change feed.
+
+CLI:
+    python bulk_import.py mods.ndjson [--format csv] [--dry-run]
+
+Each record needs `title` and `uploader` (a username); `description`, `url`
+(stored like project URLs), `filename`, `downloads`, `created_at` and
+`visibility` are optional. `filename` is an object key in storage that the mod
+owns: deleting the mod deletes it, so keys under an uploaded mod's
+`mods/{id}/` or `versions/{id}/` prefix are refused. Mods with neither `url`
+nor `filename` are stored with the NO_FILE placeholder.
+"""
+import io
+import csv
+import json
+import time
+import logging
+import posixpath
+from datetime import datetime
+from collections import Counter
+from typing import Iterator, Optional, TextIO
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Mod, User
+from user_stats import increment_user_stats
+from change_feed import record_inserted_mods
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("ndjson", "csv")
+
+# The filename of imported mods without a file; unlike create_mod's PENDING_UPLOAD it never gets one
+NO_FILE = "NO_FILE"
+
+COPY_COLUMNS = [
+    "title", "description", "filename", "downloads", "created_at",
+    "updated_at", "project_visibility", "user_id",
+]
+
+
+class ModImportRow(BaseModel):
+    title: str = Field(min_length=1)
+    uploader: str = Field(min_length=1)
+    description: str = ""
+    url: Optional[str] = None
+    filename: Optional[str] = None
+    downloads: int = Field(default=0, ge=0)
+    created_at: Optional[datetime] = None
+    visibility: str = "public"
+
+    @field_validator("downloads", mode="before")
+    @classmethod
+    def empty_downloads(cls, value):
+        # CSV cells are strings; an empty cell means the default
+        return 0 if value in ("", None) else value
+
+    @field_validator("created_at", "url", "filename", mode="before")
+    @classmethod
+    def empty_to_none(cls, value):
+        return None if value == "" else value
+
+    @field_validator("filename")
+    @classmethod
+    def owned_object_key(cls, value):
+        if value is None:
+            return value
+        parts = value.split("/")
+        if value.startswith("/") or "\\" in value or posixpath.normpath(value) != value or {".", ".."} & set(parts):
+            raise ValueError("must be a relative, normalised object key")
+        if len(parts) > 2 and parts[0] in ("mods", "versions") and parts[1].isdigit():
+            raise ValueError(f"must not be under another mod's {parts[0]}/{parts[1]}/ prefix")
+        if value in ("PENDING_UPLOAD", NO_FILE) or value.startswith("project:"):
+            raise ValueError("must not be a placeholder")
+        return value
+
+
+def detect_format(filename: str) -> str:
+    return "csv" if filename and filename.lower().endswith(".csv") else "ndjson"
+
+
+def iter_records(stream: TextIO, import_format: str) -> Iterator[tuple]:
+    """Yield (line_number, record or error message) without reading the whole input."""
+    if import_format == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, "Each line must be a JSON object"
+            continue
+        yield line_number, record
+
+
+class ImportReport:
+    def __init__(self, max_errors: int):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.started = time.perf_counter()
+
+    def error(self, line_number: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_number, "error": message})
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        processed = self.imported + self.failed
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(processed / elapsed, 1) if elapsed else None,
+        }
+
+
+def _copy_rows(db: Session, rows: list) -> None:
+    """Load rows with PostgreSQL COPY inside the session's transaction."""
+    buffer = io.StringIO()
+    # Quoting every string keeps empty descriptions as '' instead of NULL
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+    for row in rows:
+        writer.writerow([
+            row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+            for column in COPY_COLUMNS
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY mods ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def _load_batch(db: Session, batch: list, report: ImportReport, user_ids: dict, dry_run: bool) -> None:
+    """Resolve uploaders for a batch of validated rows and insert the valid ones."""
+    unknown = {row.uploader for _, row in batch} - user_ids.keys()
+    if unknown:
+        for user_id, username in db.query(User.id, User.username).filter(User.username.in_(unknown)).all():
+            user_ids[username] = user_id
+
+    now = datetime.utcnow()
+    rows = []
+    row_lines = []
+    for line_number, row in batch:
+        user_id = user_ids.get(row.uploader)
+        if user_id is None:
+            report.error(line_number, f"Unknown uploader '{row.uploader}'")
+            continue
+        created_at = row.created_at or now
+        rows.append({
+            "title": row.title,
+            "description": row.description,
+            "filename": row.filename or (f"project:{row.url}" if row.url else NO_FILE),
+            "downloads": row.downloads,
+            "created_at": created_at,
+            "updated_at": created_at,
+            "project_visibility": row.visibility,
+            "user_id": user_id,
+        })
+        row_lines.append(line_number)
+    if not rows:
+        return
+    if dry_run:
+        report.imported += len(rows)
+        return
+
+    try:
+        # Neither COPY nor executemany returns ids; the change feed picks up everything above this
+        last_id = db.query(func.max(Mod.id)).scalar() or 0
+        if db.get_bind().dialect.name == "postgresql":
+            _copy_rows(db, rows)
+        else:
+            db.execute(insert(Mod.__table__), rows)
+        record_inserted_mods(db, last_id)
+        per_user = Counter()
+        downloads = Counter()
+        for row in rows:
+            per_user[row["user_id"]] += 1
+            downloads[row["user_id"]] += row["downloads"]
+        for user_id, count in per_user.items():
+            increment_user_stats(db, user_id, mods=count, downloads=downloads[user_id])
+        db.commit()
+        report.imported += len(rows)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Bulk import batch failed: {e}", exc_info=True)
+        for line_number in row_lines:
+            report.error(line_number, f"Batch failed: {e}")
+
+
+def import_mods(db: Session, stream: TextIO, import_format: str, dry_run: bool = False,
+                batch_size: int = settings.BULK_IMPORT_BATCH_SIZE) -> dict:
+    """Import mods from a text stream. Commits once per batch. Returns a report dict."""
+    if import_format not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format '{import_format}'. Use one of: {', '.join(IMPORT_FORMATS)}")
+    report = ImportReport(settings.BULK_IMPORT_MAX_REPORTED_ERRORS)
+    user_ids = {}
+    batch = []
+    for line_number, record in iter_records(stream, import_format):
+        if isinstance(record, str):
+            report.error(line_number, record)
+            continue
+        try:
+            batch.append((line_number, ModImportRow.model_validate(record)))
+        except ValidationError as e:
+            report.error(line_number, "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            ))
+            continue
+        if len(batch) >= batch_size:
+            _load_batch(db, batch, report, user_ids, dry_run)
+            batch = []
+    if batch:
+        _load_batch(db, batch, report, user_ids, dry_run)
+
+    result = report.as_dict()
+    logger.info(
+        f"Bulk import {'validated' if dry_run else 'finished'}: {result['imported']} imported, "
+        f"{result['failed']} failed, {result['rows_per_second']} rows/s"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from db_config import SessionLocal
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Bulk import mod metadata from NDJSON or CSV.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Defaults to the file extension")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and resolve uploaders without inserting")
+    parser.add_argument("--batch-size", type=int, default=settings.BULK_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    db = SessionLocal()
+    try:
+        with open(args.path, encoding="utf-8", newline="") as f:
+            report = import_mods(db, f, args.format or detect_format(args.path), args.dry_run, args.batch_size)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
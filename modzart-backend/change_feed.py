@@ -0,0 +1,128 @@
+# change_feed.py
+"""Incremental change feed for catalog sync clients (GET /mods/changes).
+
+Every mod create, update and delete appends a row to `mod_changes` in the same
+transaction as the change itself; deletes leave a tombstone there because the
+mod row is gone. The row id is the cursor: a client stores the `next_cursor` of
+the last page and asks for changes after it.
+
+Ids are taken at insert time, so a transaction that commits late can expose an
+id lower than one already served. Changes younger than
+CHANGE_FEED_SETTLE_SECONDS are held back to leave time for such commits. The
+feed is read from the primary: a replica's lag would add to the window.
+Download counters are not part of the feed.
+
+The log only needs the latest change per mod, so it can be compacted:
+
+    python change_feed.py --compact
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import Session, joinedload
+
+from config import settings
+from models import Mod, ModChange
+
+logger = logging.getLogger(__name__)
+
+UPSERT = "upsert"
+DELETE = "delete"
+
+
+def record_mod_change(db: Session, mod_id: int, change_type: str = UPSERT) -> None:
+    """Append one change to the log. Does not commit."""
+    record_mod_changes(db, [mod_id], change_type)
+
+
+def record_mod_changes(db: Session, mod_ids: Iterable[int], change_type: str = UPSERT) -> None:
+    """Append a change for each mod id with one executemany. Does not commit."""
+    now = datetime.utcnow()
+    rows = [{"mod_id": mod_id, "change_type": change_type, "changed_at": now} for mod_id in mod_ids]
+    if rows:
+        db.execute(insert(ModChange), rows)
+
+
+def record_inserted_mods(db: Session, after_id: int) -> None:
+    """Log every mod with an id above `after_id`, for bulk inserts that do not return ids. Does not commit."""
+    db.execute(
+        insert(ModChange).from_select(
+            ["mod_id", "change_type", "changed_at"],
+            select(Mod.id, literal(UPSERT, ModChange.change_type.type), literal(datetime.utcnow(), ModChange.changed_at.type))
+            .where(Mod.id > after_id)
+            .order_by(Mod.id),
+        )
+    )
+
+
+def read_changes(db: Session, since: int, limit: int) -> dict:
+    """Return changes after cursor `since`, oldest first, with the cursor for the next page.
+
+    Only the latest change per mod in the page is returned, with the current mod
+    row for upserts.
+    """
+    settled_before = datetime.utcnow() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+    changes = (
+        db.query(ModChange)
+        .filter(ModChange.id > since, ModChange.changed_at <= settled_before)
+        .order_by(ModChange.id)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        return {"changes": [], "next_cursor": since, "has_more": False}
+
+    latest = {change.mod_id: change for change in changes}
+    upserted_ids = [mod_id for mod_id, change in latest.items() if change.change_type == UPSERT]
+    mods_by_id = {}
+    if upserted_ids:
+        mods = db.query(Mod).options(joinedload(Mod.uploader)).filter(Mod.id.in_(upserted_ids)).all()
+        mods_by_id = {mod.id: mod for mod in mods}
+
+    items = []
+    for change in sorted(latest.values(), key=lambda change: change.id):
+        mod = mods_by_id.get(change.mod_id) if change.change_type == UPSERT else None
+        if change.change_type == UPSERT and mod is None:
+            # Deleted after this change was logged; its tombstone comes in a later page
+            continue
+        items.append({
+            "cursor": change.id,
+            "mod_id": change.mod_id,
+            "change_type": change.change_type,
+            "changed_at": change.changed_at,
+            "mod": mod,
+        })
+    return {"changes": items, "next_cursor": changes[-1].id, "has_more": has_more}
+
+
+def compact_changes(db: Session) -> int:
+    """Delete changes superseded by a later change to the same mod. Returns the number removed."""
+    latest = select(func.max(ModChange.id)).group_by(ModChange.mod_id)
+    result = db.execute(delete(ModChange).where(ModChange.id.not_in(latest)))
+    db.commit()
+    logger.info(f"Compacted mod change log: removed {result.rowcount} superseded change(s).")
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from db_config import SessionLocal
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Mod change feed maintenance.")
+    parser.add_argument("--compact", action="store_true", help="Drop changes superseded by a later one")
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    if args.compact:
+        db = SessionLocal()
+        try:
+            compact_changes(db)
+        finally:
+            db.close()
+    else:
+        parser.print_help()
@@ -1,20 +1,193 @@
-from sqlalchemy import create_engine
+import time
+import random
+import asyncio
+import logging
+import threading
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from config import settings
+import metrics
 
 engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Bound per session to the replica chosen for it
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
+
+# Cookie marking a client that wrote recently, so its reads go to the primary (read-your-writes)
+RECENT_WRITE_COOKIE = "mz_recent_write"
+
+
+class Replica:
+    """A read replica engine with its health and load state."""
+
+    def __init__(self, index: int, url: str):
+        self.index = index
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.label = f"{index}:{self.engine.url.host or 'local'}"
+        self.healthy = True
+        self.lag_seconds = 0.0
+        self.active_connections = 0
+        self.selected = 0
+        self.failed_checks = 0
+        event.listen(self.engine, "checkout", self._on_checkout)
+        event.listen(self.engine, "checkin", self._on_checkin)
+
+    def _on_checkout(self, *args):
+        self.active_connections += 1
+
+    def _on_checkin(self, *args):
+        self.active_connections -= 1
+
+
+class ReplicaRouter:
+    """Picks a healthy replica for read-only sessions, falling back to the primary."""
+
+    def __init__(self, urls: list, selection: str, max_lag_seconds: float):
+        if selection not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown REPLICA_SELECTION '{selection}'. Use 'round_robin' or 'least_connections'.")
+        self.replicas = [Replica(index, url) for index, url in enumerate(urls)]
+        self.selection = selection
+        self.max_lag_seconds = max_lag_seconds
+        self.primary_fallbacks = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def choose(self):
+        """Return a replica engine, or None when no replica is usable."""
+        candidates = [replica for replica in self.replicas if replica.healthy]
+        if not candidates:
+            self.primary_fallbacks += 1
+            return None
+        with self._lock:
+            if self.selection == "least_connections":
+                fewest = min(replica.active_connections for replica in candidates)
+                replica = random.choice([r for r in candidates if r.active_connections == fewest])
+            else:
+                replica = candidates[self._next % len(candidates)]
+                self._next += 1
+            replica.selected += 1
+        return replica.engine
+
+    def check_health(self) -> None:
+        """Measure replication lag and mark replicas that are down or too far behind."""
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conn:
+                    if replica.engine.dialect.name == "postgresql":
+                        lag = conn.execute(text(
+                            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                        )).scalar()
+                    else:
+                        conn.execute(text("SELECT 1"))
+                        lag = 0
+                replica.lag_seconds = float(lag or 0)
+                replica.failed_checks = 0
+                healthy = replica.lag_seconds <= self.max_lag_seconds
+            except Exception as e:
+                replica.failed_checks += 1
+                healthy = False
+                logger.error(f"Health check failed for replica {replica.label}: {e}")
+            if healthy != replica.healthy:
+                state = "healthy" if healthy else f"unhealthy (lag: {replica.lag_seconds:.1f}s)"
+                logger.warning(f"Replica {replica.label} is now {state}.")
+            replica.healthy = healthy
+
+    def collect_metrics(self):
+        for replica in self.replicas:
+            labels = {"replica": replica.label}
+            yield metrics.Sample("modzart_db_replica_healthy", int(replica.healthy), labels,
+                                 "1 if the replica is receiving reads")
+            yield metrics.Sample("modzart_db_replica_lag_seconds", replica.lag_seconds, labels,
+                                 "Replication lag measured by the last health check")
+            yield metrics.Sample("modzart_db_replica_active_connections", replica.active_connections, labels,
+                                 "Connections currently checked out from the replica pool")
+            yield metrics.Sample("modzart_db_replica_selected_total", replica.selected, labels,
+                                 "Read sessions routed to the replica", "counter")
+            yield metrics.Sample("modzart_db_replica_failed_checks", replica.failed_checks, labels,
+                                 "Consecutive failed health checks")
+        yield metrics.Sample("modzart_db_replica_primary_fallbacks_total", self.primary_fallbacks, {},
+                             "Read sessions sent to the primary because no replica was healthy", "counter")
+
+    async def run_health_checks(self, interval: float) -> None:
+        """Check replica health in the background until cancelled."""
+        while True:
+            await asyncio.to_thread(self.check_health)
+            await asyncio.sleep(interval)
+
+
+replica_urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+replica_router = None
+if replica_urls:
+    replica_router = ReplicaRouter(replica_urls, settings.REPLICA_SELECTION, settings.REPLICA_MAX_LAG_SECONDS)
+    metrics.register_collector(replica_router.collect_metrics)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_flush_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _set_recent_write_cookie(session):
+    response = session.info.get("response")
+    if replica_router and response is not None and session.info.pop("wrote", False):
+        response.set_cookie(
+            RECENT_WRITE_COOKIE,
+            str(int(time.time())),
+            max_age=int(settings.READ_YOUR_WRITES_SECONDS),
+            httponly=True,
+            samesite="lax",
+        )
+
+
 def init_db():
     """Initialize the database, creating all tables."""
     import models
     Base.metadata.create_all(bind=engine)
 
-def get_db():
-    """Yield a database session."""
+def warm_up_pool(connections: int = settings.DB_POOL_WARM_CONNECTIONS):
+    """Open a few pooled connections up front so the first requests skip the connect cost."""
+    opened = []
+    engines = [engine] + ([replica.engine for replica in replica_router.replicas] if replica_router else [])
+    try:
+        for pool_engine in engines:
+            for _ in range(connections):
+                opened.append(pool_engine.connect())
+        logger.info(f"Warmed up database pool with {len(opened)} connection(s).")
+    except Exception as e:
+        logger.error(f"Failed to warm up database pool: {e}", exc_info=True)
+    finally:
+        for conn in opened:
+            conn.close()
+
+def get_db(response: Response):
+    """Yield a database session on the primary."""
     db = SessionLocal()
+    # Lets a commit that wrote something mark the client for read-your-writes routing
+    db.info["response"] = response
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db(request: Request):
+    """Yield a session for read-only handlers, on a replica when one is healthy."""
+    read_engine = None
+    if replica_router and RECENT_WRITE_COOKIE not in request.cookies:
+        read_engine = replica_router.choose()
+    db = ReplicaSessionLocal(bind=read_engine) if read_engine else SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,186 @@
+# download_cache.py
+"""Size-bounded read-through disk cache for objects kept in remote storage.
+
+Hot objects are kept on local disk so repeated downloads of popular mods don't
+go to the bucket each time. Concurrent requests for the same object share a
+single fetch, and entries are evicted by LRU or LFU once the cache is full.
+
+Each worker process keeps its own index over a shared directory: files fetched
+by another worker are adopted instead of downloaded again, and entries removed
+by another worker are fetched again on the next request.
+"""
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    __slots__ = ("size", "hits", "last_access")
+
+    def __init__(self, size: int, hits: int = 0, last_access: float = 0.0):
+        self.size = size
+        self.hits = hits
+        self.last_access = last_access or time.monotonic()
+
+
+class DiskCache:
+    """Read-through cache keyed by object name.
+
+    `fetch(object_name, dest_path)` downloads an object to `dest_path` and raises
+    FileNotFoundError if it does not exist. All methods are blocking and meant to
+    be called from the storage I/O pool.
+    """
+
+    def __init__(self, root: str, max_bytes: int, fetch, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache eviction policy '{policy}'. Use 'lru' or 'lfu'.")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # digest -> CacheEntry, least recently used first
+        self._inflight = {}  # digest -> Future resolving to the cached path
+        self._stale = set()  # digests invalidated while their fetch was in flight
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self._load_existing()
+
+    def _digest(self, object_name: str) -> str:
+        return hashlib.sha1(object_name.encode("utf-8")).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _load_existing(self) -> None:
+        """Index files left over from a previous run, oldest access first."""
+        found = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".part"):
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+                found.append((stat.st_atime, entry.name, stat.st_size))
+        for _, digest, size in sorted(found):
+            self._entries[digest] = CacheEntry(size)
+            self.total_bytes += size
+        if found:
+            logger.info(f"Loaded {len(found)} cached object(s) ({self.total_bytes} bytes) from {self.root}")
+        self._evict()
+
+    def get_path(self, object_name: str) -> str:
+        """Return a local path holding the object, fetching it on a miss."""
+        digest = self._digest(object_name)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and not os.path.exists(self._path(digest)):
+                # Evicted by another worker sharing the directory
+                self._entries.pop(digest)
+                self.total_bytes -= entry.size
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                entry.hits += 1
+                entry.last_access = time.monotonic()
+                self.hits += 1
+                return self._path(digest)
+            future = self._inflight.get(digest)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[digest] = future
+                self.misses += 1
+
+        if not owner:
+            # Another request is already fetching this object; wait for its result
+            return future.result()
+
+        try:
+            path = self._fill(object_name, digest)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+
+    def _fill(self, object_name: str, digest: str) -> str:
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            # A file already on disk was fetched by another worker sharing the directory
+            adopted = os.path.exists(path)
+            if not adopted:
+                self._fetch(object_name, part_path)
+            size = os.path.getsize(path if adopted else part_path)
+            with self._lock:
+                if digest in self._stale:
+                    self._stale.discard(digest)
+                    raise FileNotFoundError(f"{object_name} was invalidated while being fetched")
+                if not adopted:
+                    os.replace(part_path, path)
+                self._entries[digest] = CacheEntry(size, hits=1)
+                self.total_bytes += size
+                self._evict(keep=digest)
+            if not adopted:
+                logger.info(f"Cached {object_name} ({size} bytes) at {path}")
+            return path
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def _victim(self, keep: str = None) -> str:
+        # Never evict the object that is about to be served
+        candidates = (digest for digest in self._entries if digest != keep)
+        if self.policy == "lru":
+            return next(candidates)
+        return min(candidates, key=lambda d: (self._entries[d].hits, self._entries[d].last_access))
+
+    def _evict(self, keep: str = None) -> None:
+        """Drop entries until the cache fits its size limit. Caller holds the lock."""
+        while self.total_bytes > self.max_bytes and len(self._entries) > (1 if keep else 0):
+            self._remove(self._victim(keep))
+
+    def _remove(self, digest: str) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry.size
+        try:
+            # Files already opened for a response stay readable after unlink
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, object_name: str) -> None:
+        """Drop an object from the cache, e.g. after it was deleted or replaced."""
+        digest = self._digest(object_name)
+        with self._lock:
+            if digest in self._inflight:
+                self._stale.add(digest)
+            self._remove(digest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
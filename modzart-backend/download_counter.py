@@ -0,0 +1,100 @@
+# download_counter.py
+"""Buffered download counting.
+
+Downloads are counted in memory and flushed to `mods.downloads` and the
+per-user counters in one transaction every DOWNLOAD_FLUSH_INTERVAL_SECONDS,
+instead of one UPDATE and commit per download. An interval of 0 flushes on
+every download. Accesses per object key are flushed in the same transaction
+for storage tiering, and downloaded cold objects are queued for promotion.
+"""
+import asyncio
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import update, bindparam, func
+
+from config import settings
+from db_config import SessionLocal
+from models import Mod
+from user_stats import increment_user_stats
+from storage_tiering import record_accesses, promoter
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadCounter:
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending = Counter()  # (mod_id, user_id) -> downloads not yet written
+        self._accesses = Counter()  # object key -> accesses not yet written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, mod_id: int, user_id: int) -> None:
+        with self._lock:
+            self._pending[(mod_id, user_id)] += 1
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def touch(self, object_key: str) -> None:
+        """Record an access to a stored object, for storage tiering. Written with the next flush."""
+        with self._lock:
+            self._accesses[object_key] += 1
+
+    def flush(self) -> int:
+        """Write pending counts to the database. Returns the number of downloads written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                accesses, self._accesses = self._accesses, Counter()
+            if not pending and not accesses:
+                return 0
+
+            db = SessionLocal()
+            try:
+                mod_counts = Counter()
+                for (mod_id, _), count in pending.items():
+                    mod_counts[mod_id] += count
+                # Mods deleted since the download was counted must not add to their owner's total
+                existing = {
+                    mod_id for (mod_id,) in db.query(Mod.id).filter(Mod.id.in_(list(mod_counts))).all()
+                } if mod_counts else set()
+                if existing:
+                    mods = Mod.__table__
+                    # One executemany statement for all mods in the batch
+                    db.connection().execute(
+                        update(mods)
+                        .where(mods.c.id == bindparam("b_id"))
+                        .values(downloads=func.coalesce(mods.c.downloads, 0) + bindparam("b_count")),
+                        [{"b_id": mod_id, "b_count": count} for mod_id, count in mod_counts.items() if mod_id in existing],
+                    )
+                user_counts = Counter()
+                for (mod_id, user_id), count in pending.items():
+                    if mod_id in existing:
+                        user_counts[user_id] += count
+                for user_id, count in user_counts.items():
+                    increment_user_stats(db, user_id, downloads=count)
+                cold_keys = record_accesses(db, accesses)
+                db.commit()
+                promoter.schedule(cold_keys)
+                written = sum(user_counts.values())
+                logger.info(f"Flushed {written} download(s) for {len(existing)} mod(s).")
+                return written
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Failed to flush download counts, keeping them for the next flush: {e}", exc_info=True)
+                with self._lock:
+                    self._pending.update(pending)
+                    self._accesses.update(accesses)
+                return 0
+            finally:
+                db.close()
+
+    async def run_periodically(self) -> None:
+        """Flush in the background until cancelled."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+
+download_counter = DownloadCounter(settings.DOWNLOAD_FLUSH_INTERVAL_SECONDS)
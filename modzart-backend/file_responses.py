@@ -0,0 +1,92 @@
+# file_responses.py
+"""File responses with HTTP Range support for the /download route."""
+import os
+import mimetypes
+from email.utils import formatdate
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(range_header: str, file_size: int):
+    """Parse a single-range `Range` header into an inclusive (start, end) tuple.
+
+    Returns None when the header should be ignored (missing, malformed or
+    multi-range), in which case the whole file is served.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    start_str, end_str = (part.strip() for part in spec.split("-", 1))
+    try:
+        if not start_str:
+            # Suffix range: the last N bytes
+            length = int(end_str)
+            if length <= 0:
+                raise ValueError
+            start, end = max(file_size - length, 0), file_size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+            if end_str and start > end:
+                return None
+    except ValueError:
+        return None
+    # Also every range of an empty file: there is no first byte to start at
+    if start >= file_size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"},
+        )
+    return start, min(end, file_size - 1)
+
+
+def _iter_file(file, start: int, length: int):
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def ranged_file_response(file_path: str, range_header: str = None, name: str = None) -> StreamingResponse:
+    """Open `file_path` and return a 200 or 206 streaming response for it.
+
+    `name` is used to guess the media type when the path itself has no extension.
+    The file is opened before returning, so the response keeps working even if
+    the path is removed (e.g. evicted from a cache) while it is being sent.
+    Blocking; call it from a worker thread.
+    """
+    file = open(file_path, "rb")
+    try:
+        stat = os.fstat(file.fileno())
+        byte_range = parse_range(range_header, stat.st_size)
+    except BaseException:
+        file.close()
+        raise
+
+    media_type = mimetypes.guess_type(name or file_path)[0] or "application/octet-stream"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "ETag": f'"{int(stat.st_mtime)}-{stat.st_size}"',
+    }
+    if byte_range is None:
+        headers["Content-Length"] = str(stat.st_size)
+        return StreamingResponse(_iter_file(file, 0, stat.st_size), media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    return StreamingResponse(_iter_file(file, start, length), status_code=206, media_type=media_type, headers=headers)
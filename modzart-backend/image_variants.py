@@ -0,0 +1,246 @@
+# image_variants.py
+"""Mod screenshots, served as resized variants generated on first request.
+
+An upload is stored as the original at `mods/{mod_id}/images/{name}.{ext}`.
+A variant is one of IMAGE_VARIANT_WIDTHS in one of IMAGE_VARIANT_FORMATS:
+
+    GET /mods/{mod_id}/images/{image_id}/{width}.{format}    e.g. .../640.webp
+
+The first request renders it from the original and stores it next to it
+(`mods/{mod_id}/images/{name}/{width}.{format}`); later requests, on any
+worker, find it in storage. Variant URLs never change content, so they are
+served with immutable cache headers. Images are never scaled up, and
+originals are not served at all: every variant is re-encoded, without the
+uploader's EXIF data.
+
+Decoding and encoding run in a process pool (IMAGE_PROCESSES per worker), so
+a 40-megapixel PNG neither blocks the event loop nor holds the GIL, and a
+decoder crash on a malicious file only takes down a pool process. Pillow is
+optional; without it image uploads are refused.
+"""
+import os
+import asyncio
+import logging
+import tempfile
+import threading
+import importlib.util
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from config import settings
+from ttl_cache import TTLCache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+
+# Pillow format -> (content type, file extension) of accepted uploads
+SOURCE_FORMATS = {
+    "PNG": ("image/png", ".png"),
+    "JPEG": ("image/jpeg", ".jpg"),
+    "WEBP": ("image/webp", ".webp"),
+}
+# Variant format in URLs -> (Pillow format, content type)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+SNIFF_BYTES = 12
+EXIF_ORIENTATION = 0x0112
+
+
+def variant_widths() -> list:
+    return sorted(int(width) for width in settings.IMAGE_VARIANT_WIDTHS.split(",") if width.strip())
+
+
+def variant_formats() -> list:
+    return [name.strip() for name in settings.IMAGE_VARIANT_FORMATS.split(",") if name.strip() in VARIANT_FORMATS]
+
+
+def widths_for(image_width: int) -> list:
+    """The variant widths worth listing for an image: all narrower ones and one at its full width."""
+    widths = variant_widths()
+    listed = [width for width in widths if width < image_width]
+    wider = [width for width in widths if width >= image_width]
+    return listed + wider[:1]
+
+
+def sniff_format(header: bytes) -> Optional[str]:
+    """The Pillow format name for the magic bytes of an accepted upload, or None."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def variant_key(source_key: str, width: int, variant_format: str) -> str:
+    """mods/1/images/ab12.png -> mods/1/images/ab12/640.webp"""
+    stem = os.path.splitext(source_key)[0]
+    return f"{stem}/{width}.{variant_format}"
+
+
+def delete_image_files(source_key: str) -> None:
+    """Delete an original and all its variants. Blocking."""
+    from storage import delete_file_from_storage, delete_prefix_from_storage
+
+    delete_prefix_from_storage(os.path.splitext(source_key)[0] + "/")
+    delete_file_from_storage(source_key)
+
+
+# Process pool tasks: module-level so they can be pickled, and importing nothing but Pillow
+
+def probe_image(path: str, max_pixels: int) -> tuple:
+    """(format, width, height) of an image as displayed. Raises if it is too large or does not decode."""
+    from PIL import Image
+
+    with Image.open(path, formats=list(SOURCE_FORMATS)) as img:
+        width, height = img.size
+        if width * height > max_pixels:
+            raise ValueError(f"{width}x{height} is more than {max_pixels} pixels")
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        image_format = img.format
+        # Decode fully, so a truncated or corrupt file is refused now rather than on its first view
+        img.load()
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return image_format, width, height
+
+
+def _has_alpha(img) -> bool:
+    return img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+
+
+def render_variant(source_path: str, dest_path: str, width: int, variant_format: str, quality: int) -> tuple:
+    """Write `source_path` resized to at most `width` pixels wide. Returns the variant's (width, height)."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path, formats=list(SOURCE_FORMATS)) as source:
+        if source.format == "JPEG":
+            # The decoder skips straight to a 1/2, 1/4 or 1/8 scale that still covers twice the
+            # target (in either orientation), which is most of the saving on large photos
+            source.draft("RGB", (2 * width, 2 * width))
+        icc_profile = source.info.get("icc_profile")
+        img = ImageOps.exif_transpose(source)
+    if img.width > width:
+        img.thumbnail((width, img.height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    if variant_format == "jpeg":
+        if _has_alpha(img):
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(dest_path, "JPEG", quality=quality, optimize=True, progressive=True, icc_profile=icc_profile)
+    else:
+        mode = "RGBA" if _has_alpha(img) else "RGB"
+        if img.mode != mode:
+            img = img.convert(mode)
+        img.save(dest_path, VARIANT_FORMATS[variant_format][0], quality=quality, method=4, icc_profile=icc_profile)
+    return img.size
+
+
+class ImageProcessor:
+    """Probes uploaded images and renders their variants in a process pool."""
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self.rendered = Counter()
+        self._pool = None
+        self._lock = threading.Lock()
+        # Variant key -> render task, so concurrent first requests render a variant once per worker
+        self._inflight = {}
+        # Variants known to be stored, so S3 is not asked about them on every request
+        self._stored = TTLCache(10000, 3600)
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn: forking a worker that already runs logging/exporter threads is unsafe
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def _run(self, func, *args):
+        try:
+            return await asyncio.wrap_future(self.pool.submit(func, *args))
+        except BrokenProcessPool:
+            # A pool process died (e.g. a decoder crash or OOM kill); start a fresh pool next time
+            logger.error("Image process pool is broken; it will be recreated.")
+            with self._lock:
+                self._pool = None
+            raise
+
+    async def probe(self, path: str) -> tuple:
+        """(format, width, height) of an uploaded image; raises ValueError or OSError if it is not acceptable."""
+        return await self._run(probe_image, path, settings.IMAGE_MAX_PIXELS)
+
+    async def ensure_variant(self, source_key: str, width: int, variant_format: str) -> str:
+        """Render and store a variant unless it is stored already. Returns its object key."""
+        from storage import backend, run_in_io_pool
+
+        key = variant_key(source_key, width, variant_format)
+        if self._stored.get(key) or await run_in_io_pool(backend.exists, key):
+            self._stored.set(key, True)
+            return key
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render(source_key, key, width, variant_format))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded: a client that disconnects does not cancel a render other requests are waiting for
+        await asyncio.shield(task)
+        self._stored.set(key, True)
+        return key
+
+    async def _render(self, source_key: str, key: str, width: int, variant_format: str) -> None:
+        from storage import backend, run_in_io_pool, upload_file_to_storage, TEMP_UPLOAD_DIR
+
+        quality = settings.IMAGE_WEBP_QUALITY if variant_format == "webp" else settings.IMAGE_JPEG_QUALITY
+        source_fd, source_path = tempfile.mkstemp(dir=TEMP_UPLOAD_DIR, prefix="image-")
+        dest_fd, dest_path = tempfile.mkstemp(dir=TEMP_UPLOAD_DIR, prefix="image-", suffix=f".{variant_format}")
+        os.close(source_fd)
+        os.close(dest_fd)
+        try:
+            # A copy even for local storage: the original may be in the cold tier or moved meanwhile
+            await run_in_io_pool(backend.fetch, source_key, source_path)
+            size = await self._run(render_variant, source_path, dest_path, width, variant_format, quality)
+            await run_in_io_pool(
+                upload_file_to_storage, dest_path, key, VARIANT_FORMATS[variant_format][1], cache_control()
+            )
+            self.rendered[variant_format] += 1
+            logger.info(f"Rendered image variant {key} ({size[0]}x{size[1]}, {os.path.getsize(dest_path)} bytes).")
+        finally:
+            for path in (source_path, dest_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def collect_metrics(self):
+        for variant_format in VARIANT_FORMATS:
+            yield metrics.Sample("modzart_image_variants_rendered_total", self.rendered[variant_format],
+                                 {"format": variant_format}, "Image variants rendered on first request", "counter")
+
+
+def cache_control() -> str:
+    return f"public, max-age={settings.IMAGE_CACHE_MAX_AGE_SECONDS}, immutable"
+
+
+image_processor = ImageProcessor(processes=settings.IMAGE_PROCESSES)
+metrics.register_collector(image_processor.collect_metrics)
@@ -0,0 +1,310 @@
+# leaderboard.py
+"""Time-decayed popularity scores for the trending/discover views.
+
+Each download adds exp((t - landmark) / window) to the mod's score ("forward
+decay"). Because every score grows by the same factor over time, the ranking
+never has to be recomputed: the current decayed score is the stored value
+times exp(-(now - landmark) / window). When the exponent gets large the scores
+are rescaled and the landmark moves forward so they stay within float range.
+
+Scores live in a Redis sorted set per window when REDIS_URL is set (shared by
+all workers), otherwise in memory with a periodic JSON snapshot. Downloads for
+Redis are buffered and written every TRENDING_FLUSH_INTERVAL_SECONDS off the
+request path, so a Redis outage loses trending updates rather than stalling
+downloads. The in-memory
+backend only sees the downloads its own process served, so it is for
+single-worker deployments (serve.py warns otherwise).
+"""
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+from typing import List, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rescale stored scores once the growth exponent passes this value
+RESCALE_EXPONENT = 300.0
+# Downloads buffered for Redis beyond this many are dropped until the next successful flush
+MAX_PENDING_DOWNLOADS = 100000
+
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_windows(spec: str) -> dict:
+    """Parse a window list such as "24h,7d" into {"24h": 86400, "7d": 604800}."""
+    windows = {}
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        if name[-1] not in _UNITS or not name[:-1].isdigit():
+            raise ValueError(f"Invalid trending window '{name}'. Use e.g. '30m', '24h' or '7d'.")
+        windows[name] = int(name[:-1]) * _UNITS[name[-1]]
+    return windows
+
+
+class Leaderboard:
+    """Interface shared by the leaderboard backends."""
+
+    # Backends that buffer downloads set this and implement `flush`
+    flush_interval = 0
+
+    def __init__(self, windows: dict):
+        self.windows = windows
+
+    def record_download(self, mod_id: int, at: float = None) -> None:
+        raise NotImplementedError
+
+    def top(self, window: str, limit: int) -> List[Tuple[int, float]]:
+        """The `limit` highest (mod_id, decayed score) pairs for a window."""
+        raise NotImplementedError
+
+    def remove(self, mod_id: int) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Write buffered downloads."""
+
+    async def run_periodically(self) -> None:
+        """Flush in the background until cancelled."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def close(self) -> None:
+        """Persist pending state on shutdown."""
+
+
+class MemoryLeaderboard(Leaderboard):
+    """Per-process scores with a cached ranking and periodic JSON snapshots."""
+
+    def __init__(self, windows: dict, snapshot_path: str = None, snapshot_interval: float = 60.0,
+                 refresh_interval: float = 5.0):
+        super().__init__(windows)
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        now = time.time()
+        self._landmarks = {window: now for window in windows}
+        self._scores = {window: {} for window in windows}
+        self._rankings = {window: [] for window in windows}  # Sorted (score, mod_id), highest first
+        self._ranked_at = {window: 0.0 for window in windows}
+        self._dirty = False
+        self._last_snapshot = time.monotonic()
+        self._snapshotting = False
+        self._load_snapshot()
+
+    def _load_snapshot(self) -> None:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path) as f:
+                data = json.load(f)
+            for window in self.windows:
+                if window in data:
+                    self._landmarks[window] = data[window]["landmark"]
+                    self._scores[window] = {int(mod_id): score for mod_id, score in data[window]["scores"].items()}
+            logger.info(f"Loaded trending snapshot from {self.snapshot_path}")
+        except Exception as e:
+            logger.error(f"Failed to load trending snapshot: {e}", exc_info=True)
+
+    def snapshot(self) -> None:
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            data = {
+                window: {"landmark": self._landmarks[window], "scores": dict(self._scores[window])}
+                for window in self.windows
+            }
+            self._dirty = False
+            self._last_snapshot = time.monotonic()
+        # A fresh temp file per write, so concurrent writers (other processes, the shutdown
+        # snapshot) never interleave in one file; the last rename wins whole
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.snapshot_path)), prefix=".trending-", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.snapshot_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _snapshot_in_background(self) -> None:
+        try:
+            self.snapshot()
+        except Exception as e:
+            logger.error(f"Failed to write trending snapshot: {e}", exc_info=True)
+        finally:
+            self._snapshotting = False
+
+    def _rescale(self, window: str, now: float) -> None:
+        factor = math.exp(-(now - self._landmarks[window]) / self.windows[window])
+        scores = self._scores[window]
+        for mod_id in scores:
+            scores[mod_id] *= factor
+        self._landmarks[window] = now
+
+    def record_download(self, mod_id: int, at: float = None) -> None:
+        at = at or time.time()
+        with self._lock:
+            for window, seconds in self.windows.items():
+                exponent = (at - self._landmarks[window]) / seconds
+                if exponent > RESCALE_EXPONENT:
+                    self._rescale(window, at)
+                    exponent = 0.0
+                scores = self._scores[window]
+                scores[mod_id] = scores.get(mod_id, 0.0) + math.exp(exponent)
+            self._dirty = True
+            snapshot_due = (
+                not self._snapshotting and time.monotonic() - self._last_snapshot >= self.snapshot_interval
+            )
+            if snapshot_due:
+                self._snapshotting = True
+        if snapshot_due:
+            # Written on its own thread: this is called from request handlers on the event loop
+            threading.Thread(target=self._snapshot_in_background, name="trending-snapshot", daemon=True).start()
+
+    def top(self, window: str, limit: int) -> List[Tuple[int, float]]:
+        with self._lock:
+            # The ranking is rebuilt at most every refresh_interval, so reads are O(limit)
+            if time.monotonic() - self._ranked_at[window] >= self.refresh_interval:
+                self._rankings[window] = sorted(
+                    ((score, mod_id) for mod_id, score in self._scores[window].items()), reverse=True
+                )
+                self._ranked_at[window] = time.monotonic()
+            decay = math.exp(-(time.time() - self._landmarks[window]) / self.windows[window])
+            return [(mod_id, score * decay) for score, mod_id in self._rankings[window][:limit]]
+
+    def remove(self, mod_id: int) -> None:
+        with self._lock:
+            for window in self.windows:
+                self._scores[window].pop(mod_id, None)
+                self._rankings[window] = [entry for entry in self._rankings[window] if entry[1] != mod_id]
+            self._dirty = True
+
+    def close(self) -> None:
+        if self._dirty:
+            self.snapshot()
+
+
+class RedisLeaderboard(Leaderboard):
+    """Scores in one Redis sorted set per window, shared by all workers.
+
+    Downloads are buffered in memory and written by `flush`, which the app
+    runs every `flush_interval` seconds in a worker thread.
+    """
+
+    def __init__(self, windows: dict, redis_url: str, prefix: str = "modzart:trending",
+                 flush_interval: float = settings.TRENDING_FLUSH_INTERVAL_SECONDS):
+        super().__init__(windows)
+        import redis
+
+        self.redis = redis.Redis.from_url(
+            redis_url, socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        )
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self._pending = []  # (mod_id, download time) not yet written
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _key(self, window: str) -> str:
+        return f"{self.prefix}:{window}"
+
+    def _landmark(self, window: str) -> float:
+        landmark_key = f"{self._key(window)}:landmark"
+        value = self.redis.get(landmark_key)
+        if value is None:
+            self.redis.set(landmark_key, time.time(), nx=True)
+            value = self.redis.get(landmark_key)
+        return float(value)
+
+    def _rescale(self, window: str, landmark: float, now: float) -> None:
+        key = self._key(window)
+        # Only one worker rescales; the others keep adding to the old landmark until it moves
+        if not self.redis.set(f"{key}:rescale_lock", 1, nx=True, ex=60):
+            return
+        try:
+            factor = math.exp(-(now - landmark) / self.windows[window])
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.zunionstore(key, {key: factor})
+            pipe.set(f"{key}:landmark", now)
+            pipe.execute()
+        finally:
+            self.redis.delete(f"{key}:rescale_lock")
+
+    def record_download(self, mod_id: int, at: float = None) -> None:
+        with self._lock:
+            if len(self._pending) < MAX_PENDING_DOWNLOADS:
+                self._pending.append((mod_id, at or time.time()))
+            else:
+                self._dropped += 1
+                if self._dropped == 1 or self._dropped % 10000 == 0:
+                    logger.error(f"Trending download buffer is full; {self._dropped} downloads dropped so far.")
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self) -> None:
+        """Add buffered downloads to the sorted sets, one increment per mod and window. Blocking."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._dropped = 0
+            if not pending:
+                return
+            latest = max(at for _, at in pending)
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for window, seconds in self.windows.items():
+                    landmark = self._landmark(window)
+                    if (latest - landmark) / seconds > RESCALE_EXPONENT:
+                        self._rescale(window, landmark, latest)
+                        landmark = self._landmark(window)
+                    increments = defaultdict(float)
+                    for mod_id, at in pending:
+                        increments[mod_id] += math.exp((at - landmark) / seconds)
+                    for mod_id, increment in increments.items():
+                        pipe.zincrby(self._key(window), increment, mod_id)
+                pipe.execute()
+            except Exception as e:
+                # Trending is best effort; these downloads are lost, later ones are written as usual
+                logger.error(f"Failed to write {len(pending)} downloads to the trending leaderboard: {e}")
+
+    def top(self, window: str, limit: int) -> List[Tuple[int, float]]:
+        decay = math.exp(-(time.time() - self._landmark(window)) / self.windows[window])
+        entries = self.redis.zrevrange(self._key(window), 0, limit - 1, withscores=True)
+        return [(int(mod_id), score * decay) for mod_id, score in entries]
+
+    def remove(self, mod_id: int) -> None:
+        with self._lock:
+            self._pending = [entry for entry in self._pending if entry[0] != mod_id]
+        pipe = self.redis.pipeline(transaction=False)
+        for window in self.windows:
+            pipe.zrem(self._key(window), mod_id)
+        pipe.execute()
+
+    def close(self) -> None:
+        self.flush()
+
+
+def create_leaderboard() -> Leaderboard:
+    windows = parse_windows(settings.TRENDING_WINDOWS)
+    if settings.REDIS_URL:
+        logger.info("Using Redis trending leaderboard.")
+        return RedisLeaderboard(windows, settings.REDIS_URL)
+    return MemoryLeaderboard(windows, snapshot_path=settings.TRENDING_SNAPSHOT_PATH)
+
+
+leaderboard = create_leaderboard()
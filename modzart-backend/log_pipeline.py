@@ -0,0 +1,201 @@
+# log_pipeline.py
+"""Non-blocking log delivery for the API workers.
+
+`start_queue_logging` swaps every handler configured by main.LOGGING_CONFIG for
+a QueueHandler and moves the real handler behind a QueueListener thread, so a
+slow stdout/stderr never blocks the event loop. Records are formatted on the
+listener thread; the request path only copies the record onto a bounded queue.
+When the queue is full the record is dropped and counted instead of blocking.
+
+INFO-and-below records from busy loggers can be sampled before they are queued
+(LOG_SAMPLE_RATES, e.g. "uvicorn.access=0.1,storage=0.25"); warnings and errors
+are always kept. LOG_FORMAT=json switches to one JSON object per line, which
+includes the request's trace id when tracing is enabled.
+"""
+import copy
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import settings
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sample_rates(value: str) -> dict:
+    """Parse "logger=rate,..." into {logger: rate}."""
+    rates = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO-and-below records per logger (matched by longest name prefix)."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+        self._cache = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            rate = 1.0
+            matched = ""
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > len(matched):
+                    matched, rate = prefix, prefix_rate
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            data["trace_id"] = trace_id
+        if record.name == "uvicorn.access" and isinstance(record.args, tuple) and len(record.args) == 5:
+            client_addr, method, path, http_version, status_code = record.args
+            data.update(client_addr=client_addr, method=method, path=path,
+                        http_version=http_version, status_code=status_code)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() formats the message here, on the caller's thread, and
+        # discards record.args, which uvicorn's access formatter needs
+        record = copy.copy(record)
+        if record.exc_info:
+            # Render the traceback now so frames are not kept alive on the queue
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.trace_id = tracing.current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueueLogging:
+    """Handlers moved behind queues, and what is needed to put them back."""
+
+    def __init__(self):
+        self.listeners = []
+        self.queue_handlers = []
+        self.replaced = []  # (logger, original handlers)
+        self.sampling_filter = None
+
+    def collect_metrics(self):
+        for handler in self.queue_handlers:
+            labels = {"handler": handler.name or "default"}
+            yield metrics.Sample("modzart_log_queue_size", handler.queue.qsize(), labels,
+                                 "Log records waiting to be written")
+            yield metrics.Sample("modzart_log_records_dropped_total", handler.dropped, labels,
+                                 "Log records dropped because the queue was full", "counter")
+        if self.sampling_filter:
+            yield metrics.Sample("modzart_log_records_sampled_out_total", self.sampling_filter.sampled_out, {},
+                                 "INFO records skipped by LOG_SAMPLE_RATES", "counter")
+
+
+_active: Optional[QueueLogging] = None
+
+
+def start_queue_logging(max_queue: int = settings.LOG_QUEUE_SIZE) -> None:
+    """Move every configured handler behind a queue and a listener thread."""
+    global _active
+    if _active is not None:
+        return
+    state = QueueLogging()
+    rates = parse_sample_rates(settings.LOG_SAMPLE_RATES)
+    if rates:
+        state.sampling_filter = SamplingFilter(rates)
+
+    loggers = [logging.getLogger()] + [
+        candidate for candidate in logging.Logger.manager.loggerDict.values()
+        if isinstance(candidate, logging.Logger)
+    ]
+    by_target = {}
+    for target_logger in loggers:
+        if not target_logger.handlers:
+            continue
+        original = list(target_logger.handlers)
+        replacement = []
+        for handler in original:
+            queue_handler = by_target.get(handler)
+            if queue_handler is None:
+                queue_handler = NonBlockingQueueHandler(queue.Queue(max_queue))
+                queue_handler.name = handler.name
+                if state.sampling_filter:
+                    queue_handler.addFilter(state.sampling_filter)
+                listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+                listener.start()
+                by_target[handler] = queue_handler
+                state.queue_handlers.append(queue_handler)
+                state.listeners.append(listener)
+            replacement.append(queue_handler)
+        target_logger.handlers = replacement
+        state.replaced.append((target_logger, original))
+
+    _active = state
+    metrics.register_collector(state.collect_metrics)
+    atexit.register(stop_queue_logging)
+    logger.info(f"Queue logging started for {len(state.listeners)} handler(s) (sampling: {rates or 'off'}).")
+
+
+def stop_queue_logging() -> None:
+    """Restore the original handlers and write out everything still queued."""
+    global _active
+    state, _active = _active, None
+    if state is None:
+        return
+    for target_logger, original in state.replaced:
+        target_logger.handlers = original
+    for listener in state.listeners:
+        listener.stop()
+    for listener in state.listeners:
+        for handler in listener.handlers:
+            handler.flush()
@@ -1,14 +1,28 @@
 # main.py
 import os
+import asyncio
 import logging
 import logging.config
-import sys
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import PlainTextResponse
 
-from routers import auth, users, mods
+from routers import auth, users, mods, admin, uploads, images
 from config import settings
+import db_config
+import metrics
+import storage
+import tracing
+import log_pipeline
+from upload_validation import UploadLimitMiddleware
+import upload_progress
+from upload_progress import UploadProgressMiddleware
+from leaderboard import leaderboard
+from download_counter import download_counter
+from storage_tiering import promoter
+from malware_scan import scanner_chain
+from image_variants import image_processor
 
 # --- Logging Configuration ---
 LOGGING_CONFIG = {
@@ -27,15 +41,18 @@ LOGGING_CONFIG = {
             "datefmt": "%Y-%m-%d %H:%M:%S",
             "use_colors": True,
         },
+        "json": {
+            "()": "log_pipeline.JsonFormatter",
+        },
     },
     "handlers": {
         "default": {
-            "formatter": "default",
+            "formatter": "json" if settings.LOG_FORMAT == "json" else "default",
             "class": "logging.StreamHandler",
             "stream": "ext://sys.stderr",
         },
         "access": {
-            "formatter": "access",
+            "formatter": "json" if settings.LOG_FORMAT == "json" else "access",
             "class": "logging.StreamHandler",
             "stream": "ext://sys.stdout",
         },
@@ -47,26 +64,86 @@ LOGGING_CONFIG = {
         "main": {"handlers": ["default"], "level": "INFO", "propagate": False},
         "routers": {"handlers": ["default"], "level": "INFO", "propagate": True},
         "storage": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "storage_backends": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "download_cache": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "leaderboard": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "download_counter": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "storage_tiering": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "storage_layout": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "reconciler": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "user_stats": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "change_feed": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "bulk_import": {"handlers": ["default"], "level": "INFO", "propagate": True},
         "security": {"handlers": ["default"], "level": "INFO", "propagate": True},
         "db_config": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "metrics": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "tracing": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "log_pipeline": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "upload_validation": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "upload_progress": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "malware_scan": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "archive_manifest": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "image_variants": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "zip_bundle": {"handlers": ["default"], "level": "INFO", "propagate": True},
+        "serve": {"handlers": ["default"], "level": "INFO", "propagate": False},
     },
 }
 
-is_reloader = any(arg == "--reload" for arg in sys.argv) or os.getenv("WORKERS_PER_CORE")
-if not is_reloader or os.getenv("INSTANCE_ID") == "0":
-    logging.config.dictConfig(LOGGING_CONFIG)
-    logger = logging.getLogger(__name__)
-    logger.info("Logging configured.")
-else:
-    logger = logging.getLogger(__name__)
+# Every worker process imports this module, so each one configures its own handlers
+logging.config.dictConfig(LOGGING_CONFIG)
+if settings.LOG_QUEUE_ENABLED:
+    log_pipeline.start_queue_logging()
+logger = logging.getLogger(__name__)
+logger.info(f"Logging configured (pid: {os.getpid()}).")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Pre-warm per-worker resources on startup and drain pending work on shutdown."""
+    db_config.warm_up_pool()
+    storage.warm_up()
+    background_tasks = []
+    if download_counter.flush_interval > 0:
+        background_tasks.append(asyncio.create_task(download_counter.run_periodically()))
+    if leaderboard.flush_interval > 0:
+        background_tasks.append(asyncio.create_task(leaderboard.run_periodically()))
+    if db_config.replica_router:
+        background_tasks.append(asyncio.create_task(
+            db_config.replica_router.run_health_checks(settings.REPLICA_HEALTH_CHECK_SECONDS)
+        ))
+    yield
+    logger.info("Shutting down, draining in-flight uploads...")
+    await storage.drain_uploads(settings.GRACEFUL_TIMEOUT)
+    storage.shutdown_io_pool()
+    scanner_chain.shutdown()
+    image_processor.shutdown()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.to_thread(download_counter.flush)
+    # Lets the promotion in progress finish; queued ones are retried on the next download
+    await asyncio.to_thread(promoter.shutdown)
+    # Writes the in-memory leaderboard's final snapshot, or the downloads buffered for Redis
+    await asyncio.to_thread(leaderboard.close)
+    await upload_progress.broker.close()
+    tracing.exporter.shutdown()
+    # Restores the direct handlers, so messages logged after shutdown still get out
+    log_pipeline.stop_queue_logging()
+    for handler in logging.getLogger().handlers + logging.getLogger("uvicorn").handlers:
+        handler.flush()
 
 app = FastAPI(
     title="Modzart API",
     description="API for GTA V mod platform",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
-# Configure CORS
+# Refuses oversized request bodies before the multipart parser spools them to disk
+app.add_middleware(UploadLimitMiddleware)
+# Outside the size limit, so uploads rejected by it also get their "failed" progress event
+app.add_middleware(UploadProgressMiddleware)
+
+# Configure CORS. Added after the upload middleware so it wraps them: their early 413 and 415
+# responses then carry CORS headers and a browser client can read them
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # Specific frontend origin instead of wildcard
@@ -76,28 +153,36 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+if settings.TRACING_ENABLED:
+    # Added last so it is the outermost middleware and the root span covers the whole request
+    app.add_middleware(tracing.TracingMiddleware)
+    tracing.instrument_sqlalchemy()
+    logger.info(f"Request tracing enabled (sample rate: {settings.TRACE_SAMPLE_RATE}, export: {settings.TRACE_EXPORT_PATH}).")
+
 @app.get("/download/{path:path}")
-async def serve_file(path: str):
-    """Serve files from local storage"""
-    file_path = os.path.join(settings.LOCAL_STORAGE_PATH, path)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+async def serve_file(path: str, request: Request):
+    """Serve files from local storage or the download cache, with Range support"""
+    response = await storage.run_in_io_pool(storage.open_download, path, request.headers.get("range"))
+    # Keeps the object in (or brings it back to) the hot storage tier
+    download_counter.touch(os.path.normpath(path))
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    """Prometheus metrics for this worker"""
+    return metrics.render()
 
 # Include routers
 logger.info("Including routers...")
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(mods.router)
+app.include_router(admin.router)
+app.include_router(uploads.router)
+app.include_router(images.router)
 logger.info("Routers included.")
 
 if __name__ == "__main__":
-    import uvicorn
-    logger.info("Starting Uvicorn server...")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", "8000")),
-        reload=True,
-        log_config=None
-    )
\ No newline at end of file
+    # Production launcher. For development with auto-reload use: uvicorn main:app --reload
+    import serve
+    serve.run()
@@ -0,0 +1,284 @@
+# malware_scan.py
+"""Local malware scanner chain, run in a process pool.
+
+Engines, all offline:
+
+* hash blocklist: SHA-256 of the file against SCAN_HASH_BLOCKLIST_PATH (one hex digest per line)
+* byte-pattern rules: YARA-style rules from SCAN_RULES_PATH plus a built-in EICAR rule,
+  matched over memory-mapped byte ranges, or over the decompressed entries of zip archives
+* ClamAV: INSTREAM over the clamd unix socket at CLAMD_SOCKET, when that socket exists
+
+Hashing, each pattern range/entry group and the clamd stream are separate tasks
+in a ProcessPoolExecutor, so one large archive is scanned on several cores. Any
+engine finding malware rejects the file. A clean ClamAV result accepts it. The
+other engines can only convict, so files nothing could decide are reported as
+undecided and passed on to VirusTotal (see storage.scan_file_for_viruses).
+
+Rules file format (JSON):
+
+    [{"name": "dropper", "strings": ["hex:4d5a9000", "powershell -enc"], "condition": "any"}]
+
+`condition` is "any" (default) or "all"; strings are text, or hex with a "hex:" prefix.
+"""
+import os
+import mmap
+import json
+import socket
+import struct
+import asyncio
+import hashlib
+import logging
+import zipfile
+import threading
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional
+
+from config import settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CLEAN = "clean"
+MALICIOUS = "malicious"
+UNDECIDED = "undecided"
+
+READ_CHUNK = 1024 * 1024
+
+EICAR_RULE = {
+    "name": "EICAR-Test-File",
+    "strings": ["X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"],
+    "condition": "any",
+}
+
+
+class Rule(NamedTuple):
+    name: str
+    patterns: tuple
+    condition: str
+
+
+class ScanResult(NamedTuple):
+    verdict: str
+    findings: list  # (engine, detail) for each engine that convicted or cleared the file
+
+
+def _pattern_bytes(value: str) -> bytes:
+    if value.startswith("hex:"):
+        return bytes.fromhex(value[4:].replace(" ", ""))
+    return value.encode("utf-8")
+
+
+def load_rules(path: Optional[str]) -> list:
+    raw_rules = [EICAR_RULE]
+    if path:
+        with open(path, encoding="utf-8") as f:
+            raw_rules += json.load(f)
+    return [
+        Rule(raw["name"], tuple(_pattern_bytes(value) for value in raw["strings"]), raw.get("condition", "any"))
+        for raw in raw_rules
+    ]
+
+
+def load_hash_blocklist(path: Optional[str]) -> frozenset:
+    if not path:
+        return frozenset()
+    with open(path, encoding="utf-8") as f:
+        return frozenset(line.strip().lower() for line in f if line.strip() and not line.startswith("#"))
+
+
+# --- Engine tasks. Top-level functions so they can run in pool processes. ---
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def match_range(path: str, start: int, end: int, patterns: tuple) -> set:
+    """Indexes of patterns starting inside [start, end) of the memory-mapped file."""
+    found = set()
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for index, pattern in enumerate(patterns):
+                # Allow a match to run past `end` so patterns spanning two ranges are not missed
+                if mapped.find(pattern, start, min(end + len(pattern) - 1, len(mapped))) != -1:
+                    found.add(index)
+    return found
+
+
+def match_zip_entries(path: str, names: list, patterns: tuple) -> set:
+    """Indexes of patterns found in the decompressed contents of the given zip entries."""
+    found = set()
+    overlap = max(len(pattern) for pattern in patterns) - 1
+    with zipfile.ZipFile(path) as archive:
+        for name in names:
+            try:
+                with archive.open(name) as entry:
+                    tail = b""
+                    while chunk := entry.read(READ_CHUNK):
+                        data = tail + chunk
+                        for index, pattern in enumerate(patterns):
+                            if index not in found and pattern in data:
+                                found.add(index)
+                        tail = data[-overlap:] if overlap else b""
+            except (RuntimeError, NotImplementedError, zipfile.BadZipFile):
+                # Encrypted entries or unsupported compression: left to ClamAV/VirusTotal
+                continue
+            if len(found) == len(patterns):
+                break
+    return found
+
+
+def clamd_scan(socket_path: str, path: str, timeout: float) -> tuple:
+    """Stream the file to clamd. Returns (verdict, detail)."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.settimeout(timeout)
+        conn.connect(socket_path)
+        conn.sendall(b"zINSTREAM\0")
+        with open(path, "rb") as f:
+            while chunk := f.read(READ_CHUNK):
+                conn.sendall(struct.pack("!L", len(chunk)) + chunk)
+        conn.sendall(struct.pack("!L", 0))
+        reply = b""
+        while not reply.endswith(b"\0"):
+            data = conn.recv(4096)
+            if not data:
+                break
+            reply += data
+    reply = reply.rstrip(b"\0").decode("utf-8", "replace")
+    if reply.endswith("OK"):
+        return CLEAN, "clamd: OK"
+    if reply.endswith("FOUND"):
+        return MALICIOUS, f"clamd: {reply.split(':', 1)[-1].strip()}"
+    return UNDECIDED, f"clamd: {reply}"
+
+
+class ScannerChain:
+    """Runs the local engines on a file and combines their verdicts."""
+
+    def __init__(self, processes: int, rules: list, blocklist: frozenset, clamd_socket: Optional[str],
+                 chunk_bytes: int):
+        self.processes = processes
+        self.rules = rules
+        self.patterns = tuple(pattern for rule in rules for pattern in rule.patterns)
+        self.blocklist = blocklist
+        self.clamd_socket = clamd_socket
+        self.chunk_bytes = chunk_bytes
+        self.verdicts = Counter()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # spawn: forking a worker that already runs logging/exporter threads is unsafe
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _pattern_tasks(self, path: str, size: int) -> list:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                entries = [info for info in archive.infolist() if not info.is_dir()]
+            # Group entries into roughly chunk_bytes of decompressed data per task
+            groups, current, current_size = [], [], 0
+            for info in entries:
+                current.append(info.filename)
+                current_size += info.file_size
+                if current_size >= self.chunk_bytes:
+                    groups.append(current)
+                    current, current_size = [], 0
+            if current:
+                groups.append(current)
+            return [self.pool.submit(match_zip_entries, path, names, self.patterns) for names in groups]
+        return [
+            self.pool.submit(match_range, path, start, min(start + self.chunk_bytes, size), self.patterns)
+            for start in range(0, size, self.chunk_bytes)
+        ]
+
+    async def scan(self, path: str) -> ScanResult:
+        try:
+            return await self._scan(path)
+        except BrokenProcessPool:
+            # A pool process died (e.g. OOM-killed); start a fresh pool for the next upload
+            logger.error("Scanner process pool is broken; it will be recreated.")
+            with self._lock:
+                self._pool = None
+            raise
+
+    async def _scan(self, path: str) -> ScanResult:
+        size = os.path.getsize(path)
+        if not size:
+            return ScanResult(UNDECIDED, [])
+        hash_task = asyncio.wrap_future(self.pool.submit(hash_file, path))
+        pattern_tasks = [asyncio.wrap_future(future) for future in self._pattern_tasks(path, size)]
+        clamd_task = None
+        if self.clamd_socket and os.path.exists(self.clamd_socket):
+            clamd_task = asyncio.wrap_future(self.pool.submit(
+                clamd_scan, self.clamd_socket, path, settings.CLAMD_TIMEOUT_SECONDS
+            ))
+
+        findings = []
+        verdict = UNDECIDED
+
+        digest = await hash_task
+        if digest in self.blocklist:
+            findings.append(("hash_blocklist", f"sha256 {digest} is blocklisted"))
+            verdict = MALICIOUS
+
+        found = set()
+        for matched in await asyncio.gather(*pattern_tasks):
+            found |= matched
+        offset = 0
+        for rule in self.rules:
+            indexes = range(offset, offset + len(rule.patterns))
+            offset += len(rule.patterns)
+            hits = [index in found for index in indexes]
+            if all(hits) if rule.condition == "all" else any(hits):
+                findings.append(("patterns", f"rule {rule.name} matched"))
+                verdict = MALICIOUS
+
+        if clamd_task is not None:
+            try:
+                clamd_verdict, detail = await clamd_task
+            except OSError as e:
+                logger.error(f"ClamAV scan of {path} failed: {e}")
+            else:
+                if clamd_verdict == MALICIOUS:
+                    verdict = MALICIOUS
+                elif clamd_verdict == CLEAN and verdict != MALICIOUS:
+                    verdict = CLEAN
+                findings.append(("clamav", detail))
+
+        self.verdicts[verdict] += 1
+        logger.info(f"Local scan of {path} ({size} bytes, {len(pattern_tasks)} pattern task(s)): {verdict} {findings}")
+        return ScanResult(verdict, findings)
+
+    def collect_metrics(self):
+        for verdict in (CLEAN, MALICIOUS, UNDECIDED):
+            yield metrics.Sample("modzart_local_scans_total", self.verdicts[verdict], {"verdict": verdict},
+                                 "Uploads scanned by the local scanner chain", "counter")
+
+
+scanner_chain = ScannerChain(
+    processes=settings.SCAN_PROCESSES,
+    rules=load_rules(settings.SCAN_RULES_PATH),
+    blocklist=load_hash_blocklist(settings.SCAN_HASH_BLOCKLIST_PATH),
+    clamd_socket=settings.CLAMD_SOCKET,
+    chunk_bytes=settings.SCAN_CHUNK_MB * 1024 * 1024,
+)
+metrics.register_collector(scanner_chain.collect_metrics)
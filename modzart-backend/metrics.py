@@ -0,0 +1,53 @@
+# metrics.py
+"""Minimal Prometheus text exposition for GET /metrics.
+
+Modules register collector callables that return the current samples; they are
+only evaluated when /metrics is scraped, so there is no cost on the request path.
+"""
+import logging
+from typing import Callable, Iterable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Sample(NamedTuple):
+    name: str
+    value: float
+    labels: dict = {}
+    help: str = ""
+    type: str = "gauge"
+
+
+_collectors = []
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    _collectors.append(collector)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def render() -> str:
+    """Render all collectors in the Prometheus text format."""
+    lines = []
+    described = set()
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            logger.error(f"Metrics collector {collector.__name__} failed: {e}", exc_info=True)
+            continue
+        for sample in samples:
+            if sample.name not in described:
+                if sample.help:
+                    lines.append(f"# HELP {sample.name} {sample.help}")
+                lines.append(f"# TYPE {sample.name} {sample.type}")
+                described.add(sample.name)
+            lines.append(f"{sample.name}{_format_labels(sample.labels)} {sample.value}")
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db_config import Base
@@ -14,10 +14,18 @@ class User(Base):
     password = Column(String)
 
     mods = relationship("Mod", back_populates="uploader")
+    stats = relationship("UserStats", back_populates="user", uselist=False)
 
 class Mod(Base):
     __tablename__ = "mods"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Newest-first listing, with and without the uploader filter (see test_query_plans.py)
+        Index("ix_mods_created_at", "created_at"),
+        Index("ix_mods_user_id_created_at", "user_id", "created_at"),
+        # Incremental exports (updated_since)
+        Index("ix_mods_updated_at_id", "updated_at", "id"),
+        {'extend_existing': True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
@@ -29,4 +37,82 @@ class Mod(Base):
     project_visibility = Column(String, default="public")
 
     user_id = Column(Integer, ForeignKey("users.id"))
-    uploader = relationship("User", back_populates="mods")
\ No newline at end of file
+    uploader = relationship("User", back_populates="mods")
+
+class UserStats(Base):
+    """Per-user aggregates maintained incrementally (see user_stats.py)."""
+    __tablename__ = "user_stats"
+    __table_args__ = {'extend_existing': True}
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    mod_count = Column(Integer, nullable=False, default=0)
+    total_downloads = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    user = relationship("User", back_populates="stats")
+
+class ModChange(Base):
+    """Append-only log of mod creates, updates and deletes (see change_feed.py)."""
+    __tablename__ = "mod_changes"
+    __table_args__ = {'extend_existing': True}
+
+    # The id is the change feed cursor; SQLite only autoincrements INTEGER primary keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    # No foreign key: tombstones outlive the mod row
+    mod_id = Column(Integer, nullable=False, index=True)
+    change_type = Column(String(16), nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class ArchiveEntry(Base):
+    """A file inside an uploaded mod archive (see archive_manifest.py)."""
+    __tablename__ = "archive_entries"
+    __table_args__ = (
+        # Manifest listing of one stored file, in path order
+        Index("ix_archive_entries_mod_id_object_key_path", "mod_id", "object_key", "path"),
+        # Which mods contain a file of this name
+        Index("ix_archive_entries_name_mod_id", "name", "mod_id"),
+        Index("ix_archive_entries_object_key", "object_key"),
+        {'extend_existing': True},
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    mod_id = Column(Integer, ForeignKey("mods.id", ondelete="CASCADE"), nullable=False)
+    object_key = Column(String, nullable=False)  # The stored archive: the mod file or a version
+    path = Column(String, nullable=False)
+    name = Column(String, nullable=False)  # Lower-cased base name of path
+    size = Column(BigInteger, nullable=False)
+    compressed_size = Column(BigInteger, nullable=False)
+    crc32 = Column(BigInteger)
+
+class StoredObject(Base):
+    """Access statistics and storage tier of a stored object (see storage_tiering.py)."""
+    __tablename__ = "stored_objects"
+    __table_args__ = (
+        # Tiering candidates: least recently accessed first
+        Index("ix_stored_objects_tier_last_accessed_at", "tier", "last_accessed_at"),
+        {'extend_existing': True},
+    )
+
+    object_key = Column(String, primary_key=True)
+    access_count = Column(BigInteger, nullable=False, default=0)
+    last_accessed_at = Column(DateTime)
+    tier = Column(String(8), nullable=False, default="hot")  # "hot" or "cold"
+    tier_changed_at = Column(DateTime)
+
+class ModImage(Base):
+    """A screenshot in a mod's gallery; resized variants are generated on request (see image_variants.py)."""
+    __tablename__ = "mod_images"
+    __table_args__ = (
+        # Gallery listing of one mod, in upload order
+        Index("ix_mod_images_mod_id_id", "mod_id", "id"),
+        {'extend_existing': True},
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    mod_id = Column(Integer, ForeignKey("mods.id", ondelete="CASCADE"), nullable=False)
+    object_key = Column(String, nullable=False)  # The original: mods/{mod_id}/images/{name}.{ext}
+    content_type = Column(String, nullable=False)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,232 @@
+# reconciler.py
+"""Incremental reconciliation of stored objects with the database.
+
+Failed uploads, rollbacks after a storage write and interrupted deletes can
+leave objects nothing references (orphans), and rows whose file is missing
+(dangling). The reconciler walks storage in listing order and the mods table
+in id order, a batch at a time, checkpointing both positions in
+RECONCILE_CHECKPOINT_PATH so it resumes where it stopped:
+
+    python reconciler.py [--dry-run] [--loop]
+
+An object is referenced when it is its mod's current file, lies under
+versions/{mod_id}/ of an existing mod, or is a gallery image or one of its
+variants (mods/{mod_id}/images/). Orphans whose last modification is
+older than RECONCILE_GRACE_HOURS are deleted (reported only with --dry-run);
+younger ones may belong to an upload still in progress and are left alone.
+Dangling rows are only reported. Storage operations (objects listed,
+existence checks, deletes) are capped at RECONCILE_MAX_OPS_PER_SECOND.
+"""
+import os
+import json
+import time
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Mod, ArchiveEntry, StoredObject, ModImage
+
+logger = logging.getLogger(__name__)
+
+# Placeholder filenames that do not name a stored object
+UNSTORED_PREFIXES = ("PENDING_UPLOAD", "project:", "NO_FILE")
+
+
+class Budget:
+    """Spreads storage operations out to at most `ops_per_second` (0 disables)."""
+
+    def __init__(self, ops_per_second: float):
+        self.interval = 1 / ops_per_second if ops_per_second > 0 else 0
+        self.next_at = time.monotonic()
+
+    def spend(self, ops: int = 1) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(self.next_at, now) + ops * self.interval
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"storage_after": None, "mods_after_id": 0, "pass": {}}
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _owner_mod_id(object_key: str) -> Optional[int]:
+    """The mod id in a mods/{id}/ or versions/{id}/ key."""
+    parts = object_key.split("/", 2)
+    if len(parts) == 3 and parts[0] in ("mods", "versions") and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+def find_orphans(db: Session, objects: list) -> list:
+    """The objects in one listing batch that no database row references."""
+    keys = [info.key for info in objects]
+    owner_ids = {mod_id for mod_id in map(_owner_mod_id, keys) if mod_id is not None}
+    existing = {mod_id for (mod_id,) in db.query(Mod.id).filter(Mod.id.in_(list(owner_ids))).all()} if owner_ids else set()
+    current_files = {filename for (filename,) in db.query(Mod.filename).filter(Mod.filename.in_(keys)).all()}
+    image_owner_ids = {_owner_mod_id(key) for key in keys if key.startswith("mods/") and "/images/" in key} - {None}
+    # Originals, and the directories their variants are stored in
+    images = set()
+    if image_owner_ids:
+        for (object_key,) in db.query(ModImage.object_key).filter(ModImage.mod_id.in_(list(image_owner_ids))).all():
+            images.update((object_key, os.path.splitext(object_key)[0]))
+    orphans = []
+    for info in objects:
+        if info.key in current_files or info.key in images or info.key.rsplit("/", 1)[0] in images:
+            continue
+        # A version stays as long as its mod does; a mod's replaced or never-committed file does not
+        if info.key.startswith("versions/") and _owner_mod_id(info.key) in existing:
+            continue
+        orphans.append(info)
+    return orphans
+
+
+def reconcile_storage_batch(db: Session, checkpoint: dict, budget: Budget, dry_run: bool) -> Counter:
+    """Examine the next RECONCILE_BATCH_SIZE stored objects. Returns counts for the report."""
+    from storage import backend, delete_file_from_storage
+
+    report = Counter()
+    objects = []
+    for info in backend.list_objects(start_after=checkpoint["storage_after"]):
+        budget.spend()
+        objects.append(info)
+        if len(objects) >= settings.RECONCILE_BATCH_SIZE:
+            break
+    if not objects:
+        checkpoint["storage_after"] = None
+        report["storage_pass_complete"] = 1
+        return report
+
+    grace_cutoff = datetime.utcnow() - timedelta(hours=settings.RECONCILE_GRACE_HOURS)
+    report["objects"] += len(objects)
+    for info in find_orphans(db, objects):
+        report["orphans"] += 1
+        report["orphan_bytes"] += info.size
+        if info.last_modified > grace_cutoff:
+            report["orphans_in_grace"] += 1
+            logger.info(f"Orphaned object {info.key} is within the grace period; kept for now.")
+            continue
+        if dry_run:
+            logger.warning(f"Orphaned object {info.key} ({info.size} bytes, modified {info.last_modified}) would be deleted.")
+            continue
+        budget.spend()
+        if delete_file_from_storage(info.key):
+            db.query(ArchiveEntry).filter(ArchiveEntry.object_key == info.key).delete(synchronize_session=False)
+            db.query(StoredObject).filter(StoredObject.object_key == info.key).delete(synchronize_session=False)
+            report["orphans_deleted"] += 1
+            logger.warning(f"Deleted orphaned object {info.key} ({info.size} bytes, modified {info.last_modified}).")
+        else:
+            report["errors"] += 1
+    db.commit()
+    checkpoint["storage_after"] = objects[-1].key
+    return report
+
+
+def reconcile_mods_batch(db: Session, checkpoint: dict, budget: Budget) -> Counter:
+    """Check that the next RECONCILE_BATCH_SIZE mods' files exist. Returns counts for the report."""
+    from storage import backend
+
+    report = Counter()
+    mods = (
+        db.query(Mod.id, Mod.filename, Mod.created_at)
+        .filter(Mod.id > checkpoint["mods_after_id"])
+        .order_by(Mod.id)
+        .limit(settings.RECONCILE_BATCH_SIZE)
+        .all()
+    )
+    if not mods:
+        checkpoint["mods_after_id"] = 0
+        report["mods_pass_complete"] = 1
+        return report
+
+    grace_cutoff = datetime.utcnow() - timedelta(hours=settings.RECONCILE_GRACE_HOURS)
+    for mod_id, filename, created_at in mods:
+        report["mods"] += 1
+        if filename == "PENDING_UPLOAD":
+            # A create_mod that committed the placeholder but never its file
+            if created_at and created_at < grace_cutoff:
+                report["dangling"] += 1
+                logger.warning(f"Mod {mod_id} never finished its upload (created {created_at}).")
+            continue
+        if not filename or filename.startswith(UNSTORED_PREFIXES):
+            continue
+        budget.spend()
+        try:
+            found = backend.exists(filename)
+        except Exception as e:
+            report["errors"] += 1
+            logger.error(f"Could not check {filename} of mod {mod_id}: {e}")
+            continue
+        if not found:
+            report["dangling"] += 1
+            logger.warning(f"Mod {mod_id} points to missing object {filename}.")
+    checkpoint["mods_after_id"] = mods[-1][0]
+    return report
+
+
+def reconcile_step(db: Session, checkpoint: dict, budget: Budget, dry_run: bool = False) -> Counter:
+    """One storage batch and one mods batch. Pass totals accumulate in checkpoint["pass"]."""
+    totals = Counter(checkpoint.get("pass", {}))
+    report = Counter()
+    # A walk that finished its pass waits for the other one
+    if not totals["storage_pass_complete"]:
+        report.update(reconcile_storage_batch(db, checkpoint, budget, dry_run))
+    if not totals["mods_pass_complete"]:
+        report.update(reconcile_mods_batch(db, checkpoint, budget))
+    totals.update(report)
+    checkpoint["pass"] = dict(totals)
+    return report
+
+
+def run(db: Session, dry_run: bool = False, loop: bool = False) -> dict:
+    """Reconcile until both walks have completed a pass (forever with `loop`). Returns the pass totals."""
+    checkpoint = load_checkpoint(settings.RECONCILE_CHECKPOINT_PATH)
+    budget = Budget(settings.RECONCILE_MAX_OPS_PER_SECOND)
+    while True:
+        reconcile_step(db, checkpoint, budget, dry_run)
+        totals = checkpoint["pass"]
+        if totals.get("storage_pass_complete") and totals.get("mods_pass_complete"):
+            summary = {key: value for key, value in totals.items() if not key.endswith("_pass_complete")}
+            logger.info(f"Reconciliation pass finished: {summary}")
+            checkpoint["pass"] = {}
+            save_checkpoint(settings.RECONCILE_CHECKPOINT_PATH, checkpoint)
+            if not loop:
+                return summary
+            time.sleep(settings.RECONCILE_PASS_INTERVAL_SECONDS)
+        else:
+            save_checkpoint(settings.RECONCILE_CHECKPOINT_PATH, checkpoint)
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from db_config import SessionLocal
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Find and remove stored objects the database no longer references.")
+    parser.add_argument("--dry-run", action="store_true", help="Report orphans without deleting them")
+    parser.add_argument("--loop", action="store_true", help="Keep reconciling, one pass every RECONCILE_PASS_INTERVAL_SECONDS")
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    db = SessionLocal()
+    try:
+        print(run(db, dry_run=args.dry_run, loop=args.loop))
+    finally:
+        db.close()
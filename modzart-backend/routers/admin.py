@@ -0,0 +1,48 @@
+# routers/admin.py
+import io
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from db_config import get_db
+from models import User
+from security import get_current_admin
+from bulk_import import IMPORT_FORMATS, detect_format, import_mods
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+)
+
+@router.post("/mods/import")
+async def bulk_import_mods(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """Bulk import mod metadata from an NDJSON or CSV file"""
+    import_format = format or detect_format(file.filename)
+    if import_format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format. Available: {', '.join(IMPORT_FORMATS)}"
+        )
+
+    logger.info(f"Bulk import of '{file.filename}' ({import_format}) started by '{current_user.username}'.")
+    # The upload is already spooled to disk; read it as text without loading it into memory
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    try:
+        return await run_in_threadpool(import_mods, db, stream, import_format, dry_run)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Import file must be UTF-8 encoded"
+        )
+    finally:
+        stream.detach()
@@ -0,0 +1,28 @@
+# routers/common.py
+from typing import List
+from fastapi import HTTPException, status
+
+from config import settings
+
+
+def parse_id_list(ids: str, max_ids: int = settings.MAX_BATCH_IDS) -> List[int]:
+    """Parse a comma-separated id list, dropping duplicates but keeping request order"""
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma-separated list of integers"
+        )
+    unique_ids = list(dict.fromkeys(parsed))
+    if not unique_ids:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="At least one id is required"
+        )
+    if len(unique_ids) > max_ids:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {max_ids} ids can be requested at once"
+        )
+    return unique_ids
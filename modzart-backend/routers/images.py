@@ -0,0 +1,217 @@
+# routers/images.py
+import os
+import uuid
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, status, UploadFile, File
+from fastapi.responses import RedirectResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from db_config import get_db, get_read_db
+from models import User, Mod, ModImage
+from schemas import ModImage as ModImageSchema, ImageVariant
+from config import settings
+from download_counter import download_counter
+from security import get_current_user
+import storage
+from image_variants import (
+    image_processor, PILLOW_AVAILABLE, SOURCE_FORMATS, VARIANT_FORMATS, SNIFF_BYTES,
+    sniff_format, variant_widths, variant_formats, widths_for, cache_control, delete_image_files
+)
+
+logger = logging.getLogger(__name__)
+
+# The presigned URL a redirect points to is reused for up to half its lifetime
+REDIRECT_EXPIRATION = 3600
+REDIRECT_MAX_AGE = 600
+
+router = APIRouter(
+    prefix="/mods",
+    tags=["images"],
+)
+
+def image_response(image: ModImage) -> ModImageSchema:
+    response = ModImageSchema.model_validate(image)
+    base_url = f"/mods/{image.mod_id}/images/{image.id}"
+    response.variants = [
+        ImageVariant(width=width, format=variant_format, url=f"{base_url}/{width}.{variant_format}")
+        for width in widths_for(image.width)
+        for variant_format in variant_formats()
+    ]
+    return response
+
+def get_owned_mod(db: Session, mod_id: int, current_user: User) -> Mod:
+    db_mod = db.query(Mod).filter(Mod.id == mod_id).first()
+    if db_mod is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mod not found"
+        )
+    if db_mod.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to change this mod's images"
+        )
+    return db_mod
+
+@router.post("/{mod_id}/images", response_model=ModImageSchema, status_code=status.HTTP_201_CREATED)
+async def upload_image(
+    mod_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Add a screenshot (PNG, JPEG or WebP) to a mod's gallery"""
+    if not PILLOW_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Image uploads are not available on this server."
+        )
+    get_owned_mod(db, mod_id, current_user)
+    image_count = db.query(func.count(ModImage.id)).filter(ModImage.mod_id == mod_id).scalar()
+    if image_count >= settings.IMAGE_MAX_PER_MOD:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A mod can have at most {settings.IMAGE_MAX_PER_MOD} images."
+        )
+
+    header = await file.read(SNIFF_BYTES)
+    await file.seek(0)
+    if sniff_format(header) is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Unsupported image type. Allowed: png, jpeg, webp"
+        )
+
+    temp_file_path = await storage.save_upload_file_temp(file)
+    object_key = None
+    try:
+        try:
+            image_format, width, height = await image_processor.probe(temp_file_path)
+        except BrokenProcessPool:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Could not process the image."
+            )
+        except Exception as e:
+            logger.warning(f"Rejected image upload for mod {mod_id}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Could not read the image: {e}"
+            )
+
+        content_type, extension = SOURCE_FORMATS[image_format]
+        object_key = await storage.run_in_io_pool(
+            storage.upload_file_to_storage, temp_file_path, f"mods/{mod_id}/images/{uuid.uuid4().hex}{extension}",
+            content_type
+        )
+        db_image = ModImage(
+            mod_id=mod_id,
+            object_key=object_key,
+            content_type=content_type,
+            width=width,
+            height=height,
+            size=os.path.getsize(temp_file_path),
+        )
+        db.add(db_image)
+        db.commit()
+        db.refresh(db_image)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to add image to mod {mod_id}: {e}", exc_info=True)
+        if object_key:
+            await storage.run_in_io_pool(storage.delete_file_from_storage, object_key)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to add image."
+        )
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+    logger.info(f"Added {width}x{height} {image_format} image {db_image.id} to mod {mod_id}.")
+    return image_response(db_image)
+
+@router.get("/{mod_id}/images", response_model=List[ModImageSchema])
+async def list_images(
+    mod_id: int,
+    db: Session = Depends(get_read_db)
+):
+    """List a mod's gallery images with the URLs of their variants"""
+    images = db.query(ModImage).filter(ModImage.mod_id == mod_id).order_by(ModImage.id).all()
+    return [image_response(image) for image in images]
+
+@router.get("/{mod_id}/images/{image_id}/{variant}")
+async def get_image_variant(
+    mod_id: int,
+    image_id: int,
+    variant: str,
+    request: Request,
+    db: Session = Depends(get_read_db)
+):
+    """Serve a resized variant of a gallery image, e.g. 640.webp; rendered on its first request"""
+    width, _, variant_format = variant.partition(".")
+    if not width.isdigit() or int(width) not in variant_widths() or variant_format not in variant_formats():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown variant. Widths: {settings.IMAGE_VARIANT_WIDTHS}; formats: {settings.IMAGE_VARIANT_FORMATS}"
+        )
+    db_image = db.query(ModImage).filter(ModImage.id == image_id, ModImage.mod_id == mod_id).first()
+    if db_image is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+
+    try:
+        object_key = await image_processor.ensure_variant(db_image.object_key, int(width), variant_format)
+    except FileNotFoundError:
+        logger.error(f"Original {db_image.object_key} of image {image_id} is missing from storage.")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    except Exception as e:
+        logger.error(f"Failed to render {variant} of image {image_id}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Could not render the image."
+        )
+
+    # Keeps the variant in (or brings it back to) the hot storage tier
+    download_counter.touch(object_key)
+    if storage.STORAGE_MODE == "local" or storage.download_cache:
+        response = await storage.run_in_io_pool(storage.open_download, object_key, request.headers.get("range"))
+        response.headers["Content-Type"] = VARIANT_FORMATS[variant_format][1]
+        response.headers["Cache-Control"] = cache_control()
+        return response
+    # S3 serves the variant with the Content-Type and Cache-Control stored with it
+    url = await storage.run_in_io_pool(storage.generate_download_url, object_key, REDIRECT_EXPIRATION)
+    return RedirectResponse(url, headers={"Cache-Control": f"public, max-age={REDIRECT_MAX_AGE}"})
+
+@router.delete("/{mod_id}/images/{image_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_image(
+    mod_id: int,
+    image_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Remove an image from a mod's gallery; the original and its variants are deleted in the background"""
+    get_owned_mod(db, mod_id, current_user)
+    db_image = db.query(ModImage).filter(ModImage.id == image_id, ModImage.mod_id == mod_id).first()
+    if db_image is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    object_key = db_image.object_key
+    db.delete(db_image)
+    db.commit()
+    background_tasks.add_task(delete_image_files, object_key)
+    logger.info(f"Deleted image {image_id} of mod {mod_id}.")
+    return None
@@ -1,16 +1,35 @@
 # routers/mods.py
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Body
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Form, Body, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
+import os
+import asyncio
 import logging
 from pydantic import BaseModel
 from datetime import datetime
 
-from db_config import get_db
-from models import User, Mod
-from schemas import ModCreate, Mod as ModSchema, ModUpdate
+from db_config import get_db, get_read_db
+from models import User, Mod, ArchiveEntry, StoredObject, ModImage
+from schemas import (
+    ModCreate, Mod as ModSchema, ModUpdate, ModBatch, TrendingMod, ModChangeFeed, ManifestEntry, ManifestSearchHit,
+    BundleRequest
+)
+from config import settings
+from leaderboard import leaderboard
+from download_counter import download_counter
+from user_stats import increment_user_stats
+from change_feed import DELETE, record_mod_change, read_changes
 from security import get_current_user
-from storage import handle_mod_upload, generate_download_url, delete_file_from_storage
+from storage import (
+    handle_mod_upload, generate_download_url, delete_file_from_storage, delete_mod_files, mod_storage_prefixes,
+    find_version_object, run_in_io_pool, backend
+)
+from routers.common import parse_id_list
+from catalog_export import EXPORT_FORMATS, export_query, stream_export
+from zip_bundle import ZipBundle, BundleEntry
+import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +78,9 @@ async def create_project(
         )
         
         db.add(db_mod)
+        db.flush()
+        record_mod_change(db, db_mod.id)
+        increment_user_stats(db, current_user.id, mods=1)
         db.commit()
         db.refresh(db_mod)
         
@@ -104,9 +126,12 @@ async def create_mod(
 
     s3_object_key = None
     try:
-        s3_object_key = await handle_mod_upload(file, db_mod.id)
+        s3_object_key = await handle_mod_upload(file, db_mod.id, db=db)
         db_mod.filename = s3_object_key
-        db.commit()
+        record_mod_change(db, db_mod.id)
+        increment_user_stats(db, current_user.id, mods=1)
+        with tracing.span("db.commit"):
+            db.commit()
         db.refresh(db_mod)
         logger.info(f"Successfully created mod '{title}' (ID: {db_mod.id}) by user '{current_user.username}'. S3 Key: {s3_object_key}")
         return db_mod
@@ -150,13 +175,16 @@ async def upload_version(
             detail="Not authorized to add versions to this mod"
         )
     
+    s3_object_key = None
     try:
         # Process the file upload
         original_filename = file.filename or f"v{version_number}"
         file_path = f"versions/{mod_id}/{version_number}/{original_filename}"
         
         # Use existing storage utility to handle the upload
-        s3_object_key = await handle_mod_upload(file, mod_id, file_path=file_path)
+        s3_object_key = await handle_mod_upload(file, mod_id, file_path=file_path, db=db)
+        # Stores the version's archive manifest
+        db.commit()
         
         # Return success response
         logger.info(f"Successfully uploaded version {version_number} for mod {mod_id} by user '{current_user.username}'")
@@ -171,8 +199,18 @@ async def upload_version(
             }
         }
         
+    except HTTPException as http_exc:
+        # e.g. validate_upload refusing the archive (400/415): the client's fault, not a server error
+        db.rollback()
+        logger.warning(f"HTTP error during version upload (mod_id: {mod_id}): {http_exc.detail}")
+        raise http_exc
     except Exception as e:
+        # Drops the manifest rows handle_mod_upload added to the session
+        db.rollback()
         logger.error(f"Error uploading version for mod {mod_id}: {str(e)}", exc_info=True)
+        if s3_object_key:
+            logger.warning(f"Attempting to clean up partially uploaded version file: {s3_object_key}")
+            delete_file_from_storage(s3_object_key)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to upload version: {str(e)}"
@@ -181,7 +219,7 @@ async def upload_version(
 @router.get("/{mod_id}/versions", status_code=status.HTTP_200_OK)
 async def get_versions(
     mod_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all versions for a mod"""
     # Check if the mod exists
@@ -202,7 +240,7 @@ async def read_mods(
     limit: int = 100,
     search: Optional[str] = None,
     user_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """List all mods with optional search and filtering"""
     query = db.query(Mod)
@@ -219,8 +257,107 @@ async def read_mods(
     mods = query.order_by(Mod.created_at.desc()).offset(skip).limit(limit).all()
     return mods
 
+@router.get("/export")
+async def export_mods(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    search: Optional[str] = None,
+    user_id: Optional[int] = None,
+    updated_since: Optional[datetime] = Query(None, description="Only mods updated at or after this time"),
+    db: Session = Depends(get_read_db)
+):
+    """Stream the whole mod catalog (optionally filtered) as NDJSON or CSV"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format. Available: {', '.join(EXPORT_FORMATS)}"
+        )
+    stmt = export_query(search=search, user_id=user_id, updated_since=updated_since)
+    # The session dependency stays open until the response has been fully streamed
+    return StreamingResponse(
+        stream_export(db, stmt, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="mods-export.{format}"'}
+    )
+
+@router.get("/changes", response_model=ModChangeFeed)
+async def read_mod_changes(
+    since: int = Query(0, ge=0, description="next_cursor from the previous page; 0 for the full catalog"),
+    limit: int = Query(500, ge=1),
+    # The primary: a replica lagging past CHANGE_FEED_SETTLE_SECONDS could return a change
+    # without an earlier-numbered one that committed later, and the cursor would skip it
+    db: Session = Depends(get_db)
+):
+    """List mods created, updated or deleted after a cursor, in commit order"""
+    return read_changes(db, since, min(limit, settings.CHANGE_FEED_MAX_LIMIT))
+
+@router.get("/manifest/search", response_model=List[ManifestSearchHit])
+async def search_manifests(
+    filename: str = Query(..., min_length=1, description="File name inside archives, e.g. x64e.rpf"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """Find mods whose archives contain a file with this name (case-insensitive), for conflict checks"""
+    return (
+        db.query(ArchiveEntry)
+        .filter(ArchiveEntry.name == filename.strip().replace("\\", "/").rsplit("/", 1)[-1].lower())
+        .order_by(ArchiveEntry.name, ArchiveEntry.mod_id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+@router.get("/trending", response_model=List[TrendingMod])
+async def read_trending_mods(
+    window: str = Query("24h", description="Decay window, e.g. 24h or 7d"),
+    limit: int = Query(20, ge=1),
+    db: Session = Depends(get_read_db)
+):
+    """List the most popular mods by time-decayed download score"""
+    if window not in leaderboard.windows:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown window. Available: {', '.join(leaderboard.windows)}"
+        )
+    # A Redis round trip for the shared leaderboard; kept off the event loop
+    ranking = await run_in_io_pool(leaderboard.top, window, min(limit, settings.TRENDING_MAX_LIMIT))
+    if not ranking:
+        return []
+
+    mods = (
+        db.query(Mod)
+        .options(joinedload(Mod.uploader))
+        .filter(Mod.id.in_([mod_id for mod_id, _ in ranking]))
+        .all()
+    )
+    mods_by_id = {mod.id: mod for mod in mods}
+    return [
+        {**ModSchema.model_validate(mods_by_id[mod_id]).model_dump(), "score": score}
+        for mod_id, score in ranking
+        if mod_id in mods_by_id
+    ]
+
+@router.get("/batch", response_model=ModBatch)
+async def read_mods_batch(
+    ids: str = Query(..., description="Comma-separated mod ids"),
+    db: Session = Depends(get_read_db)
+):
+    """Get several mods by ID in one request, in request order"""
+    mod_ids = parse_id_list(ids)
+    mods = (
+        db.query(Mod)
+        .options(joinedload(Mod.uploader))
+        .filter(Mod.id.in_(mod_ids))
+        .all()
+    )
+    mods_by_id = {mod.id: mod for mod in mods}
+    return {
+        "items": [mods_by_id[mod_id] for mod_id in mod_ids if mod_id in mods_by_id],
+        "missing": [mod_id for mod_id in mod_ids if mod_id not in mods_by_id],
+    }
+
 @router.get("/{mod_id}", response_model=ModSchema)
-async def read_mod(mod_id: int, db: Session = Depends(get_db)):
+async def read_mod(mod_id: int, db: Session = Depends(get_read_db)):
     """Get a specific mod by ID"""
     db_mod = db.query(Mod).filter(Mod.id == mod_id).first()
     if db_mod is None:
@@ -230,6 +367,28 @@ async def read_mod(mod_id: int, db: Session = Depends(get_db)):
         )
     return db_mod
 
+@router.get("/{mod_id}/manifest", response_model=List[ManifestEntry])
+async def get_manifest(
+    mod_id: int,
+    version: Optional[str] = Query(None, description="Version number; defaults to the mod's main file"),
+    skip: int = 0,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_read_db)
+):
+    """List the files inside a mod's archive without downloading it"""
+    db_mod = db.query(Mod).filter(Mod.id == mod_id).first()
+    if db_mod is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Mod not found"
+        )
+    query = db.query(ArchiveEntry).filter(ArchiveEntry.mod_id == mod_id)
+    if version:
+        query = query.filter(ArchiveEntry.object_key.startswith(f"versions/{mod_id}/{version}/", autoescape=True))
+    else:
+        query = query.filter(ArchiveEntry.object_key == db_mod.filename)
+    return query.order_by(ArchiveEntry.object_key, ArchiveEntry.path).offset(skip).limit(limit).all()
+
 @router.put("/{mod_id}", response_model=ModSchema)
 async def update_mod(
     mod_id: int,
@@ -255,6 +414,7 @@ async def update_mod(
         setattr(db_mod, key, value)
 
     try:
+        record_mod_change(db, mod_id)
         db.commit()
         db.refresh(db_mod)
         logger.info(f"Updated mod {mod_id} details by user '{current_user.username}'.")
@@ -270,10 +430,11 @@ async def update_mod(
 @router.delete("/{mod_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_mod(
     mod_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete a mod and its associated file from storage"""
+    """Delete a mod; its file and versions are removed from storage in the background"""
     db_mod = db.query(Mod).filter(Mod.id == mod_id).first()
     if db_mod is None:
         raise HTTPException(
@@ -287,54 +448,48 @@ async def delete_mod(
         )
 
     s3_object_key = db_mod.filename
-    delete_succeeded = True
+    try:
+        increment_user_stats(db, db_mod.user_id, mods=-1, downloads=-(db_mod.downloads or 0))
+        record_mod_change(db, mod_id, DELETE)
+        # Also covered by ON DELETE CASCADE, which SQLite only enforces with foreign keys enabled
+        db.query(ArchiveEntry).filter(ArchiveEntry.mod_id == mod_id).delete(synchronize_session=False)
+        db.query(ModImage).filter(ModImage.mod_id == mod_id).delete(synchronize_session=False)
+        stored_keys = [StoredObject.object_key.startswith(prefix) for prefix in mod_storage_prefixes(mod_id)]
+        db.query(StoredObject).filter(
+            or_(StoredObject.object_key == s3_object_key, *stored_keys)
+        ).delete(synchronize_session=False)
+        db.delete(db_mod)
+        db.commit()
+        logger.info(f"Successfully deleted mod {mod_id} from database.")
+    except Exception as db_exc:
+        db.rollback()
+        logger.error(f"Database error during mod deletion (mod_id: {mod_id}): {db_exc}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete mod from database."
+        )
 
-    if s3_object_key and s3_object_key != "PENDING_UPLOAD":
-        logger.info(f"Attempting S3 deletion for key: {s3_object_key} (mod_id: {mod_id})")
-        try:
-            s3_deleted = delete_file_from_storage(s3_object_key)
-            if not s3_deleted:
-                delete_succeeded = False
-                logger.error(f"Failed to delete S3 object {s3_object_key} for mod {mod_id}. Aborting database deletion.")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Failed to delete file from storage. Mod deletion aborted."
-                )
-            else:
-                logger.info(f"S3 deletion successful (or file already gone) for key: {s3_object_key}")
-
-        except Exception as s3_exc:
-            delete_succeeded = False
-            logger.error(f"Error occurred during S3 deletion for key {s3_object_key}: {s3_exc}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error deleting file from storage: {s3_exc}. Mod deletion aborted."
-            )
+    if s3_object_key and s3_object_key not in ("PENDING_UPLOAD", "NO_FILE") and not s3_object_key.startswith("project:"):
+        # The file and every version are deleted after the response, in batches
+        background_tasks.add_task(delete_mod_files, mod_id, s3_object_key)
     else:
-        logger.warning(f"No valid S3 object key found for mod {mod_id} (Filename: {s3_object_key}). Skipping S3 deletion.")
+        logger.warning(f"No valid S3 object key found for mod {mod_id} (Filename: {s3_object_key}). Deleting its prefixes only.")
+        background_tasks.add_task(delete_mod_files, mod_id)
 
-    if delete_succeeded:
-        try:
-            db.delete(db_mod)
-            db.commit()
-            logger.info(f"Successfully deleted mod {mod_id} from database.")
-        except Exception as db_exc:
-            db.rollback()
-            logger.error(f"Database error during mod deletion (mod_id: {mod_id}) after storage cleanup: {db_exc}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to delete mod from database after attempting storage cleanup."
-            )
+    try:
+        await run_in_io_pool(leaderboard.remove, mod_id)
+    except Exception as e:
+        logger.error(f"Failed to remove mod {mod_id} from trending leaderboard: {e}", exc_info=True)
     return None
 
 @router.get("/{mod_id}/download", response_model=dict)
 async def download_mod(
     mod_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get a temporary presigned download URL for a mod file"""
     db_mod = db.query(Mod).filter(Mod.id == mod_id).first()
-    if db_mod is None or not db_mod.filename or db_mod.filename == "PENDING_UPLOAD":
+    if db_mod is None or not db_mod.filename or db_mod.filename in ("PENDING_UPLOAD", "NO_FILE"):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Mod not found or file reference missing"
@@ -344,16 +499,106 @@ async def download_mod(
 
     try:
         download_url = generate_download_url(s3_object_key)
-        db_mod.downloads = (db_mod.downloads or 0) + 1
-        db.commit()
-        logger.info(f"Generated download URL for mod {mod_id}. New download count: {db_mod.downloads}")
+        # Counted in memory and written in batches by the download counter
+        download_counter.touch(s3_object_key)
+        download_counter.add(mod_id, db_mod.user_id)
+        logger.info(f"Generated download URL for mod {mod_id}.")
+        try:
+            leaderboard.record_download(mod_id)
+        except Exception as e:
+            logger.error(f"Failed to record download of mod {mod_id} in trending leaderboard: {e}", exc_info=True)
         return {"download_url": download_url}
 
     except HTTPException as http_exc:
-        db.rollback()
         logger.error(f"Failed to generate download URL for mod {mod_id} (key: {s3_object_key}): {http_exc.detail}")
         raise http_exc
     except Exception as e:
-        db.rollback()
         logger.error(f"Unexpected error generating download URL for mod {mod_id} (key: {s3_object_key}): {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Failed to generate download URL.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to generate download URL.")
+
+def bundle_entry(db_mod: Mod, version_number: Optional[str]) -> BundleEntry:
+    """Locate and size the object of one bundle item. Blocking."""
+    if version_number is None:
+        object_key = db_mod.filename
+        if not object_key or object_key.startswith(("PENDING_UPLOAD", "project:", "NO_FILE")):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Mod {db_mod.id} has no file to download"
+            )
+        name = f"{db_mod.id}/{os.path.basename(object_key)}"
+    else:
+        object_key = find_version_object(db_mod.id, version_number)
+        if object_key is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Version {version_number} of mod {db_mod.id} not found"
+            )
+        name = f"{db_mod.id}/{version_number}/{os.path.basename(object_key)}"
+    try:
+        return BundleEntry(name, object_key, backend.object_size(object_key))
+    except FileNotFoundError:
+        logger.error(f"Object {object_key} of mod {db_mod.id} is missing from storage.")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"File of mod {db_mod.id} not found"
+        )
+
+@router.post("/bundle")
+async def download_bundle(
+    bundle: BundleRequest,
+    db: Session = Depends(get_read_db)
+):
+    """Download several mods, or given versions of them, as one zip streamed from storage"""
+    items = list(dict.fromkeys((item.mod_id, item.version) for item in bundle.items))
+    if not items:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="At least one item is required"
+        )
+    if len(items) > settings.MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {settings.MAX_BATCH_IDS} items can be bundled at once"
+        )
+    for _, version_number in items:
+        # Versions become part of a storage prefix
+        if version_number is not None and (not version_number or "/" in version_number or version_number in (".", "..")):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid version number: {version_number!r}"
+            )
+
+    mod_ids = list(dict.fromkeys(mod_id for mod_id, _ in items))
+    mods_by_id = {mod.id: mod for mod in db.query(Mod).filter(Mod.id.in_(mod_ids)).all()}
+    missing = [mod_id for mod_id in mod_ids if mod_id not in mods_by_id]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Mods not found: {', '.join(map(str, missing))}"
+        )
+
+    # Sized up front, concurrently (a HEAD request per object on S3), so the length is known before streaming
+    entries = await asyncio.gather(*(
+        run_in_io_pool(bundle_entry, mods_by_id[mod_id], version_number) for mod_id, version_number in items
+    ))
+    zip_bundle = ZipBundle(list(entries))
+
+    for mod_id in mod_ids:
+        download_counter.add(mod_id, mods_by_id[mod_id].user_id)
+        try:
+            leaderboard.record_download(mod_id)
+        except Exception as e:
+            logger.error(f"Failed to record download of mod {mod_id} in trending leaderboard: {e}", exc_info=True)
+    for entry in entries:
+        download_counter.touch(entry.object_key)
+    logger.info(f"Streaming bundle of {len(entries)} file(s), {zip_bundle.content_length} bytes.")
+
+    return StreamingResponse(
+        # A sync iterator, so each blocking read runs in the threadpool
+        zip_bundle.stream(backend.open_object),
+        media_type="application/zip",
+        headers={
+            "Content-Length": str(zip_bundle.content_length),
+            "Content-Disposition": 'attachment; filename="modpack.zip"',
+        },
+    )
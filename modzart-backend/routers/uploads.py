@@ -0,0 +1,63 @@
+# routers/uploads.py
+import json
+import time
+import logging
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+
+from config import settings
+from upload_progress import broker, make_event, UPLOAD_ID_PATTERN, TERMINAL_PHASES
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["uploads"],
+)
+
+async def progress_events(upload_id: str, request: Request):
+    """SSE frames for one upload until it completes, fails, goes idle or turns out to be unknown."""
+    async with broker.subscribe(upload_id) as subscription:
+        idle_deadline = time.monotonic() + settings.UPLOAD_PROGRESS_IDLE_SECONDS
+        unknown_deadline = time.monotonic() + settings.UPLOAD_PROGRESS_UNKNOWN_SECONDS
+        seen_event = False
+        # Reconnect quickly if the connection drops mid-upload
+        yield "retry: 3000\n\n"
+        while True:
+            timeout = settings.UPLOAD_PROGRESS_KEEPALIVE_SECONDS
+            if not seen_event:
+                timeout = max(min(timeout, unknown_deadline - time.monotonic()), 0)
+            event = await subscription.get(timeout)
+            if event is None:
+                if await request.is_disconnected() or time.monotonic() > idle_deadline:
+                    return
+                if not seen_event and time.monotonic() >= unknown_deadline:
+                    # Never started, or handled by a worker whose events this one cannot see
+                    # (no REDIS_URL); tell the client rather than sending keepalives until idle
+                    event = make_event(upload_id, "unknown")
+                    yield f"event: unknown\ndata: {json.dumps(event)}\n\n"
+                    return
+                # Keeps proxies from closing a quiet connection, e.g. during a VirusTotal wait
+                yield ": keepalive\n\n"
+                continue
+            seen_event = True
+            idle_deadline = time.monotonic() + settings.UPLOAD_PROGRESS_IDLE_SECONDS
+            yield f"event: {event['phase']}\ndata: {json.dumps(event)}\n\n"
+            if event["phase"] in TERMINAL_PHASES:
+                return
+
+@router.get("/{upload_id}/events")
+async def upload_events(upload_id: str, request: Request):
+    """Stream the progress of an upload sent with the same X-Upload-Id header as server-sent events"""
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload id must be 16-64 letters, digits, '-' or '_' (e.g. a UUID)."
+        )
+    logger.info(f"Client subscribed to progress of upload {upload_id}.")
+    return StreamingResponse(
+        progress_events(upload_id, request),
+        media_type="text/event-stream",
+        # Disable proxy buffering so each event is delivered as it is published
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
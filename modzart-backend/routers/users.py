@@ -1,13 +1,15 @@
 # routers/users.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List
 from pydantic import BaseModel
 
-from db_config import get_db
+from db_config import get_db, get_read_db
 from models import User
-from schemas import UserCreate, User as UserSchema
+from schemas import UserCreate, User as UserSchema, UserBatch, UserStats
 from security import get_password_hash, get_current_user
+from routers.common import parse_id_list
+from user_stats import get_user_stats
 
 class UserUpdate(BaseModel):
     username: str
@@ -56,8 +58,21 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
     """Get current user profile"""
     return current_user
 
+@router.get("/batch", response_model=UserBatch)
+async def read_users_batch(
+    ids: str = Query(..., description="Comma-separated user ids"),
+    db: Session = Depends(get_read_db)
+):
+    """Get several users by ID in one request, in request order"""
+    user_ids = parse_id_list(ids)
+    users_by_id = {user.id: user for user in db.query(User).filter(User.id.in_(user_ids)).all()}
+    return {
+        "items": [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id],
+        "missing": [user_id for user_id in user_ids if user_id not in users_by_id],
+    }
+
 @router.get("/{user_id}", response_model=UserSchema)
-async def read_user(user_id: int, db: Session = Depends(get_db)):
+async def read_user(user_id: int, db: Session = Depends(get_read_db)):
     """Get user by ID"""
     db_user = db.query(User).filter(User.id == user_id).first()
     if db_user is None:
@@ -67,6 +82,16 @@ async def read_user(user_id: int, db: Session = Depends(get_db)):
         )
     return db_user
 
+@router.get("/{user_id}/stats", response_model=UserStats)
+async def read_user_stats(user_id: int, db: Session = Depends(get_read_db)):
+    """Get a user's mod count and total downloads"""
+    if db.get(User, user_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return get_user_stats(db, user_id)
+
 @router.put("/me", response_model=UserSchema)
 async def update_user_profile(
     user_update: UserUpdate,
@@ -18,6 +18,11 @@ class UserInDB(UserBase):
 class User(UserInDB):
     pass
 
+class UserStats(BaseModel):
+    user_id: int
+    mod_count: int
+    total_downloads: int
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -47,4 +52,65 @@ class ModInDB(ModBase):
         from_attributes = True
 
 class Mod(ModInDB):
-    uploader: User
\ No newline at end of file
+    uploader: User
+
+class TrendingMod(Mod):
+    score: float
+
+class ModChange(BaseModel):
+    cursor: int
+    mod_id: int
+    change_type: str  # "upsert" or "delete"
+    changed_at: datetime
+    mod: Optional[Mod] = None  # Current state; None for deletes
+
+class ModChangeFeed(BaseModel):
+    changes: List[ModChange]
+    next_cursor: int
+    has_more: bool
+
+class ManifestEntry(BaseModel):
+    path: str
+    size: int
+    compressed_size: int
+    crc32: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class ManifestSearchHit(ManifestEntry):
+    mod_id: int
+    object_key: str
+
+class ModBatch(BaseModel):
+    items: List[Mod]
+    missing: List[int]
+
+class UserBatch(BaseModel):
+    items: List[User]
+    missing: List[int]
+
+class ImageVariant(BaseModel):
+    width: int
+    format: str
+    url: str
+
+class ModImage(BaseModel):
+    id: int
+    mod_id: int
+    content_type: str
+    width: int
+    height: int
+    size: int
+    created_at: datetime
+    variants: List[ImageVariant] = []
+
+    class Config:
+        from_attributes = True
+
+class BundleItem(BaseModel):
+    mod_id: int
+    version: Optional[str] = None  # The mod's current file when not given
+
+class BundleRequest(BaseModel):
+    items: List[BundleItem]
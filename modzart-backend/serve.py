@@ -0,0 +1,119 @@
+# serve.py
+"""Production entry point: python serve.py
+
+Runs the API under gunicorn with uvicorn workers. Worker count is sized from the
+CPU count (override with WEB_CONCURRENCY), uvloop/httptools are used when they are
+installed, and workers are recycled after MAX_REQUESTS requests to contain memory growth.
+"""
+import importlib.util
+import logging
+import multiprocessing
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count() -> int:
+    """Number of worker processes to run."""
+    if settings.WEB_CONCURRENCY:
+        return max(settings.WEB_CONCURRENCY, 1)
+    workers = max(int(multiprocessing.cpu_count() * settings.WORKERS_PER_CORE), 2)
+    if settings.MAX_WORKERS:
+        workers = min(workers, settings.MAX_WORKERS)
+    return workers
+
+
+def check_shared_state(workers: int) -> None:
+    """Warn about state each worker keeps to itself when there is no Redis to share it."""
+    if workers > 1 and not settings.REDIS_URL:
+        logger.warning(
+            f"REDIS_URL is not set, so each of the {workers} workers keeps its own trending leaderboard "
+            "and upload progress broker: /mods/trending only ranks the downloads served by the worker that "
+            "answers, and an upload's progress events only reach subscribers on the worker receiving it. "
+            "Set REDIS_URL, or WEB_CONCURRENCY=1."
+        )
+
+
+def loop_implementation() -> str:
+    """Use uvloop when it is installed (it is not available on Windows)."""
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_implementation() -> str:
+    """Use the httptools parser when it is installed."""
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn is not available on Windows
+    BaseApplication = None
+else:
+    class ModzartWorker(UvicornWorker):
+        """Uvicorn worker with the fastest available event loop and HTTP parser."""
+        CONFIG_KWARGS = {
+            "loop": loop_implementation(),
+            "http": http_implementation(),
+            "lifespan": "on",
+        }
+
+    class ModzartApplication(BaseApplication):
+        """Embedded gunicorn application so the launcher needs no separate config file."""
+
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from main import app
+            return app
+
+
+def run():
+    """Start the production server."""
+    workers = worker_count()
+    logger.info(
+        f"Starting Modzart API with {workers} worker(s) on {settings.HOST}:{settings.PORT} "
+        f"(loop: {loop_implementation()}, http: {http_implementation()})"
+    )
+    check_shared_state(workers)
+
+    if BaseApplication is None:
+        import uvicorn
+        logger.warning("gunicorn is not installed; falling back to uvicorn workers without request-based recycling.")
+        uvicorn.run(
+            "main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=workers,
+            loop=loop_implementation(),
+            http=http_implementation(),
+            timeout_keep_alive=settings.KEEPALIVE,
+            log_config=None,
+        )
+        return
+
+    ModzartApplication({
+        "bind": f"{settings.HOST}:{settings.PORT}",
+        "workers": workers,
+        "worker_class": "serve.ModzartWorker",
+        "max_requests": settings.MAX_REQUESTS,
+        "max_requests_jitter": settings.MAX_REQUESTS_JITTER,
+        # Let in-flight uploads finish before a worker is killed on shutdown or recycle
+        "graceful_timeout": settings.GRACEFUL_TIMEOUT,
+        "timeout": settings.GRACEFUL_TIMEOUT,
+        "keepalive": settings.KEEPALIVE,
+    }).run()
+
+
+if __name__ == "__main__":
+    import logging.config
+    from main import LOGGING_CONFIG
+    logging.config.dictConfig(LOGGING_CONFIG)
+    run()
@@ -2,15 +2,22 @@
 import os
 import uuid
 import time
+import asyncio
 import logging
+import contextvars
 import aiofiles
-import boto3
-import requests
-import shutil
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import UploadFile, HTTPException, status
-from botocore.exceptions import ClientError
+from sqlalchemy.orm import Session
 from config import settings
-from fastapi.responses import FileResponse
+from storage_backends import create_backend
+from download_cache import DiskCache
+from file_responses import ranged_file_response
+import tracing
+from upload_validation import validate_upload
+from malware_scan import scanner_chain, CLEAN, MALICIOUS
+from archive_manifest import index_archive
+import upload_progress
 
 logger = logging.getLogger(__name__)
 
@@ -21,19 +28,56 @@ VIRUS_TOTAL_API_KEY = settings.VIRUS_TOTAL_API_KEY
 
 # Ensure directories exist
 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
-os.makedirs(LOCAL_STORAGE_PATH, exist_ok=True)
-
-# Initialize S3 client if using S3 mode
-s3_client = None
-if STORAGE_MODE == "s3" and settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
-    s3_client = boto3.client(
-        "s3",
-        region_name=settings.S3_REGION,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+
+# Storage backend selected from STORAGE_MODE; clients are created lazily on first use
+backend = create_backend(STORAGE_MODE)
+
+# Optional disk cache for remote backends; cached objects are served through /download
+download_cache = None
+if settings.DOWNLOAD_CACHE_ENABLED and STORAGE_MODE != "local":
+    download_cache = DiskCache(
+        settings.DOWNLOAD_CACHE_PATH,
+        settings.DOWNLOAD_CACHE_MAX_SIZE_MB * 1024 * 1024,
+        backend.fetch,
+        policy=settings.DOWNLOAD_CACHE_POLICY,
     )
-elif STORAGE_MODE == "s3":
-    s3_client = boto3.client("s3", region_name=settings.S3_REGION)
+
+# Bounded pool for blocking storage calls (boto3, file copies) so they never run on the event loop
+_io_executor = ThreadPoolExecutor(max_workers=settings.STORAGE_IO_THREADS, thread_name_prefix="storage-io")
+
+# Number of uploads currently being processed, used to drain on shutdown
+_inflight_uploads = 0
+
+
+def warm_up() -> None:
+    """Prime the storage backend so the first upload/download doesn't pay the setup cost."""
+    backend.warm_up()
+
+
+async def run_in_io_pool(func, *args):
+    """Run a blocking storage call in the storage I/O thread pool."""
+    loop = asyncio.get_running_loop()
+    # run_in_executor does not carry contextvars over; copy them so spans keep their parent
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_io_executor, context.run, func, *args)
+
+
+def shutdown_io_pool() -> None:
+    """Stop the storage I/O pool once pending calls have finished."""
+    _io_executor.shutdown(wait=True)
+
+
+async def drain_uploads(timeout: float) -> bool:
+    """Wait for in-flight uploads to finish. Returns False if the timeout expired first."""
+    deadline = time.monotonic() + timeout
+    if _inflight_uploads:
+        logger.info(f"Draining {_inflight_uploads} in-flight upload(s) (timeout: {timeout}s)...")
+    while _inflight_uploads:
+        if time.monotonic() >= deadline:
+            logger.warning(f"Shutdown timeout reached with {_inflight_uploads} upload(s) still in flight.")
+            return False
+        await asyncio.sleep(0.1)
+    return True
 
 
 async def save_upload_file_temp(upload_file: UploadFile) -> str:
@@ -41,9 +85,13 @@ async def save_upload_file_temp(upload_file: UploadFile) -> str:
     safe_filename = os.path.basename(upload_file.filename or "unknown_file")
     temp_file_path = os.path.join(TEMP_UPLOAD_DIR, f"{uuid.uuid4().hex}_{safe_filename}")
     try:
-        async with aiofiles.open(temp_file_path, 'wb') as out_file:
-            while content := await upload_file.read(1024 * 1024):
-                await out_file.write(content)
+        with tracing.span("upload.save_temp") as save_span:
+            size = 0
+            async with aiofiles.open(temp_file_path, 'wb') as out_file:
+                while content := await upload_file.read(1024 * 1024):
+                    size += len(content)
+                    await out_file.write(content)
+            save_span.set_attribute("upload.size_bytes", size)
         logger.info(f"Temporarily saved uploaded file to: {temp_file_path}")
         return temp_file_path
     except Exception as e:
@@ -54,11 +102,33 @@ async def save_upload_file_temp(upload_file: UploadFile) -> str:
 
 
 async def scan_file_for_viruses(file_path: str) -> bool:
-    """Scan file for viruses. In local mode, always returns True."""
+    """Scan file for viruses: the local scanner chain first, VirusTotal only for files it cannot decide."""
+    upload_progress.publish("scanning", engine="local")
+    with tracing.span("virus_scan.local"):
+        result = await scanner_chain.scan(file_path)
+    if result.verdict == MALICIOUS:
+        logger.warning(f"File rejected by local scanners: {file_path} {result.findings}")
+        return False
+    if result.verdict == CLEAN:
+        return True
+
     if STORAGE_MODE == "local" or not VIRUS_TOTAL_API_KEY:
-        logger.warning("Virus scanning disabled in local mode or no API key")
+        if settings.SCAN_UNDECIDED_POLICY == "reject":
+            logger.warning(f"Local scanners could not decide on {file_path} and VirusTotal is disabled; rejecting.")
+            return False
+        logger.warning("VirusTotal disabled in local mode or no API key; accepting file the local scanners passed")
         return True
 
+    # VirusTotal polling sleeps between attempts, so keep it off the event loop
+    upload_progress.publish("scanning", engine="virustotal", state="uploading")
+    return await asyncio.to_thread(virustotal_scan, file_path)
+
+
+def virustotal_scan(file_path: str) -> bool:
+    """Scan a file with VirusTotal, polling until the analysis completes. Blocking."""
+    # Only deployments with VirusTotal enabled pay for importing requests
+    import requests
+
     file_size = os.path.getsize(file_path)
     logger.info(f"Starting VirusTotal scan for file: {file_path} (Size: {file_size} bytes)")
 
@@ -72,7 +142,9 @@ async def scan_file_for_viruses(file_path: str) -> bool:
     try:
         with open(file_path, 'rb') as file:
             files = {'file': (os.path.basename(file_path), file)}
-            response = requests.post(vt_upload_url, files=files, headers=headers, timeout=120) # Increased timeout for upload
+            with tracing.span("HTTP POST", {"http.method": "POST", "http.url": vt_upload_url}, tracing.KIND_CLIENT) as http_span:
+                response = requests.post(vt_upload_url, files=files, headers=headers, timeout=120) # Increased timeout for upload
+                http_span.set_attribute("http.status_code", response.status_code)
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
 
             response_data = response.json()
@@ -101,10 +173,13 @@ async def scan_file_for_viruses(file_path: str) -> bool:
     for attempt in range(max_attempts):
         try:
             logger.info(f"Polling VirusTotal analysis (Attempt {attempt + 1}/{max_attempts}): {analysis_url}")
-            response = requests.get(analysis_url, headers=headers, timeout=30)
+            with tracing.span("HTTP GET", {"http.method": "GET", "http.url": analysis_url}, tracing.KIND_CLIENT) as http_span:
+                response = requests.get(analysis_url, headers=headers, timeout=30)
+                http_span.set_attribute("http.status_code", response.status_code)
             response.raise_for_status()
             analysis_data = response.json().get('data', {})
             status = analysis_data.get('attributes', {}).get('status')
+            upload_progress.publish("scanning", engine="virustotal", state=status, attempt=attempt + 1)
 
             if status == 'completed':
                 logger.info("VirusTotal analysis completed.")
@@ -123,7 +198,8 @@ async def scan_file_for_viruses(file_path: str) -> bool:
 
             elif status == 'queued' or status == 'inprogress':
                  logger.info(f"VirusTotal analysis status: {status}. Waiting {poll_interval_seconds}s...")
-                 time.sleep(poll_interval_seconds) # Wait before next poll
+                 with tracing.span("virus_scan.wait", {"wait.seconds": poll_interval_seconds}):
+                     time.sleep(poll_interval_seconds) # Wait before next poll
             else:
                  logger.error(f"VirusTotal analysis returned unexpected status: {status}. Data: {analysis_data}")
                  return False # Treat unexpected status as unsafe
@@ -140,107 +216,163 @@ async def scan_file_for_viruses(file_path: str) -> bool:
     return False # Failed to get result in time
 
 
-def upload_file_to_storage(file_path: str, object_name: str) -> str:
+def upload_file_to_storage(file_path: str, object_name: str, content_type: str = None, cache_control: str = None) -> str:
     """Upload file to storage (S3 or local). Returns the object key/path."""
-    if STORAGE_MODE == "local":
-        try:
-            # Create directory structure if it doesn't exist
-            final_path = os.path.join(LOCAL_STORAGE_PATH, object_name)
-            os.makedirs(os.path.dirname(final_path), exist_ok=True)
-            
-            # Copy file to local storage
-            shutil.copy2(file_path, final_path)
-            logger.info(f"Successfully copied file to local storage: {final_path}")
-            return object_name
-        except Exception as e:
-            logger.error(f"Failed to copy file to local storage: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Failed to store file locally.")
-    else:
-        if not s3_client:
-            raise HTTPException(status_code=500, detail="S3 storage not configured.")
-        try:
-            s3_client.upload_file(file_path, settings.S3_BUCKET_NAME, object_name)
-            logger.info(f"Successfully uploaded to S3: s3://{settings.S3_BUCKET_NAME}/{object_name}")
-            return object_name
-        except Exception as e:
-            logger.error(f"Failed to upload file to S3: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Failed to upload file to storage.")
+    with tracing.span("storage.store", {"storage.backend": backend.name, "storage.object": object_name}):
+        # Bound to the upload here; boto3 calls it from its own transfer threads
+        progress = upload_progress.byte_progress("storing", os.path.getsize(file_path))
+        object_key = backend.store(file_path, object_name, progress=progress, content_type=content_type,
+                                   cache_control=cache_control)
+    if download_cache:
+        download_cache.invalidate(object_key)
+    return object_key
 
 
 def delete_file_from_storage(object_name: str) -> bool:
     """Delete file from storage (S3 or local)."""
-    if STORAGE_MODE == "local":
-        try:
-            file_path = os.path.join(LOCAL_STORAGE_PATH, object_name)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                logger.info(f"Successfully deleted local file: {file_path}")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to delete local file: {e}", exc_info=True)
-            return False
-    else:
-        if not s3_client:
-            return False
-        try:
-            s3_client.delete_object(Bucket=settings.S3_BUCKET_NAME, Key=object_name)
-            return True
-        except Exception as e:
-            logger.error(f"Failed to delete from S3: {e}", exc_info=True)
-            return False
+    if download_cache:
+        download_cache.invalidate(object_name)
+    return backend.delete(object_name)
+
+
+def delete_prefix_from_storage(prefix: str) -> int:
+    """Delete every stored object under `prefix`. Returns the number deleted. Blocking."""
+    deleted = backend.delete_prefix(prefix)
+    if download_cache:
+        for object_name in deleted:
+            download_cache.invalidate(object_name)
+    return len(deleted)
+
+
+def mod_storage_prefixes(mod_id: int) -> list:
+    return [f"mods/{mod_id}/", f"versions/{mod_id}/"]
+
+
+async def delete_mod_files(mod_id: int, object_key: str = None) -> None:
+    """Delete a mod's file and all its versions from storage, retrying with backoff.
+
+    Runs as a background task once the mod row is gone, so the DELETE response
+    does not wait for it however many versions the mod has.
+    """
+    prefixes = mod_storage_prefixes(mod_id)
+    targets = [(delete_prefix_from_storage, prefix) for prefix in prefixes]
+    if object_key and not object_key.startswith(tuple(prefixes)):
+        # Stored outside the mod's prefix, e.g. by a bulk import
+        targets.insert(0, (delete_file_from_storage, object_key))
+
+    for func, target in targets:
+        for attempt in range(1, settings.STORAGE_DELETE_ATTEMPTS + 1):
+            try:
+                # delete_file_from_storage reports failure by returning False
+                if await run_in_io_pool(func, target) is False:
+                    raise RuntimeError("storage backend reported a failed delete")
+                break
+            except Exception as e:
+                if attempt == settings.STORAGE_DELETE_ATTEMPTS:
+                    logger.error(f"Giving up deleting {target} of mod {mod_id} after {attempt} attempts: {e}",
+                                 exc_info=True)
+                    break
+                delay = settings.STORAGE_DELETE_RETRY_SECONDS * 2 ** (attempt - 1)
+                logger.warning(f"Deleting {target} of mod {mod_id} failed (attempt {attempt}), retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+    logger.info(f"Finished deleting stored files of mod {mod_id}.")
+
+
+def find_version_object(mod_id: int, version_number: str):
+    """The object key of an uploaded version, or None. Blocking."""
+    for info in backend.list_objects(f"versions/{mod_id}/{version_number}/"):
+        return info.key
+    return None
 
 
 def generate_download_url(object_name: str, expiration=3600) -> str:
     """Generate a URL for downloading a file."""
-    if STORAGE_MODE == "local":
-        file_path = os.path.join(LOCAL_STORAGE_PATH, object_name)
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="File not found")
-        # For local storage, return the direct file path
+    if download_cache:
         return f"/download/{object_name}"
-    else:
-        if not s3_client:
-            raise HTTPException(status_code=500, detail="S3 storage not configured.")
-        try:
-            return s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': settings.S3_BUCKET_NAME, 'Key': object_name},
-                ExpiresIn=expiration
-            )
-        except Exception as e:
-            logger.error(f"Failed to generate download URL: {e}", exc_info=True)
-            raise HTTPException(status_code=500, detail="Failed to generate download URL.")
+    return backend.download_url(object_name, expiration)
 
 
-async def handle_mod_upload(upload_file: UploadFile, mod_id: int, file_path: str = None) -> str:
-    """Process a mod file upload with virus scanning and storage."""
-    temp_file_path = None
+def open_download(object_name: str, range_header: str = None):
+    """Build the /download response for an object, honouring Range requests. Blocking."""
+    normalized = os.path.normpath(object_name)
+    if os.path.isabs(normalized) or normalized.startswith(".."):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if download_cache:
+        # Retry once in case the cached copy was evicted between lookup and open
+        for attempt in range(2):
+            try:
+                cached_path = download_cache.get_path(normalized)
+                return ranged_file_response(cached_path, range_header, name=normalized)
+            except FileNotFoundError:
+                if attempt:
+                    raise HTTPException(status_code=404, detail="File not found")
+
+    if STORAGE_MODE != "local":
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        return ranged_file_response(backend.path_for(normalized), range_header)
+    except FileNotFoundError:
+        pass
+    # Cold objects are decompressed back into the hot tier on first access. Looking the path
+    # up again also finds files the layout migration moved since the first lookup.
+    backend.promote(normalized)
     try:
-        temp_file_path = await save_upload_file_temp(upload_file)
+        return ranged_file_response(backend.path_for(normalized), range_header)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+
+async def handle_mod_upload(upload_file: UploadFile, mod_id: int, file_path: str = None, db: Session = None) -> str:
+    """Process a mod file upload with virus scanning and storage.
+
+    With a session, the archive's file list is also indexed into it (not committed).
+
+    The request body was spooled by the multipart parser before the handler ran;
+    in a trace that time is the gap between the request span and this span.
+    """
+    global _inflight_uploads
+    _inflight_uploads += 1
+    temp_file_path = None
+    with tracing.span("upload.handle", {"mod.id": mod_id}):
+        try:
+            # Reject disallowed types and archive bombs before copying, scanning or storing anything
+            upload_progress.publish("validating")
+            with tracing.span("upload.validate"):
+                await validate_upload(upload_file)
+            upload_progress.publish("saving")
+            temp_file_path = await save_upload_file_temp(upload_file)
         
-        logger.info(f"Starting security scan for temp file: {temp_file_path}")
-        is_clean = await scan_file_for_viruses(temp_file_path)
-        if not is_clean:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File failed security scan.")
+            logger.info(f"Starting security scan for temp file: {temp_file_path}")
+            with tracing.span("upload.virus_scan"):
+                is_clean = await scan_file_for_viruses(temp_file_path)
+            if not is_clean:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File failed security scan.")
         
-        if file_path:
-            # Use the provided custom file path
-            object_name = file_path
-        else:
-            # Use the default path for regular mod uploads
-            safe_filename = os.path.basename(upload_file.filename or f"mod_{mod_id}_file")
-            object_name = f"mods/{mod_id}/{safe_filename}"
+            if file_path:
+                # Use the provided custom file path
+                object_name = file_path
+            else:
+                # Use the default path for regular mod uploads
+                safe_filename = os.path.basename(upload_file.filename or f"mod_{mod_id}_file")
+                object_name = f"mods/{mod_id}/{safe_filename}"
         
-        return upload_file_to_storage(temp_file_path, object_name)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error during mod upload: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to process file upload.")
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logger.info(f"Cleaned up temporary file: {temp_file_path}")
-            except OSError as e:
-                logger.error(f"Failed to clean up temporary file: {e}", exc_info=True)
\ No newline at end of file
+            object_key = await run_in_io_pool(upload_file_to_storage, temp_file_path, object_name)
+            if db is not None:
+                upload_progress.publish("indexing")
+                with tracing.span("upload.index_manifest"):
+                    await asyncio.to_thread(index_archive, db, temp_file_path, mod_id, object_key)
+            return object_key
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error during mod upload: {e}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to process file upload.")
+        finally:
+            _inflight_uploads -= 1
+            if temp_file_path and os.path.exists(temp_file_path):
+                try:
+                    os.remove(temp_file_path)
+                    logger.info(f"Cleaned up temporary file: {temp_file_path}")
+                except OSError as e:
+                    logger.error(f"Failed to clean up temporary file: {e}", exc_info=True)
\ No newline at end of file
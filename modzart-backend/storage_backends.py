@@ -0,0 +1,630 @@
+# storage_backends.py
+"""Storage backends, selected once at startup from settings.STORAGE_MODE.
+
+Backends register themselves by name in STORAGE_BACKENDS. Heavy client libraries
+(boto3/botocore) are only imported when the backend that needs them is first used,
+so local deployments never pay for them.
+"""
+import os
+import gzip
+import hashlib
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, NamedTuple, Optional
+from fastapi import HTTPException
+
+from config import settings
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKENDS = {}
+
+HOT = "hot"
+COLD = "cold"
+
+COPY_CHUNK = 1024 * 1024
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    size: int  # Bytes stored in the object's current tier
+    last_modified: datetime  # UTC
+    tier: str  # HOT, COLD, or another storage class the tiering job leaves alone
+
+
+def register_backend(name: str):
+    """Class decorator adding a backend to the registry under `name`."""
+    def decorator(cls):
+        STORAGE_BACKENDS[name] = cls
+        cls.name = name
+        return cls
+    return decorator
+
+
+class StorageBackend:
+    """Interface shared by all storage backends."""
+    name = None
+
+    def warm_up(self) -> None:
+        """Prepare clients/connections ahead of the first request."""
+
+    def store(self, file_path: str, object_name: str, progress=None, content_type: Optional[str] = None,
+              cache_control: Optional[str] = None) -> str:
+        """Store a local file under `object_name`. Returns the object key.
+
+        `progress`, if given, is called with the number of bytes transferred since the last call.
+        `content_type` and `cache_control` are kept with the object where clients download it
+        from the backend directly.
+        """
+        raise NotImplementedError
+
+    def delete(self, object_name: str) -> bool:
+        """Delete an object. Returns True if it is gone afterwards."""
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> list:
+        """Delete every object under a directory-like prefix ending in "/". Returns the deleted keys."""
+        raise NotImplementedError
+
+    def download_url(self, object_name: str, expiration: int) -> str:
+        """Return a URL the client can download the object from."""
+        raise NotImplementedError
+
+    def fetch(self, object_name: str, dest_path: str) -> None:
+        """Copy an object to a local file. Raises FileNotFoundError if it doesn't exist."""
+        raise NotImplementedError
+
+    def exists(self, object_name: str) -> bool:
+        """Whether an object is stored, in any tier."""
+        raise NotImplementedError
+
+    def object_size(self, object_name: str) -> int:
+        """Size of an object in bytes. Raises FileNotFoundError if it doesn't exist."""
+        raise NotImplementedError
+
+    def open_object(self, object_name: str):
+        """A binary file object streaming an object from the start; close it when done.
+
+        Raises FileNotFoundError if it doesn't exist.
+        """
+        raise NotImplementedError
+
+    def list_objects(self, prefix: str = "", start_after: Optional[str] = None) -> Iterator[ObjectInfo]:
+        """Yield the stored objects whose key starts with `prefix`, in a stable order.
+
+        With `start_after`, the listing resumes after that key as yielded by an earlier listing.
+        """
+        raise NotImplementedError
+
+    def demote(self, object_name: str) -> Optional[int]:
+        """Move an object to the cold tier. Returns its new stored size, or None if unchanged."""
+        raise NotImplementedError
+
+    def promote(self, object_name: str) -> bool:
+        """Move an object back to the hot tier. Returns False if there is no cold copy."""
+        raise NotImplementedError
+
+
+@register_backend("local")
+class LocalStorageBackend(StorageBackend):
+    """Files on the local filesystem, served through the /download route.
+
+    Files live under LOCAL_STORAGE_SHARD_DEPTH levels of hash-prefix directories
+    (e.g. `3f/a2/versions/42/1.0/mod.zip`), hashed on the first two key segments
+    so every file of one mod prefix shares a directory. Files still in the flat
+    layout (`versions/42/1.0/mod.zip`) are found as a fallback until
+    storage_layout.py has moved them.
+    """
+
+    def __init__(self):
+        self.root = settings.LOCAL_STORAGE_PATH
+        self.cold_root = settings.LOCAL_COLD_STORAGE_PATH
+        self.shard_depth = settings.LOCAL_STORAGE_SHARD_DEPTH
+        os.makedirs(self.root, exist_ok=True)
+        # Only positive results are cached, so files stored by another worker are found immediately
+        self._exists_cache = TTLCache(settings.LOCAL_STAT_CACHE_SIZE, settings.LOCAL_STAT_CACHE_SECONDS)
+
+    def exists(self, object_name: str) -> bool:
+        if self._exists_cache.get(object_name):
+            return True
+        found = os.path.exists(self.path_for(object_name)) or os.path.exists(self.cold_path_for(object_name))
+        if found:
+            self._exists_cache.set(object_name, True)
+        return found
+
+    def shard_dirs(self, object_name: str) -> list:
+        head = "/".join(object_name.split("/", 2)[:2])
+        digest = hashlib.sha1(head.encode("utf-8")).hexdigest()
+        return [digest[2 * level:2 * level + 2] for level in range(self.shard_depth)]
+
+    def layout_path(self, root: str, object_name: str, suffix: str = "") -> str:
+        """Where the current layout puts an object under `root`."""
+        return os.path.join(root, *self.shard_dirs(object_name), object_name + suffix)
+
+    def _resolve(self, root: str, object_name: str, suffix: str = "") -> str:
+        path = self.layout_path(root, object_name, suffix)
+        if self.shard_depth and not os.path.exists(path):
+            legacy_path = os.path.join(root, object_name + suffix)
+            if os.path.exists(legacy_path):
+                return legacy_path
+        return path
+
+    def path_for(self, object_name: str) -> str:
+        return self._resolve(self.root, object_name)
+
+    def cold_path_for(self, object_name: str) -> str:
+        return self._resolve(self.cold_root, object_name, ".gz")
+
+    def key_for(self, root: str, path: str, suffix: str = "") -> str:
+        """The object key of a file under `root`, in either layout."""
+        parts = os.path.relpath(path, root).split(os.sep)
+        key = "/".join(parts)
+        key = key[:len(key) - len(suffix)] if suffix else key
+        if self.shard_depth and len(parts) > self.shard_depth:
+            sharded_key = "/".join(parts[self.shard_depth:])
+            sharded_key = sharded_key[:len(sharded_key) - len(suffix)] if suffix else sharded_key
+            if parts[:self.shard_depth] == self.shard_dirs(sharded_key):
+                return sharded_key
+        return key
+
+    def store(self, file_path: str, object_name: str, progress=None, content_type: Optional[str] = None,
+              cache_control: Optional[str] = None) -> str:
+        # Headers are set by the routes serving local files
+        try:
+            # Create directory structure if it doesn't exist
+            final_path = self.layout_path(self.root, object_name)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+
+            # Copy through a temp file, so a concurrent download never sees a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), prefix=".tier-")
+            os.close(fd)
+            try:
+                shutil.copy2(file_path, tmp_path)
+                os.replace(tmp_path, final_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            legacy_path = os.path.join(self.root, object_name)
+            if legacy_path != final_path and os.path.exists(legacy_path):
+                # Replaced before the layout migration reached it
+                os.remove(legacy_path)
+            self._exists_cache.set(object_name, True)
+            if progress:
+                # copy2 is one kernel-side copy, so progress is reported once it is done
+                progress(os.path.getsize(final_path))
+            logger.info(f"Successfully copied file to local storage: {final_path}")
+            return object_name
+        except Exception as e:
+            logger.error(f"Failed to copy file to local storage: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Failed to store file locally.")
+
+    def delete(self, object_name: str) -> bool:
+        self._exists_cache.pop(object_name)
+        try:
+            candidates = {
+                self.layout_path(self.root, object_name), os.path.join(self.root, object_name),
+                self.layout_path(self.cold_root, object_name, ".gz"), os.path.join(self.cold_root, object_name + ".gz"),
+            }
+            for file_path in candidates:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    logger.info(f"Successfully deleted local file: {file_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete local file: {e}", exc_info=True)
+            return False
+
+    def delete_prefix(self, prefix: str) -> list:
+        directory = prefix.rstrip("/")
+        deleted = []
+        for root, suffix in ((self.root, ""), (self.cold_root, ".gz")):
+            # The sharded directory and, until migrated, the flat one
+            for top in {self.layout_path(root, directory), os.path.join(root, directory)}:
+                deleted += [self.key_for(root, path, suffix) for path in self._delete_tree(top)]
+        for key in deleted:
+            self._exists_cache.pop(key)
+        if deleted:
+            logger.info(f"Deleted {len(deleted)} local file(s) under {prefix}")
+        return deleted
+
+    @staticmethod
+    def _clear_dir(path: str) -> tuple:
+        """Unlink the files in one directory. Returns (removed paths, subdirectories)."""
+        removed, subdirs = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        try:
+                            os.unlink(entry.path)
+                            removed.append(entry.path)
+                        except FileNotFoundError:
+                            pass
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        return removed, subdirs
+
+    def _delete_tree(self, top: str) -> list:
+        """Delete a directory tree, scanning each level's directories in parallel. Returns removed paths."""
+        removed, level, visited = [], [top], []
+        with ThreadPoolExecutor(max_workers=settings.STORAGE_DELETE_THREADS, thread_name_prefix="storage-delete") as executor:
+            while level:
+                visited += level
+                next_level = []
+                for files, subdirs in executor.map(self._clear_dir, level):
+                    removed += files
+                    next_level += subdirs
+                level = next_level
+        for directory in reversed(visited):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        return removed
+
+    def download_url(self, object_name: str, expiration: int) -> str:
+        if not self.exists(object_name):
+            raise HTTPException(status_code=404, detail="File not found")
+        # For local storage, return the direct file path
+        return f"/download/{object_name}"
+
+    def _hot_path(self, object_name: str) -> str:
+        """The hot file of an object, promoted from the cold tier first if needed."""
+        source_path = self.path_for(object_name)
+        if not os.path.exists(source_path):
+            if not self.promote(object_name):
+                raise FileNotFoundError(object_name)
+            source_path = self.path_for(object_name)
+        return source_path
+
+    def fetch(self, object_name: str, dest_path: str) -> None:
+        shutil.copyfile(self._hot_path(object_name), dest_path)
+
+    def object_size(self, object_name: str) -> int:
+        return os.path.getsize(self._hot_path(object_name))
+
+    def open_object(self, object_name: str):
+        return open(self._hot_path(object_name), "rb")
+
+    def list_objects(self, prefix: str = "", start_after: Optional[str] = None) -> Iterator[ObjectInfo]:
+        # Hot files, then cold ones, each in sorted path order so a listing can be resumed
+        resume_root, after = self._resume_point(start_after) if start_after else (0, None)
+        roots = ((self.root, HOT, ""), (self.cold_root, COLD, ".gz"))
+        for index, (root, tier, suffix) in enumerate(roots):
+            if index < resume_root:
+                continue
+            for top in self._walk_tops(root, prefix):
+                base = self._parts(root, top)
+                for entry in self._iter_sorted(top, base, after if index == resume_root else None):
+                    if entry.name.startswith(".tier-") or not entry.name.endswith(suffix):
+                        continue
+                    key = self.key_for(root, entry.path, suffix)
+                    if not key.startswith(prefix):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    yield ObjectInfo(key, stat.st_size, datetime.utcfromtimestamp(stat.st_mtime), tier)
+
+    @staticmethod
+    def _parts(root: str, path: str) -> tuple:
+        relative = os.path.relpath(path, root)
+        return () if relative == os.curdir else tuple(relative.split(os.sep))
+
+    def _resume_point(self, start_after: str) -> tuple:
+        """(index of the root to resume in, path parts to resume after) for a key listed before."""
+        for index, (root, suffix) in enumerate(((self.root, ""), (self.cold_root, ".gz"))):
+            path = self._resolve(root, start_after, suffix)
+            if os.path.exists(path):
+                return index, self._parts(root, path)
+        # Deleted since: resume where it would have been among the hot files
+        return 0, self._parts(self.root, self.layout_path(self.root, start_after))
+
+    def _iter_sorted(self, directory: str, parts: tuple, after: Optional[tuple]) -> Iterator[os.DirEntry]:
+        """Files below `directory` in path order, skipping everything up to and including `after`."""
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        for entry in entries:
+            entry_parts = parts + (entry.name,)
+            if after is not None and entry_parts < after[:len(entry_parts)]:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._iter_sorted(entry.path, entry_parts, after)
+            elif after is None or entry_parts > after:
+                yield entry
+
+    def _walk_tops(self, root: str, prefix: str) -> list:
+        """Directories to walk for `prefix`: only its own shard once it names a full mod prefix."""
+        directory = os.path.dirname(prefix)
+        if not self.shard_depth:
+            return [os.path.join(root, directory)]
+        if "/" not in directory:
+            return [root]
+        # The sharded copy and, until migrated, the flat one
+        return [self.layout_path(root, directory), os.path.join(root, directory)]
+
+    def _write_atomically(self, final_path: str, write) -> None:
+        """Write through a temp file next to `final_path`, so readers never see a partial file."""
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), prefix=".tier-")
+        try:
+            with os.fdopen(fd, "wb") as dest:
+                write(dest)
+            os.replace(tmp_path, final_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def demote(self, object_name: str) -> Optional[int]:
+        source_path = self.path_for(object_name)
+
+        def compress(dest):
+            # mtime=0 keeps the archive reproducible; the hot file's mtime is kept on the .gz instead
+            with open(source_path, "rb") as src, gzip.GzipFile(fileobj=dest, mode="wb", mtime=0) as gz:
+                shutil.copyfileobj(src, gz, COPY_CHUNK)
+
+        cold_path = self.layout_path(self.cold_root, object_name, ".gz")
+        self._write_atomically(cold_path, compress)
+        shutil.copystat(source_path, cold_path)
+        # A download that already opened the hot file keeps reading it after the unlink
+        os.remove(source_path)
+        logger.info(f"Moved {object_name} to cold storage: {cold_path}")
+        return os.path.getsize(cold_path)
+
+    def promote(self, object_name: str) -> bool:
+        cold_path = self.cold_path_for(object_name)
+        final_path = self.layout_path(self.root, object_name)
+        try:
+            src = gzip.open(cold_path, "rb")
+        except FileNotFoundError:
+            # Promoted concurrently by another thread or worker
+            return os.path.exists(final_path)
+        with src:
+            self._write_atomically(final_path, lambda dest: shutil.copyfileobj(src, dest, COPY_CHUNK))
+        try:
+            shutil.copystat(cold_path, final_path)
+            os.remove(cold_path)
+        except FileNotFoundError:
+            pass
+        self._exists_cache.set(object_name, True)
+        logger.info(f"Moved {object_name} back to hot storage: {final_path}")
+        return True
+
+
+@register_backend("s3")
+class S3StorageBackend(StorageBackend):
+    """Objects in an S3 bucket, downloaded through presigned URLs."""
+
+    def __init__(self):
+        self.bucket = settings.S3_BUCKET_NAME
+        self._client = None
+        self._transfer_config = None
+        self._client_lock = threading.Lock()
+        # Identical URLs for the same object also let browsers and CDNs cache the download
+        self._url_cache = TTLCache(settings.PRESIGNED_URL_CACHE_SIZE, settings.PRESIGNED_URL_CACHE_SECONDS)
+
+    @property
+    def client(self):
+        """The boto3 client, created (and boto3 imported) on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        import boto3
+        from botocore.config import Config
+
+        client_kwargs = {
+            "region_name": settings.S3_REGION,
+            "endpoint_url": settings.S3_ENDPOINT_URL,
+            # One client is shared by every upload thread, so its pool must cover all of them
+            "config": Config(
+                max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        }
+        if settings.AWS_ACCESS_KEY_ID and settings.AWS_SECRET_ACCESS_KEY:
+            client_kwargs["aws_access_key_id"] = settings.AWS_ACCESS_KEY_ID
+            client_kwargs["aws_secret_access_key"] = settings.AWS_SECRET_ACCESS_KEY
+        return boto3.client("s3", **client_kwargs)
+
+    @property
+    def transfer_config(self):
+        """Multipart settings used for uploads."""
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+
+            mb = 1024 * 1024
+            self._transfer_config = TransferConfig(
+                multipart_threshold=settings.S3_MULTIPART_THRESHOLD_MB * mb,
+                multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE_MB * mb,
+                max_concurrency=settings.S3_MAX_CONCURRENCY,
+                use_threads=True,
+            )
+        return self._transfer_config
+
+    def warm_up(self) -> None:
+        try:
+            # Resolves credentials and opens a pooled connection to the bucket endpoint
+            self.client.head_bucket(Bucket=self.bucket)
+            logger.info(f"Warmed up S3 client for bucket: {self.bucket}")
+        except Exception as e:
+            logger.error(f"Failed to warm up S3 client: {e}", exc_info=True)
+
+    def store(self, file_path: str, object_name: str, progress=None, content_type: Optional[str] = None,
+              cache_control: Optional[str] = None) -> str:
+        extra_args = {}
+        if content_type:
+            extra_args["ContentType"] = content_type
+        if cache_control:
+            extra_args["CacheControl"] = cache_control
+        try:
+            self.client.upload_file(
+                file_path, self.bucket, object_name, ExtraArgs=extra_args or None,
+                Config=self.transfer_config, Callback=progress
+            )
+            self._url_cache.pop(object_name)
+            logger.info(f"Successfully uploaded to S3: s3://{self.bucket}/{object_name}")
+            return object_name
+        except Exception as e:
+            logger.error(f"Failed to upload file to S3: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Failed to upload file to storage.")
+
+    def delete(self, object_name: str) -> bool:
+        self._url_cache.pop(object_name)
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=object_name)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to delete from S3: {e}", exc_info=True)
+            return False
+
+    def delete_prefix(self, prefix: str) -> list:
+        deleted = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        # Pages hold at most 1000 keys, the delete_objects limit
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, PaginationConfig={"PageSize": 1000}):
+            keys = [obj["Key"] for obj in page.get("Contents", [])]
+            if not keys:
+                continue
+            response = self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+            )
+            errors = response.get("Errors", [])
+            failed = {error["Key"] for error in errors}
+            for key in keys:
+                self._url_cache.pop(key)
+                if key not in failed:
+                    deleted.append(key)
+            if errors:
+                raise RuntimeError(
+                    f"Failed to delete {len(errors)} object(s) under {prefix}, e.g. {errors[0].get('Key')}: "
+                    f"{errors[0].get('Message')}"
+                )
+        if deleted:
+            logger.info(f"Deleted {len(deleted)} object(s) under s3://{self.bucket}/{prefix}")
+        return deleted
+
+    def download_url(self, object_name: str, expiration: int) -> str:
+        cached = self._url_cache.get(object_name)
+        if cached and cached[0] == expiration:
+            return cached[1]
+        try:
+            url = self.client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': object_name},
+                ExpiresIn=expiration
+            )
+        except Exception as e:
+            logger.error(f"Failed to generate download URL: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Failed to generate download URL.")
+        # Hand out a cached URL for at most half its lifetime so clients always get a usable link
+        self._url_cache.set(object_name, (expiration, url), ttl=min(self._url_cache.ttl, expiration / 2))
+        return url
+
+    def fetch(self, object_name: str, dest_path: str) -> None:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.download_file(self.bucket, object_name, dest_path, Config=self.transfer_config)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(object_name) from e
+            raise
+
+    def exists(self, object_name: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=object_name)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def object_size(self, object_name: str) -> int:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=object_name)["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(object_name) from e
+            raise
+
+    def open_object(self, object_name: str):
+        from botocore.exceptions import ClientError
+
+        try:
+            # The body is read from the connection as it is consumed
+            return self.client.get_object(Bucket=self.bucket, Key=object_name)["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                raise FileNotFoundError(object_name) from e
+            raise
+
+    def list_objects(self, prefix: str = "", start_after: Optional[str] = None) -> Iterator[ObjectInfo]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        # S3 lists keys in UTF-8 binary order, so StartAfter resumes exactly
+        extra = {"StartAfter": start_after} if start_after else {}
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, **extra):
+            for obj in page.get("Contents", []):
+                storage_class = obj.get("StorageClass", "STANDARD")
+                if storage_class == "STANDARD":
+                    tier = HOT
+                elif storage_class == settings.S3_COLD_STORAGE_CLASS:
+                    tier = COLD
+                else:
+                    tier = storage_class.lower()
+                # boto3 returns aware datetimes; the database stores naive UTC
+                last_modified = obj["LastModified"].replace(tzinfo=None)
+                yield ObjectInfo(obj["Key"], obj["Size"], last_modified, tier)
+
+    def _set_storage_class(self, object_name: str, storage_class: str) -> None:
+        # A managed copy onto itself, so objects over 5 GB are copied in parts; metadata is kept
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": object_name}, self.bucket, object_name,
+            ExtraArgs={"StorageClass": storage_class, "MetadataDirective": "COPY"},
+            Config=self.transfer_config,
+        )
+
+    def demote(self, object_name: str) -> Optional[int]:
+        self._set_storage_class(object_name, settings.S3_COLD_STORAGE_CLASS)
+        logger.info(f"Moved s3://{self.bucket}/{object_name} to {settings.S3_COLD_STORAGE_CLASS}")
+        return None
+
+    def promote(self, object_name: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self._set_storage_class(object_name, "STANDARD")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+        logger.info(f"Moved s3://{self.bucket}/{object_name} back to STANDARD")
+        return True
+
+
+def create_backend(mode: str = settings.STORAGE_MODE) -> StorageBackend:
+    """Instantiate the backend registered for `mode`."""
+    try:
+        backend_cls = STORAGE_BACKENDS[mode]
+    except KeyError:
+        raise ValueError(f"Unknown STORAGE_MODE '{mode}'. Available: {', '.join(sorted(STORAGE_BACKENDS))}")
+    logger.info(f"Using '{mode}' storage backend.")
+    return backend_cls()
@@ -0,0 +1,128 @@
+# storage_layout.py
+"""Online migration of local storage to the hash-sharded layout.
+
+New files are always written where LOCAL_STORAGE_SHARD_DEPTH puts them, and
+lookups fall back to the flat layout, so the server keeps serving while this
+moves existing files over (see LocalStorageBackend):
+
+    python storage_layout.py [--workers 8] [--dry-run]
+
+Files are hard-linked into place and then unlinked, so a download always finds
+one of the two paths; a file already re-stored under the new layout wins over
+its flat copy. Runs are idempotent and can be interrupted and restarted.
+"""
+import os
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+from storage_backends import LocalStorageBackend
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+MOVED = "moved"
+STALE = "stale"
+FAILED = "failed"
+
+
+def iter_misplaced(backend: LocalStorageBackend, root: str, suffix: str = "") -> Iterator[tuple]:
+    """Yield (current path, layout path) for every file under `root` not where the layout puts it."""
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.startswith(".tier-"):
+                continue
+            path = os.path.join(dir_path, file_name)
+            key = backend.key_for(root, path, suffix)
+            dest = backend.layout_path(root, key, suffix)
+            if path != dest:
+                yield path, dest
+
+
+def move_file(path: str, dest: str) -> str:
+    try:
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            # Unlike a rename, a link never replaces a file stored under the new layout meanwhile
+            os.link(path, dest)
+        except FileExistsError:
+            os.remove(path)
+            return STALE
+        except PermissionError:
+            # Filesystems without hard links
+            os.rename(path, dest)
+            return MOVED
+        os.remove(path)
+        return MOVED
+    except FileNotFoundError:
+        # Deleted or moved by another process since the walk
+        return STALE
+    except OSError as e:
+        logger.error(f"Failed to move {path} to {dest}: {e}")
+        return FAILED
+
+
+def _remove_empty_dirs(root: str, dirs: set) -> None:
+    """Remove emptied flat-layout directories, deepest first. New files are never written there."""
+    candidates = set()
+    for directory in dirs:
+        while os.path.abspath(directory) != os.path.abspath(root):
+            candidates.add(directory)
+            directory = os.path.dirname(directory)
+    for directory in sorted(candidates, key=len, reverse=True):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+
+
+def migrate(backend: LocalStorageBackend, workers: int = 8, dry_run: bool = False) -> Counter:
+    """Move hot and cold files into the current layout. Returns counts per outcome."""
+    results = Counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="layout-migrate") as executor:
+        for root, suffix in ((backend.root, ""), (backend.cold_root, ".gz")):
+            emptied = set()
+            batch = []
+            for path, dest in iter_misplaced(backend, root, suffix):
+                batch.append((path, dest))
+                if len(batch) >= BATCH_SIZE:
+                    _run_batch(executor, batch, results, emptied, dry_run)
+                    batch = []
+            if batch:
+                _run_batch(executor, batch, results, emptied, dry_run)
+            if not dry_run:
+                _remove_empty_dirs(root, emptied)
+    return results
+
+
+def _run_batch(executor, batch: list, results: Counter, emptied: set, dry_run: bool) -> None:
+    if dry_run:
+        results[MOVED] += len(batch)
+        return
+    for (path, _), outcome in zip(batch, executor.map(lambda move: move_file(*move), batch)):
+        results[outcome] += 1
+        if outcome != FAILED:
+            emptied.add(os.path.dirname(path))
+    logger.info(f"Layout migration: {dict(results)} so far.")
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from config import settings
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Move local storage files into the configured layout.")
+    parser.add_argument("--workers", type=int, default=8, help="Files moved in parallel")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the files that would move")
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    if settings.STORAGE_MODE != "local":
+        parser.error("STORAGE_MODE is not 'local'")
+    results = migrate(LocalStorageBackend(), workers=args.workers, dry_run=args.dry_run)
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"{verb} {results[MOVED]} file(s) to the {settings.LOCAL_STORAGE_SHARD_DEPTH}-level layout; "
+          f"{results[STALE]} stale, {results[FAILED]} failed.")
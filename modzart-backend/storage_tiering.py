@@ -0,0 +1,272 @@
+# storage_tiering.py
+"""Hot/cold storage tiering driven by download statistics.
+
+Every download URL and /download hit is recorded per object key in
+`stored_objects` (buffered by the download counter). The tiering job moves
+objects nobody has downloaded for TIERING_COLD_AFTER_DAYS to the cold tier:
+
+* S3: the object is copied onto itself with S3_COLD_STORAGE_CLASS; presigned
+  URLs keep working, so downloads are never blocked on a restore
+* local: the file is gzip-compressed into LOCAL_COLD_STORAGE_PATH
+
+Current files of mods with at least TIERING_HOT_MIN_DOWNLOADS downloads always
+stay hot; old versions under versions/{mod_id}/{version}/ are judged by their
+own access data. A cold object is promoted back to the hot tier when it is
+downloaded again (local files inline on the first /download, S3 objects in the
+background after the next download counter flush).
+
+The job works in TIERING_BATCH_SIZE batches, paused between batches and capped
+at TIERING_MAX_MB_PER_SECOND, and can report projected savings without moving
+anything:
+
+    python storage_tiering.py --dry-run
+    python storage_tiering.py [--prefix versions/] [--limit 500]
+"""
+import time
+import zlib
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+from sqlalchemy.orm import Session
+
+from config import settings
+from db_config import SessionLocal
+from models import Mod, StoredObject
+from storage_backends import HOT, COLD, ObjectInfo
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+# Bytes of each local candidate compressed to estimate the cold tier's compression ratio
+SAMPLE_BYTES = 1024 * 1024
+
+
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"Stored object upsert is not implemented for {dialect}")
+    return dialect_insert(StoredObject)
+
+
+def record_accesses(db: Session, counts: Counter) -> list:
+    """Add download counts per object key. Does not commit. Returns the keys currently in the cold tier."""
+    if not counts:
+        return []
+    now = datetime.utcnow()
+    stmt = _upsert(db)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[StoredObject.object_key],
+        set_={
+            "access_count": StoredObject.access_count + stmt.excluded.access_count,
+            "last_accessed_at": stmt.excluded.last_accessed_at,
+        },
+    )
+    db.execute(stmt, [
+        {"object_key": key, "access_count": count, "last_accessed_at": now, "tier": HOT}
+        for key, count in counts.items()
+    ])
+    rows = db.query(StoredObject.object_key).filter(
+        StoredObject.object_key.in_(list(counts)), StoredObject.tier == COLD
+    ).all()
+    return [key for (key,) in rows]
+
+
+def _set_tier(db: Session, object_key: str, tier: str) -> None:
+    now = datetime.utcnow()
+    stmt = _upsert(db).values(object_key=object_key, access_count=0, tier=tier, tier_changed_at=now)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[StoredObject.object_key], set_={"tier": tier, "tier_changed_at": now}
+    ))
+
+
+class Promoter:
+    """Promotes downloaded cold objects on one background thread, off the flush and the event loop."""
+
+    def __init__(self):
+        self.promoted = 0
+        self.failed = 0
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tier-promote")
+
+    def schedule(self, object_keys: list) -> None:
+        with self._lock:
+            keys = [key for key in object_keys if key not in self._queued]
+            self._queued.update(keys)
+        for key in keys:
+            self._executor.submit(self._promote, key)
+
+    def _promote(self, object_key: str) -> None:
+        from storage import backend
+
+        db = SessionLocal()
+        try:
+            if backend.promote(object_key):
+                _set_tier(db, object_key, HOT)
+                db.commit()
+                self.promoted += 1
+            else:
+                logger.warning(f"Cold object {object_key} has no cold copy to promote.")
+        except Exception as e:
+            db.rollback()
+            self.failed += 1
+            logger.error(f"Failed to promote {object_key} to the hot tier: {e}", exc_info=True)
+        finally:
+            db.close()
+            with self._lock:
+                self._queued.discard(object_key)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def collect_metrics(self):
+        yield metrics.Sample("modzart_tier_promotions_total", self.promoted, {"result": "ok"},
+                             "Cold objects moved back to the hot tier on access", "counter")
+        yield metrics.Sample("modzart_tier_promotions_total", self.failed, {"result": "error"},
+                             "Cold objects moved back to the hot tier on access", "counter")
+
+
+promoter = Promoter()
+metrics.register_collector(promoter.collect_metrics)
+
+
+def iter_candidate_batches(db: Session, prefix: str = "", now: Optional[datetime] = None) -> Iterator[list]:
+    """Yield batches of hot objects that are due for the cold tier."""
+    from storage import backend
+
+    cutoff = (now or datetime.utcnow()) - timedelta(days=settings.TIERING_COLD_AFTER_DAYS)
+    min_size = settings.TIERING_MIN_OBJECT_KB * 1024
+    batch = []
+    for info in backend.list_objects(prefix):
+        # Objects uploaded after the cutoff cannot have been idle long enough
+        if info.tier != HOT or info.size < min_size or info.last_modified > cutoff:
+            continue
+        batch.append(info)
+        if len(batch) >= settings.TIERING_BATCH_SIZE:
+            yield _filter_accessed(db, batch, cutoff)
+            batch = []
+    if batch:
+        yield _filter_accessed(db, batch, cutoff)
+
+
+def _filter_accessed(db: Session, batch: list, cutoff: datetime) -> list:
+    keys = [info.key for info in batch]
+    last_accessed = dict(
+        db.query(StoredObject.object_key, StoredObject.last_accessed_at)
+        .filter(StoredObject.object_key.in_(keys)).all()
+    )
+    popular = {
+        filename for (filename,) in db.query(Mod.filename)
+        .filter(Mod.filename.in_(keys), Mod.downloads >= settings.TIERING_HOT_MIN_DOWNLOADS).all()
+    }
+    return [
+        info for info in batch
+        if info.key not in popular and (last_accessed.get(info.key) is None or last_accessed[info.key] <= cutoff)
+    ]
+
+
+def estimate_cold_size(info: ObjectInfo) -> int:
+    """Projected size of an object in the cold tier."""
+    if settings.STORAGE_MODE != "local":
+        return info.size
+    from storage import backend
+
+    with open(backend.path_for(info.key), "rb") as f:
+        sample = f.read(SAMPLE_BYTES)
+    if not sample:
+        return 0
+    # Mod archives are mostly compressed already, so this is often close to 1
+    ratio = min(len(zlib.compress(sample, 6)) / len(sample), 1.0)
+    return int(info.size * ratio)
+
+
+class Throttle:
+    """Sleeps so that processed bytes stay under `mb_per_second` (0 disables)."""
+
+    def __init__(self, mb_per_second: float):
+        self.bytes_per_second = mb_per_second * 1024 * 1024
+        self.started = time.monotonic()
+        self.processed = 0
+
+    def add(self, size: int) -> None:
+        if self.bytes_per_second <= 0:
+            return
+        self.processed += size
+        ahead = self.processed / self.bytes_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def run_tiering(db: Session, dry_run: bool = False, prefix: str = "", limit: Optional[int] = None) -> dict:
+    """Move idle objects to the cold tier, or only project the savings when `dry_run`. Blocking."""
+    from storage import backend
+
+    report = {"objects": 0, "bytes": 0, "cold_bytes": 0, "failed": 0, "dry_run": dry_run}
+    throttle = Throttle(settings.TIERING_MAX_MB_PER_SECOND)
+    for batch in iter_candidate_batches(db, prefix):
+        for info in batch:
+            if limit is not None and report["objects"] >= limit:
+                break
+            try:
+                if dry_run:
+                    cold_size = estimate_cold_size(info)
+                else:
+                    stored = backend.demote(info.key)
+                    cold_size = info.size if stored is None else stored
+                    _set_tier(db, info.key, COLD)
+            except Exception as e:
+                report["failed"] += 1
+                logger.error(f"Failed to move {info.key} to the cold tier: {e}", exc_info=True)
+                continue
+            report["objects"] += 1
+            report["bytes"] += info.size
+            report["cold_bytes"] += cold_size
+            throttle.add(min(info.size, SAMPLE_BYTES) if dry_run else info.size)
+        if not dry_run:
+            db.commit()
+        logger.info(f"Tiering batch done: {report['objects']} object(s), {report['bytes']} bytes so far.")
+        if limit is not None and report["objects"] >= limit:
+            break
+        time.sleep(settings.TIERING_BATCH_PAUSE_SECONDS)
+
+    report["monthly_savings"] = round(
+        report["bytes"] / GB * settings.TIERING_HOT_PRICE_PER_GB_MONTH
+        - report["cold_bytes"] / GB * settings.TIERING_COLD_PRICE_PER_GB_MONTH, 2
+    )
+    return report
+
+
+def format_report(report: dict) -> str:
+    verb = "Would move" if report["dry_run"] else "Moved"
+    return (
+        f"{verb} {report['objects']} object(s), {report['bytes'] / GB:.2f} GB "
+        f"({report['cold_bytes'] / GB:.2f} GB in the cold tier) to cold storage; "
+        f"projected savings: ${report['monthly_savings']:.2f}/month. Failed: {report['failed']}."
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Move idle stored objects to the cold storage tier.")
+    parser.add_argument("--dry-run", action="store_true", help="Report candidates and projected savings only")
+    parser.add_argument("--prefix", default="", help="Only consider object keys with this prefix, e.g. versions/")
+    parser.add_argument("--limit", type=int, help="Stop after this many objects")
+    args = parser.parse_args()
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    db = SessionLocal()
+    try:
+        print(format_report(run_tiering(db, dry_run=args.dry_run, prefix=args.prefix, limit=args.limit)))
+    finally:
+        db.close()
@@ -0,0 +1,53 @@
+"""Central directory parsing in archive_manifest.py, against archives written by zipfile."""
+import zipfile
+
+from archive_manifest import Entry, iter_entries, iter_zip_entries
+
+
+def test_plain_archive(tmp_path):
+    path = tmp_path / "mod.zip"
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("x64/dlcpacks/", b"")
+        archive.writestr("x64/dlcpacks/car/dlc.rpf", b"a" * 5000)
+        archive.writestr("readme.txt", b"hello")
+
+    with zipfile.ZipFile(path) as archive:
+        expected = [Entry(info.filename, info.file_size, info.compress_size, info.CRC)
+                    for info in archive.infolist() if not info.is_dir()]
+    entries = list(iter_entries(str(path)))
+    assert [entry.path for entry in entries] == ["x64/dlcpacks/car/dlc.rpf", "readme.txt"]
+    assert entries == expected
+    assert entries[0].compressed_size < entries[0].size
+
+
+def test_archive_with_comment(tmp_path):
+    path = tmp_path / "commented.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mod.asi", b"MZ")
+        # Longer than the EOCD record, and containing its signature
+        archive.comment = b"Installed with OpenIV. PK\x05\x06" + b"-" * 2000
+
+    assert [entry.path for entry in iter_zip_entries(str(path))] == ["mod.asi"]
+
+
+def test_zip64_archive(tmp_path, monkeypatch):
+    # Lowered so zipfile writes Zip64 sizes, offsets and end records without gigabytes of data
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 1000)
+    monkeypatch.setattr(zipfile, "ZIP_FILECOUNT_LIMIT", 1)
+    path = tmp_path / "zip64.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        with archive.open("big.bin", "w", force_zip64=True) as entry:
+            entry.write(bytes(5000))
+        archive.writestr("small.txt", b"hello")
+    assert b"PK\x06\x06" in path.read_bytes()
+
+    entries = list(iter_zip_entries(str(path)))
+    assert [(entry.path, entry.size, entry.compressed_size) for entry in entries] == [
+        ("big.bin", 5000, 5000), ("small.txt", 5, 5),
+    ]
+
+
+def test_non_archive_has_no_entries(tmp_path):
+    path = tmp_path / "plugin.asi"
+    path.write_bytes(b"MZ" + bytes(100))
+    assert list(iter_entries(str(path))) == []
@@ -0,0 +1,72 @@
+"""Bulk imports into a temporary SQLite database, and how the reconciler sees imported rows."""
+import io
+import json
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db_config import Base
+from models import User, Mod
+from bulk_import import NO_FILE, ModImportRow, import_mods
+from reconciler import Budget, reconcile_mods_batch
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bulk_import.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(username="modder", email="modder@example.com", password="x"))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def ndjson(*records) -> io.StringIO:
+    return io.StringIO("".join(json.dumps(record) + "\n" for record in records))
+
+
+@pytest.mark.parametrize("filename", ["archive/car.zip", "legacy/2019/car-pack.oiv", "mods/car.zip"])
+def test_filename_accepts_relative_keys(filename):
+    assert ModImportRow(title="Car", uploader="modder", filename=filename).filename == filename
+
+
+@pytest.mark.parametrize("filename", [
+    "/etc/passwd", "../../etc/passwd", "archive/../../x.zip", "archive//car.zip", "./car.zip", "..",
+    "archive\\car.zip", "mods/5/x.zip", "versions/5/1.0/x.zip", "mods/5/images/ab12.png", "PENDING_UPLOAD",
+])
+def test_filename_rejects_unsafe_and_owned_keys(filename):
+    with pytest.raises(ValidationError):
+        ModImportRow(title="Car", uploader="modder", filename=filename)
+
+
+def test_import_reports_unsafe_filename(db):
+    report = import_mods(db, ndjson(
+        {"title": "Ok", "uploader": "modder", "filename": "archive/ok.zip"},
+        {"title": "Takeover", "uploader": "modder", "filename": "mods/1/x.zip"},
+    ), "ndjson")
+    assert report["imported"] == 1
+    assert [error["line"] for error in report["errors"]] == [2]
+
+
+def test_reconciler_skips_imported_rows_without_a_file(db):
+    report = import_mods(db, ndjson(
+        {"title": "Old classic", "uploader": "modder", "created_at": "2015-04-14T00:00:00"},
+        {"title": "Hosted elsewhere", "uploader": "modder", "url": "https://example.com/mod"},
+    ), "ndjson")
+    assert report["imported"] == 2
+    assert [filename for (filename,) in db.query(Mod.filename).order_by(Mod.id)] == [
+        NO_FILE, "project:https://example.com/mod",
+    ]
+
+    checkpoint = {"storage_after": None, "mods_after_id": 0, "pass": {}}
+    counts = reconcile_mods_batch(db, checkpoint, Budget(0))
+    assert counts["mods"] == 2
+    assert counts["dangling"] == 0
+    assert counts["errors"] == 0
@@ -1,6 +1,7 @@
 import requests
 import json
 import os
+import zipfile
 
 BASE_URL = "http://localhost:8000"
 TEST_USER = {
@@ -37,8 +38,9 @@ def test_get_current_user(token):
 def create_test_file(content="Test mod content"):
     """Create a test file for upload"""
     filename = "test_mod.zip"
-    with open(filename, "wb") as f:
-        f.write(content.encode())
+    # Uploads must be real archives; the server checks magic bytes and zip contents
+    with zipfile.ZipFile(filename, "w") as archive:
+        archive.writestr("readme.txt", content)
     return filename
 
 def test_create_mod(token):
@@ -0,0 +1,42 @@
+"""Range header parsing in file_responses.py."""
+import pytest
+from fastapi import HTTPException
+
+from file_responses import parse_range
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),  # Open-ended
+    ("bytes=-100", (900, 999)),  # Suffix: the last 100 bytes
+    ("bytes=-5000", (0, 999)),  # Suffix longer than the file
+    ("bytes=500-5000", (500, 999)),  # End past the file is clamped
+    ("bytes=999-999", (999, 999)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-10", "bytes=", "bytes=abc-def", "bytes=10", "bytes=-0", "bytes=20-10",
+    "bytes=0-10,20-30",  # Multiple ranges are served as the whole file
+])
+def test_ignored_ranges(header):
+    assert parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-2000", "bytes=5000-6000"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, SIZE)
+    assert error.value.status_code == 416
+    assert error.value.headers == {"Content-Range": f"bytes */{SIZE}"}
+
+
+@pytest.mark.parametrize("header", ["bytes=-10", "bytes=0-", "bytes=0-10"])
+def test_any_range_of_empty_file_is_unsatisfiable(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, 0)
+    assert error.value.status_code == 416
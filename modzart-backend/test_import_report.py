@@ -0,0 +1,39 @@
+"""Parsing of `python -X importtime` output in benchmarks/import_report.py."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from import_report import import_depth, parse_importtime, total_import_ms  # noqa: E402
+
+SAMPLE = """\
+import time: self [us] | cumulative | imported package
+import time:       232 |        232 |   _io
+import time:       529 |       1299 | _frozen_importlib_external
+import time:        59 |         59 |     _codecs
+import time:       300 |        359 |   encodings
+import time:      1000 |       2000 | json
+some unrelated stderr line
+import time:        40 |         40 |   json.decoder
+import time:       700 |       1500 | main
+"""
+
+
+def test_parse_importtime_keeps_indentation():
+    rows = parse_importtime(SAMPLE)
+    assert len(rows) == 7
+    assert rows[0] == ("   _io", 232, 232)
+    assert rows[1] == (" _frozen_importlib_external", 529, 1299)
+
+
+def test_import_depth():
+    assert import_depth(" json") == 0
+    assert import_depth("   json.decoder") == 1
+    assert import_depth("     _codecs") == 2
+
+
+def test_total_counts_only_top_level_rows():
+    # 1299 + 2000 + 1500 us; nested rows are already part of their parent's cumulative time
+    assert total_import_ms(parse_importtime(SAMPLE)) == pytest.approx(4.799)
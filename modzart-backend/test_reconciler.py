@@ -0,0 +1,61 @@
+"""Which stored objects reconciler.find_orphans keeps, against a temporary SQLite database."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from db_config import Base
+from models import User, Mod, ModImage
+from reconciler import find_orphans
+from storage_backends import ObjectInfo
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'reconciler.db'}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    user = User(username="modder", email="modder@example.com", password="x")
+    session.add(user)
+    session.flush()
+    session.add_all([
+        Mod(id=1, title="Car", description="", filename="mods/1/car-v2.zip", user_id=user.id),
+        Mod(id=2, title="Project", description="", filename="project:2", user_id=user.id),
+    ])
+    session.add(ModImage(mod_id=1, object_key="mods/1/images/ab12.png", content_type="image/png",
+                         width=1920, height=1080, size=1000))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def objects(*keys):
+    return [ObjectInfo(key, 100, datetime(2024, 1, 1), "HOT") for key in keys]
+
+
+def test_referenced_objects_are_kept(db):
+    kept = [
+        "mods/1/car-v2.zip",  # The current file
+        "versions/1/1.0/car-v1.zip",  # A version of an existing mod
+        "mods/1/images/ab12.png",  # A gallery original
+        "mods/1/images/ab12/640.webp",  # One of its variants
+        "mods/1/images/ab12/1280.jpeg",
+    ]
+    assert find_orphans(db, objects(*kept)) == []
+
+
+def test_unreferenced_objects_are_orphans(db):
+    orphans = [
+        "mods/1/car-v1.zip",  # Replaced by the current file
+        "versions/99/1.0/gone.zip",  # Version of a deleted mod
+        "mods/1/images/cd34.png",  # Image whose row was rolled back
+        "mods/1/images/cd34/640.webp",
+        "mods/1/images/ab12-copy/640.webp",  # Shares a prefix with a stored original, not its stem
+        "stray.bin",
+    ]
+    batch = objects("mods/1/car-v2.zip", *orphans)
+    assert [info.key for info in find_orphans(db, batch)] == orphans
@@ -0,0 +1,85 @@
+"""Type checks on multipart bodies while they stream through UploadLimitMiddleware."""
+import asyncio
+
+import pytest
+
+from upload_validation import MultipartSniffer, UploadLimitMiddleware, multipart_boundary, part_filename
+
+BOUNDARY = b"----WebKitFormBoundary7MA4YWxkTrZu0gW"
+
+
+def multipart_body(filename: bytes, data: bytes) -> bytes:
+    return (
+        b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="title"\r\n\r\nMy mod'
+        b"\r\n--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="' + filename + b'"\r\n'
+        b"Content-Type: application/octet-stream\r\n\r\n" + data + b"\r\n--" + BOUNDARY + b"--\r\n"
+    )
+
+
+def sniff(body: bytes, chunk_size: int):
+    sniffer = MultipartSniffer(BOUNDARY)
+    found = None
+    for start in range(0, len(body), chunk_size):
+        found = sniffer.feed(body[start:start + chunk_size]) or found
+    return found
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_sniffer_finds_file_part_across_chunks(chunk_size):
+    body = multipart_body(b"mod.zip", b"PK\x03\x04" + b"\0" * 1000)
+    assert sniff(body, chunk_size) == ("mod.zip", b"PK\x03\x04\0\0\0\0")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 64])
+def test_sniffer_short_and_empty_files(chunk_size):
+    assert sniff(multipart_body(b"tiny.asi", b"MZ"), chunk_size) == ("tiny.asi", b"MZ")
+    # Left to validate_upload, which reports the file as empty
+    assert sniff(multipart_body(b"empty.zip", b""), chunk_size) is None
+
+
+def test_boundary_and_filename_parsing():
+    assert multipart_boundary('multipart/form-data; boundary="abc"') == b"abc"
+    assert multipart_boundary("application/json") is None
+    assert part_filename(b'\r\nContent-Disposition: form-data; name="file"; filename=mod.7z') == "mod.7z"
+    assert part_filename(b'\r\nContent-Disposition: form-data; name="title"') is None
+
+
+def run_upload(body: bytes) -> tuple:
+    """(response status, body bytes received) for a POST /mods/ sent in 16-byte chunks."""
+    received = 0
+    sent = []
+
+    async def app(scope, receive, send):
+        while (await receive()).get("more_body"):
+            pass
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        nonlocal received
+        chunk = body[received:received + 16]
+        received += len(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": received < len(body)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "POST", "path": "/mods/",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=" + BOUNDARY)],
+    }
+    middleware = UploadLimitMiddleware(app, limits="/mods/=64", sniff_paths="/mods/")
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]["status"], received
+
+
+def test_middleware_rejects_disallowed_type_before_the_body_is_read():
+    body = multipart_body(b"payload.zip", b"#!/bin/sh\n" + b"\0" * 100000)
+    status, received = run_upload(body)
+    assert status == 415
+    assert received < 1024
+
+
+def test_middleware_passes_allowed_type():
+    body = multipart_body(b"mod.zip", b"PK\x03\x04" + b"\0" * 1000)
+    assert run_upload(body) == (201, len(body))
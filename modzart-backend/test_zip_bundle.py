@@ -0,0 +1,66 @@
+"""Zip bundles streamed by zip_bundle.py, read back with the standard library's zipfile."""
+import io
+import zipfile
+
+import pytest
+
+from zip_bundle import BundleEntry, ZipBundle, ZIP64_LIMIT
+
+
+class Zeros:
+    """A readable object of `size` zero bytes that holds nothing in memory."""
+
+    def __init__(self, size: int):
+        self.remaining = size
+
+    def read(self, size: int) -> bytes:
+        size = min(size, self.remaining)
+        self.remaining -= size
+        return bytes(size)
+
+    def close(self):
+        pass
+
+
+def test_round_trip():
+    objects = {"mods/a.zip": b"first mod" * 1000, "versions/2/b.oiv": b"", "mods/c.7z": b"\xff" * 7}
+    entries = [
+        BundleEntry("a.zip", "mods/a.zip", 9000),
+        BundleEntry("Vehicles/b.oiv", "versions/2/b.oiv", 0),
+        BundleEntry("Scripts/über.7z", "mods/c.7z", 7),
+    ]
+    bundle = ZipBundle(entries, timestamp=1700000000)
+    data = b"".join(bundle.stream(lambda key: io.BytesIO(objects[key])))
+
+    assert len(data) == bundle.content_length
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ["a.zip", "Vehicles/b.oiv", "Scripts/über.7z"]
+        for entry in entries:
+            assert archive.read(entry.name) == objects[entry.object_key]
+
+
+def test_size_change_aborts_the_stream():
+    bundle = ZipBundle([BundleEntry("a.zip", "mods/a.zip", 4)])
+    with pytest.raises(ValueError):
+        b"".join(bundle.stream(lambda key: io.BytesIO(b"grown since it was sized")))
+
+
+def test_zip64_entry_and_offset(tmp_path):
+    # Over 4 GB of zeros: the first entry needs Zip64 sizes, the second a Zip64 header offset
+    big = ZIP64_LIMIT + 12345
+    entries = [BundleEntry("big.bin", "big", big), BundleEntry("small.txt", "small", 5)]
+    bundle = ZipBundle(entries, timestamp=1700000000)
+    assert bundle.offsets[1] > ZIP64_LIMIT
+
+    path = tmp_path / "bundle.zip"
+    with open(path, "wb") as f:
+        for chunk in bundle.stream(lambda key: Zeros(big) if key == "big" else io.BytesIO(b"hello")):
+            f.write(chunk)
+
+    assert path.stat().st_size == bundle.content_length
+    with zipfile.ZipFile(path) as archive:
+        big_info, small_info = archive.infolist()
+        assert big_info.file_size == big
+        assert small_info.header_offset == bundle.offsets[1]
+        assert archive.read("small.txt") == b"hello"
@@ -0,0 +1,315 @@
+# tracing.py
+"""Span-based request tracing with head sampling and a local JSON lines exporter.
+
+Every request gets a trace id (returned in the X-Trace-Id header). The sampling
+decision is made once at the root span: an incoming W3C `traceparent` header is
+honoured, otherwise TRACE_SAMPLE_RATE of requests are sampled. Unsampled
+requests only carry the id; child spans are not created for them.
+
+Sampled spans are written by a background thread to TRACE_EXPORT_PATH, one
+OTLP/JSON `ExportTraceServiceRequest` per line, so the file can be replayed into
+any OTLP collector (e.g. with the collector's `otlpjsonfile` receiver).
+
+The current span lives in a contextvar. asyncio tasks and `asyncio.to_thread`
+copy it; `loop.run_in_executor` does not, so `storage.run_in_io_pool` copies
+the context explicitly.
+"""
+import os
+import json
+import time
+import queue
+import random
+import logging
+import threading
+import contextvars
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "sampled",
+                 "start_ns", "end_ns", "attributes", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 kind: int = KIND_INTERNAL, attributes: Optional[dict] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled traces, so call sites need no checks."""
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def span(name: str, attributes: Optional[dict] = None, kind: int = KIND_INTERNAL):
+    """Child span of the current one, used as a context manager. A no-op outside sampled traces."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, True, kind, attributes)
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, attributes: Optional[dict] = None) -> Span:
+    """Root span for a request, making the head sampling decision."""
+    if traceparent:
+        parts = traceparent.split("-")
+        if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+            try:
+                sampled = bool(int(parts[3], 16) & 1)
+            except ValueError:
+                sampled = False
+            return Span(name, parts[1], parts[2], sampled, KIND_SERVER, attributes)
+    sampled = settings.TRACE_SAMPLE_RATE > 0 and random.random() < settings.TRACE_SAMPLE_RATE
+    return Span(name, os.urandom(16).hex(), None, sampled, KIND_SERVER, attributes)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+        "status": {"code": 2, "message": span.error} if span.error else {},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+
+class SpanExporter:
+    """Queues finished spans and appends them to a file from a background thread."""
+
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 512):
+        self.path = path
+        self.batch_size = batch_size
+        self.exported = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            # Never block the request path on the exporter
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        resource = {"attributes": [
+            {"key": "service.name", "value": {"stringValue": settings.TRACE_SERVICE_NAME}},
+            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+        ]}
+        stopping = False
+        while not stopping:
+            spans = []
+            item = self._queue.get()
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    spans.append(item)
+                if stopping or len(spans) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if spans:
+                self._write(resource, spans)
+
+    def _write(self, resource: dict, spans: list) -> None:
+        line = json.dumps({"resourceSpans": [{
+            "resource": resource,
+            "scopeSpans": [{"scope": {"name": "modzart"}, "spans": [_otlp_span(span) for span in spans]}],
+        }]}) + "\n"
+        try:
+            # One write per line in append mode, so workers sharing the file don't interleave lines
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode("utf-8"))
+            finally:
+                os.close(fd)
+            self.exported += len(spans)
+        except OSError as e:
+            self.dropped += len(spans)
+            logger.error(f"Failed to write {len(spans)} span(s) to {self.path}: {e}")
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Write out queued spans and stop the exporter thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def collect_metrics(self):
+        yield metrics.Sample("modzart_trace_spans_exported_total", self.exported, {},
+                             "Sampled spans written to the trace file", "counter")
+        yield metrics.Sample("modzart_trace_spans_dropped_total", self.dropped, {},
+                             "Sampled spans dropped because the export queue was full or the write failed", "counter")
+
+
+exporter = SpanExporter(settings.TRACE_EXPORT_PATH)
+metrics.register_collector(exporter.collect_metrics)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the root span of each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = start_trace(f"{scope['method']} {scope['path']}", traceparent, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        trace_header = (b"x-trace-id", root.trace_id.encode("ascii"))
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [trace_header]
+            await send(message)
+
+        with root:
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                # Routing has filled these in by now; the route template keeps span names low-cardinality
+                route = scope.get("route")
+                if route is not None and getattr(route, "path", None):
+                    root.name = f"{scope['method']} {route.path}"
+                    root.set_attribute("http.route", route.path)
+                endpoint = scope.get("endpoint")
+                if endpoint is not None:
+                    root.set_attribute("code.function", getattr(endpoint, "__name__", str(endpoint)))
+
+
+# --- SQLAlchemy query spans, for every engine (primary and replicas) ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    query_span = span("db.query", {
+        "db.system": conn.dialect.name,
+        "db.statement": statement[:1000],
+    }, KIND_CLIENT)
+    if query_span is not NOOP_SPAN:
+        context._trace_span = query_span
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    query_span = getattr(context, "_trace_span", None)
+    if query_span is not None:
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            query_span.set_attribute("db.rows_affected", cursor.rowcount)
+        query_span.end()
+        context._trace_span = None
+
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    query_span = getattr(context, "_trace_span", None) if context is not None else None
+    if query_span is not None:
+        query_span.error = str(exception_context.original_exception)
+        query_span.end()
+        context._trace_span = None
+
+
+def instrument_sqlalchemy() -> None:
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
@@ -0,0 +1,321 @@
+# upload_progress.py
+"""Push-based upload progress, streamed to clients as server-sent events.
+
+The client picks an upload id (e.g. a UUID), opens
+GET /uploads/{upload_id}/events and sends the upload with an `X-Upload-Id`
+header. Every event has `upload_id`, `phase` and `time`; phases in order:
+
+* receiving: `bytes`, `total` of the request body (total is null without Content-Length)
+* validating, saving
+* scanning: `engine` ("local" or "virustotal"); VirusTotal also sends its analysis `state` and `attempt`
+* storing: `bytes`, `total` transferred to the storage backend
+* indexing
+* complete or failed: `status_code`, and `detail` for failures
+
+If no event at all arrives within UPLOAD_PROGRESS_UNKNOWN_SECONDS of
+subscribing, the stream sends a single `unknown` event and closes.
+
+Events go through an in-process broker, or a Redis pub/sub channel per upload
+when REDIS_URL is set, so the event stream can be served by any worker.
+Without Redis a subscriber only sees uploads sent to its own worker (serve.py
+warns when it runs several). The last event of each upload is kept for
+UPLOAD_PROGRESS_TTL_SECONDS, so a client that subscribes late starts from the
+current phase.
+"""
+import re
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from config import settings
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{16,64}")
+TERMINAL_PHASES = ("complete", "failed")
+MAX_ERROR_BODY = 4096
+# Events waiting for the Redis publisher thread; newer ones are dropped while it is full
+PUBLISH_QUEUE_SIZE = 10000
+PUBLISH_BATCH_SIZE = 100
+
+_current_upload = contextvars.ContextVar("upload_id", default=None)
+
+
+def make_event(upload_id: str, phase: str, **fields) -> dict:
+    return {"upload_id": upload_id, "phase": phase, "time": time.time(), **fields}
+
+
+class _QueueSubscription:
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """The next event, or None if none arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InMemoryBroker:
+    """Delivers events to subscribers in this worker process."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # upload id -> {(loop, queue)}
+        self._last = TTLCache(10000, settings.UPLOAD_PROGRESS_TTL_SECONDS)
+        self._lock = threading.Lock()
+
+    def publish(self, upload_id: str, event: dict) -> None:
+        """Thread-safe; called from the event loop and from storage threads."""
+        with self._lock:
+            self._last.set(upload_id, event)
+            subscribers = list(self._subscribers.get(upload_id, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop is closed (worker shutting down)
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, upload_id: str):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers[upload_id].add(subscriber)
+            last = self._last.get(upload_id)
+        if last is not None:
+            subscriber[1].put_nowait(last)
+        try:
+            yield _QueueSubscription(subscriber[1])
+        finally:
+            with self._lock:
+                self._subscribers[upload_id].discard(subscriber)
+                if not self._subscribers[upload_id]:
+                    del self._subscribers[upload_id]
+
+    async def close(self) -> None:
+        pass
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub, pending: list):
+        self.pubsub = pubsub
+        self.pending = pending
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        if self.pending:
+            return self.pending.pop(0)
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return json.loads(message["data"]) if message else None
+
+
+class RedisBroker:
+    """Publishes through a Redis channel per upload, shared by all workers.
+
+    `publish` only queues the event: a publisher thread sends queued events in
+    order, so a slow or unreachable Redis delays progress events rather than
+    the event loop or the upload.
+    """
+
+    def __init__(self, redis_url: str, prefix: str = "modzart:upload"):
+        import redis
+
+        self.redis_url = redis_url
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(
+            redis_url, socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        )
+        self._async_redis = None
+        self._queue = queue.Queue(maxsize=PUBLISH_QUEUE_SIZE)
+        self._dropped = 0
+        self._thread = threading.Thread(target=self._publish_queued, name="upload-progress-publisher", daemon=True)
+        self._thread.start()
+
+    def publish(self, upload_id: str, event: dict) -> None:
+        """Thread-safe and non-blocking; called from the event loop and from storage threads."""
+        try:
+            self._queue.put_nowait((upload_id, event))
+        except queue.Full:
+            # Progress is best effort; never hold up the upload over it
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 1000 == 0:
+                logger.error(f"Upload progress queue is full; {self._dropped} events dropped so far.")
+
+    def _publish_queued(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < PUBLISH_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._send(batch)
+            if stop:
+                return
+
+    def _send(self, batch: list) -> None:
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for upload_id, event in batch:
+                data = json.dumps(event)
+                pipe.set(f"{self.prefix}:{upload_id}:last", data, ex=settings.UPLOAD_PROGRESS_TTL_SECONDS)
+                pipe.publish(f"{self.prefix}:{upload_id}", data)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to publish {len(batch)} upload progress events: {e}")
+
+    @property
+    def async_redis(self):
+        if self._async_redis is None:
+            import redis.asyncio
+
+            # No read timeout: subscribers block in get_message with their own timeout
+            self._async_redis = redis.asyncio.Redis.from_url(
+                self.redis_url, socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS
+            )
+        return self._async_redis
+
+    @asynccontextmanager
+    async def subscribe(self, upload_id: str):
+        pubsub = self.async_redis.pubsub()
+        # Subscribe before reading the last event so nothing published in between is missed
+        await pubsub.subscribe(f"{self.prefix}:{upload_id}")
+        try:
+            last = await self.async_redis.get(f"{self.prefix}:{upload_id}:last")
+            yield _RedisSubscription(pubsub, [json.loads(last)] if last else [])
+        finally:
+            await pubsub.reset()
+
+    async def close(self) -> None:
+        # Sends what is queued (e.g. the "complete" events of the last requests), then stops
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        await asyncio.to_thread(self._thread.join, 5 * settings.REDIS_SOCKET_TIMEOUT_SECONDS)
+        self.redis.close()
+        if self._async_redis is not None:
+            await self._async_redis.close()
+
+
+def create_broker():
+    if settings.REDIS_URL:
+        logger.info("Using Redis upload progress broker.")
+        return RedisBroker(settings.REDIS_URL)
+    return InMemoryBroker()
+
+
+broker = create_broker()
+
+
+def current_upload_id() -> Optional[str]:
+    return _current_upload.get()
+
+
+def publish(phase: str, **fields) -> None:
+    """Publish an event for the upload of the current request, if the client asked for progress."""
+    upload_id = _current_upload.get()
+    if upload_id is not None:
+        broker.publish(upload_id, make_event(upload_id, phase, **fields))
+
+
+class ByteProgress:
+    """Counts transferred bytes and publishes at most every UPLOAD_PROGRESS_INTERVAL_SECONDS.
+
+    Usable as a boto3 transfer callback, which is called from transfer threads.
+    """
+
+    def __init__(self, upload_id: str, phase: str, total: Optional[int]):
+        self.upload_id = upload_id
+        self.phase = phase
+        self.total = total
+        self.bytes = 0
+        self._published_at = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, amount: int) -> None:
+        with self._lock:
+            self.bytes += amount
+            now = time.monotonic()
+            if now - self._published_at < settings.UPLOAD_PROGRESS_INTERVAL_SECONDS and self.bytes != self.total:
+                return
+            self._published_at = now
+            event = make_event(self.upload_id, self.phase, bytes=self.bytes, total=self.total)
+        broker.publish(self.upload_id, event)
+
+
+def byte_progress(phase: str, total: Optional[int]) -> Optional[ByteProgress]:
+    """A ByteProgress for the current upload, or None when no progress was requested."""
+    upload_id = _current_upload.get()
+    return ByteProgress(upload_id, phase, total) if upload_id is not None else None
+
+
+class UploadProgressMiddleware:
+    """ASGI middleware publishing received bytes and the final result of uploads sent with X-Upload-Id."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        upload_id = None
+        total = None
+        for key, value in scope["headers"]:
+            if key == b"x-upload-id":
+                upload_id = value.decode("latin-1")
+            elif key == b"content-length" and value.isdigit():
+                total = int(value)
+        if upload_id is None or not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+            return await self.app(scope, receive, send)
+
+        received = ByteProgress(upload_id, "receiving", total)
+        status_code = None
+        error_body = b""
+
+        async def progress_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                received(len(message.get("body", b"")))
+            return message
+
+        async def progress_send(message):
+            nonlocal status_code, error_body
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body" and status_code >= 400 and len(error_body) < MAX_ERROR_BODY:
+                error_body += message.get("body", b"")
+            await send(message)
+
+        token = _current_upload.set(upload_id)
+        try:
+            await self.app(scope, progress_receive, progress_send)
+        except Exception:
+            status_code = status_code or 500
+            raise
+        finally:
+            _current_upload.reset(token)
+            if status_code is not None and status_code < 400:
+                broker.publish(upload_id, make_event(upload_id, "complete", status_code=status_code))
+            else:
+                broker.publish(upload_id, make_event(
+                    upload_id, "failed", status_code=status_code, detail=_error_detail(error_body)
+                ))
+
+
+def _error_detail(body: bytes) -> Optional[str]:
+    try:
+        detail = json.loads(body).get("detail")
+    except (ValueError, AttributeError):
+        return None
+    return detail if isinstance(detail, str) else json.dumps(detail)
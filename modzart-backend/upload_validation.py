@@ -0,0 +1,308 @@
+# upload_validation.py
+"""Early rejection of uploads, before they are copied to TEMP_UPLOAD_DIR, scanned or stored.
+
+Two stages:
+
+* `UploadLimitMiddleware` works on the request body as it is received, before
+  the multipart parser spools it to disk. It enforces per-route size limits from
+  Content-Length and from the running byte count, and on UPLOAD_SNIFF_PATHS it
+  checks the magic bytes of the first file part against the UPLOAD_ALLOWED_TYPES
+  allowlist as soon as they arrive, so a disallowed file costs a few KB of body.
+* `validate_upload` runs on the spooled file at the start of `handle_mod_upload`.
+  It repeats the type check (for bodies the middleware could not sniff) and reads
+  zip central directories (no decompression) to reject archive bombs. A zip's
+  central directory is at its end, so this check needs the whole file and only
+  runs after spooling.
+"""
+import os
+import re
+import zipfile
+import logging
+from fnmatch import fnmatch
+from typing import Optional
+from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# type -> (magic byte prefixes, accepted file extensions)
+FILE_TYPES = {
+    "zip": ((b"PK\x03\x04", b"PK\x05\x06"), (".zip",)),
+    # OpenIV packages are zip archives
+    "oiv": ((b"PK\x03\x04", b"PK\x05\x06"), (".oiv",)),
+    "7z": ((b"7z\xbc\xaf\x27\x1c",), (".7z",)),
+    "rar": ((b"Rar!\x1a\x07\x00", b"Rar!\x1a\x07\x01\x00"), (".rar",)),
+    # ASI plugins are renamed DLLs; both are PE files
+    "asi": ((b"MZ",), (".asi",)),
+    "dll": ((b"MZ",), (".dll",)),
+}
+ZIP_TYPES = ("zip", "oiv")
+SNIFF_BYTES = 8
+# The middleware stops looking for the file part after this much body (e.g. huge form fields before it)
+SNIFF_BUFFER_BYTES = 256 * 1024
+FILENAME_PATTERN = re.compile(r'(?:^|;)\s*filename=(?:"([^"]*)"|([^;\s]*))', re.IGNORECASE)
+
+
+def parse_size_limits(value: str) -> list:
+    """Parse "pattern=MB,..." into [(path pattern, bytes)], most specific pattern first."""
+    limits = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        pattern, _, size_mb = item.partition("=")
+        limits.append((pattern.strip(), int(float(size_mb) * MB)))
+    return sorted(limits, key=lambda limit: len(limit[0]), reverse=True)
+
+
+class UploadRejected(HTTPException):
+    """Raised from the request body stream to refuse an upload before the route has spooled it."""
+
+
+class UploadTooLarge(UploadRejected):
+    def __init__(self, limit: int):
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Request body exceeds the {limit // MB} MB limit for this endpoint."
+        )
+
+
+def multipart_boundary(content_type: str) -> Optional[bytes]:
+    """The boundary of a multipart/form-data Content-Type, or None for other bodies."""
+    media_type, _, params = content_type.partition(";")
+    if media_type.strip().lower() != "multipart/form-data":
+        return None
+    for param in params.split(";"):
+        key, _, value = param.strip().partition("=")
+        if key.lower() == "boundary" and value:
+            return value.strip('"').encode("latin-1")
+    return None
+
+
+def part_filename(headers: bytes) -> Optional[str]:
+    """The filename in a multipart part's Content-Disposition, or None if it is not a file."""
+    for line in headers.decode("utf-8", "replace").split("\r\n"):
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-disposition":
+            match = FILENAME_PATTERN.search(value)
+            if match is None:
+                return None
+            return match.group(1) if match.group(1) is not None else match.group(2)
+    return None
+
+
+class MultipartSniffer:
+    """Finds the first file part of a multipart body as it streams in."""
+
+    def __init__(self, boundary: bytes):
+        self.delimiter = b"--" + boundary
+        self.buffer = b""
+        self.done = False
+
+    def feed(self, chunk: bytes) -> Optional[tuple]:
+        """(filename, first SNIFF_BYTES of the file) once they have arrived, else None."""
+        if self.done:
+            return None
+        self.buffer += chunk
+        position = 0
+        while True:
+            start = self.buffer.find(self.delimiter, position)
+            headers_end = self.buffer.find(b"\r\n\r\n", start) if start != -1 else -1
+            if headers_end == -1:
+                break
+            filename = part_filename(self.buffer[start + len(self.delimiter):headers_end])
+            data_start = headers_end + 4
+            if filename is None:
+                position = data_start
+                continue
+            # A file shorter than SNIFF_BYTES ends at the next delimiter, which must then be in sight
+            window = self.buffer[data_start:data_start + SNIFF_BYTES + 2 + len(self.delimiter)]
+            end = window.find(b"\r\n" + self.delimiter)
+            if end == -1 and len(window) < SNIFF_BYTES + 2 + len(self.delimiter):
+                break
+            header = window[:SNIFF_BYTES] if end == -1 else window[:min(end, SNIFF_BYTES)]
+            self.done = True
+            self.buffer = b""
+            # Empty files are left to validate_upload, which says so
+            return (filename, header) if header else None
+        if len(self.buffer) > SNIFF_BUFFER_BYTES:
+            self.done = True
+            self.buffer = b""
+        return None
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware rejecting request bodies over the size limit of their route, or of a disallowed type."""
+
+    def __init__(self, app, limits: str = settings.UPLOAD_SIZE_LIMITS_MB,
+                 default_limit_mb: float = settings.UPLOAD_DEFAULT_MAX_SIZE_MB,
+                 sniff_paths: str = settings.UPLOAD_SNIFF_PATHS):
+        self.app = app
+        self.limits = parse_size_limits(limits)
+        self.default_limit = int(default_limit_mb * MB)
+        self.sniff_paths = [pattern.strip() for pattern in sniff_paths.split(",") if pattern.strip()]
+
+    def limit_for(self, path: str) -> int:
+        for pattern, limit in self.limits:
+            if fnmatch(path, pattern):
+                return limit
+        return self.default_limit
+
+    def sniffer_for(self, scope) -> Optional[MultipartSniffer]:
+        if not any(fnmatch(scope["path"], pattern) for pattern in self.sniff_paths):
+            return None
+        for key, value in scope["headers"]:
+            if key == b"content-type":
+                boundary = multipart_boundary(value.decode("latin-1"))
+                return MultipartSniffer(boundary) if boundary else None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        limit = self.limit_for(scope["path"])
+        for key, value in scope["headers"]:
+            if key == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    logger.warning(f"Rejected {scope['path']} upload by Content-Length: {declared} > {limit} bytes.")
+                    return await self._reject(UploadTooLarge(limit), scope, receive, send)
+                break
+
+        sniffer = self.sniffer_for(scope)
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    logger.warning(f"Aborted {scope['path']} upload after {received} bytes (limit: {limit}).")
+                    # HTTPException passes through FastAPI's body parsing and becomes the error response
+                    raise UploadTooLarge(limit)
+                if sniffer is not None and not sniffer.done:
+                    found = sniffer.feed(message.get("body", b""))
+                    if found:
+                        check_type(scope["path"], *found)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadRejected as error:
+            # Raised outside a route's body parsing (e.g. while reading a raw body)
+            if response_started:
+                raise
+            await self._reject(error, scope, receive, send)
+
+    async def _reject(self, error: UploadRejected, scope, receive, send):
+        # Close the connection rather than reading the rest of the body
+        response = JSONResponse({"detail": error.detail}, status_code=error.status_code,
+                                headers={"Connection": "close"})
+        await response(scope, receive, send)
+
+
+def detect_type(header: bytes, filename: str) -> str:
+    """Return the allowed type matching the magic bytes and extension, or raise HTTPException."""
+    extension = os.path.splitext(filename or "")[1].lower()
+    allowed = [name.strip() for name in settings.UPLOAD_ALLOWED_TYPES.split(",") if name.strip()]
+    magic_matches = [
+        name for name in allowed
+        if name in FILE_TYPES and header.startswith(FILE_TYPES[name][0])
+    ]
+    if not magic_matches:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported file type. Allowed: {', '.join(allowed)}"
+        )
+    for name in magic_matches:
+        if extension in FILE_TYPES[name][1]:
+            return name
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail=f"File extension '{extension or '(none)'}' does not match its content ({magic_matches[0]})."
+    )
+
+
+def check_type(path: str, filename: str, header: bytes) -> None:
+    """Refuse a streaming upload whose first bytes are not an allowed type; raises UploadRejected."""
+    try:
+        detect_type(header, filename)
+    except HTTPException as e:
+        logger.warning(f"Rejected {path} upload '{filename}' by its first bytes: {e.detail}")
+        raise UploadRejected(status_code=e.status_code, detail=e.detail)
+
+
+def check_zip_bomb(file, size: int) -> None:
+    """Reject zip archives whose central directory describes a decompression bomb."""
+    try:
+        with zipfile.ZipFile(file) as archive:
+            entries = archive.infolist()
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid zip archive: {e}")
+
+    if len(entries) > settings.UPLOAD_MAX_ARCHIVE_ENTRIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Archive has {len(entries)} entries (limit: {settings.UPLOAD_MAX_ARCHIVE_ENTRIES})."
+        )
+    total_uncompressed = 0
+    for entry in entries:
+        total_uncompressed += entry.file_size
+        # Stored entries and tiny files cannot be bombs; only large, highly compressed ones are
+        if entry.file_size > MB and entry.file_size > entry.compress_size * settings.UPLOAD_MAX_COMPRESSION_RATIO:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Archive entry '{entry.filename}' exceeds the allowed compression ratio."
+            )
+    if total_uncompressed > settings.UPLOAD_MAX_UNCOMPRESSED_MB * MB:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Archive expands to more than {settings.UPLOAD_MAX_UNCOMPRESSED_MB} MB."
+        )
+    if size and total_uncompressed > MB and total_uncompressed > size * settings.UPLOAD_MAX_COMPRESSION_RATIO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Archive exceeds the allowed overall compression ratio."
+        )
+
+
+def validate_file(file, filename: str) -> str:
+    """Validate a seekable file object. Returns the detected type. Blocking."""
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    header = file.read(SNIFF_BYTES)
+    file.seek(0)
+    if not header:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Uploaded file is empty.")
+    file_type = detect_type(header, filename)
+    if file_type in ZIP_TYPES:
+        try:
+            check_zip_bomb(file, size)
+        finally:
+            file.seek(0)
+    return file_type
+
+
+async def validate_upload(upload_file: UploadFile) -> str:
+    """Validate an upload before it is copied, scanned or stored. Returns the detected type."""
+    # The spooled file may be on disk; reading its central directory is blocking I/O
+    file_type = await run_in_threadpool(validate_file, upload_file.file, upload_file.filename)
+    logger.info(f"Upload '{upload_file.filename}' passed validation as {file_type}.")
+    return file_type
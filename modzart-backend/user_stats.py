@@ -0,0 +1,94 @@
+# user_stats.py
+"""Per-user counters (mod count, total downloads) kept up to date incrementally.
+
+Mod create/delete adjust the counters in the same transaction as the mod row,
+and buffered download counts are added when they are flushed. `recompute_user_stats`
+rebuilds every counter from one grouped query and can be run as a repair job:
+
+    python user_stats.py --repair
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import func, delete, insert
+from sqlalchemy.orm import Session
+
+from models import Mod, UserStats
+
+logger = logging.getLogger(__name__)
+
+
+def _upsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"User stats upsert is not implemented for {dialect}")
+    return dialect_insert(UserStats)
+
+
+def increment_user_stats(db: Session, user_id: int, mods: int = 0, downloads: int = 0) -> None:
+    """Add to a user's counters, creating the row if needed. Does not commit."""
+    if not user_id or (not mods and not downloads):
+        return
+    stmt = _upsert(db).values(
+        user_id=user_id, mod_count=max(mods, 0), total_downloads=max(downloads, 0), updated_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            "mod_count": UserStats.mod_count + mods,
+            "total_downloads": UserStats.total_downloads + downloads,
+            "updated_at": datetime.utcnow(),
+        },
+    )
+    db.execute(stmt)
+
+
+def get_user_stats(db: Session, user_id: int) -> dict:
+    """Counters for one user; a single primary-key lookup."""
+    stats = db.get(UserStats, user_id)
+    if stats is None:
+        return {"user_id": user_id, "mod_count": 0, "total_downloads": 0}
+    return {"user_id": user_id, "mod_count": stats.mod_count, "total_downloads": stats.total_downloads}
+
+
+def recompute_user_stats(db: Session) -> int:
+    """Rebuild all counters from the mods table. Returns the number of users with mods."""
+    rows = db.query(
+        Mod.user_id,
+        func.count(Mod.id),
+        func.coalesce(func.sum(Mod.downloads), 0),
+    ).filter(Mod.user_id.isnot(None)).group_by(Mod.user_id).all()
+
+    now = datetime.utcnow()
+    db.execute(delete(UserStats))
+    if rows:
+        db.execute(insert(UserStats), [
+            {"user_id": user_id, "mod_count": mod_count, "total_downloads": downloads, "updated_at": now}
+            for user_id, mod_count, downloads in rows
+        ])
+    db.commit()
+    logger.info(f"Recomputed stats for {len(rows)} user(s).")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    import logging.config
+    from db_config import SessionLocal
+    from main import LOGGING_CONFIG
+
+    parser = argparse.ArgumentParser(description="Maintain per-user stats counters.")
+    parser.add_argument("--repair", action="store_true", help="Recompute all counters from the mods table")
+    args = parser.parse_args()
+    if not args.repair:
+        parser.print_help()
+    else:
+        logging.config.dictConfig(LOGGING_CONFIG)
+        db = SessionLocal()
+        try:
+            recompute_user_stats(db)
+        finally:
+            db.close()
@@ -0,0 +1,162 @@
+# zip_bundle.py
+"""Zip archives streamed straight from storage, for modpack bundles (POST /mods/bundle).
+
+Entries are stored, not deflated: mod files are archives already, so
+compressing them again would cost CPU for next to nothing. Objects are read
+and sent a chunk at a time, with no temp file and nothing buffered beyond one
+chunk.
+
+The layout depends only on entry names and sizes, so the full length is
+known before the first byte is sent and the response carries a
+Content-Length for progress bars. The CRC-32 of each entry, the one value
+not known up front, is computed while streaming and sent after the entry in
+a data descriptor (general purpose flag bit 3) and in the central directory,
+both of fixed size. Zip64 records are used for entries and offsets past 4 GB.
+"""
+import time
+import zlib
+import struct
+import logging
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+from archive_manifest import (
+    CENTRAL_HEADER, CENTRAL_HEADER_SIGNATURE, EOCD, EOCD_SIGNATURE, ZIP64_EOCD, ZIP64_EOCD_SIGNATURE,
+    ZIP64_LOCATOR, ZIP64_LOCATOR_SIGNATURE, ZIP64_EXTRA_ID,
+)
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+DATA_DESCRIPTOR = struct.Struct("<IIII")
+DATA_DESCRIPTOR_ZIP64 = struct.Struct("<IIQQ")
+DATA_DESCRIPTOR_SIGNATURE = 0x08074B50
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+VERSION = 20
+VERSION_ZIP64 = 45
+MADE_BY_UNIX = 3 << 8
+# Bit 3: CRC and sizes follow the data in a descriptor; bit 11: names are UTF-8
+FLAGS = 0x08 | 0x800
+STORED = 0
+FILE_ATTRIBUTES = 0o100644 << 16
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BundleEntry(NamedTuple):
+    name: str  # Path inside the zip
+    object_key: str
+    size: int
+
+
+def _dos_datetime(timestamp: float) -> tuple:
+    t = time.localtime(timestamp)
+    return (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday, t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+
+
+class ZipBundle:
+    """A stored-entry zip of objects whose sizes are known; `content_length` is exact before streaming."""
+
+    def __init__(self, entries: List[BundleEntry], timestamp: Optional[float] = None):
+        self.entries = entries
+        self.dos_date, self.dos_time = _dos_datetime(timestamp or time.time())
+        self.offsets = []
+        offset = 0
+        for entry in entries:
+            self.offsets.append(offset)
+            offset += len(self._local_header(entry)) + entry.size + self._descriptor_size(entry)
+        self.central_directory_offset = offset
+        # The CRCs do not change the central directory's length
+        self.content_length = offset + len(self._central_directory([0] * len(entries)))
+
+    def _local_header(self, entry: BundleEntry) -> bytes:
+        name = entry.name.encode("utf-8")
+        if entry.size >= ZIP64_LIMIT:
+            # The sizes are in the descriptor; the extra field only marks the entry as Zip64
+            extra = struct.pack("<HHQQ", ZIP64_EXTRA_ID, 16, 0, 0)
+            version, sizes = VERSION_ZIP64, ZIP64_LIMIT
+        else:
+            extra, version, sizes = b"", VERSION, 0
+        return LOCAL_HEADER.pack(
+            LOCAL_HEADER_SIGNATURE, version, FLAGS, STORED, self.dos_time, self.dos_date, 0, sizes, sizes,
+            len(name), len(extra),
+        ) + name + extra
+
+    @staticmethod
+    def _descriptor_size(entry: BundleEntry) -> int:
+        return DATA_DESCRIPTOR_ZIP64.size if entry.size >= ZIP64_LIMIT else DATA_DESCRIPTOR.size
+
+    @staticmethod
+    def _descriptor(entry: BundleEntry, crc: int) -> bytes:
+        descriptor = DATA_DESCRIPTOR_ZIP64 if entry.size >= ZIP64_LIMIT else DATA_DESCRIPTOR
+        return descriptor.pack(DATA_DESCRIPTOR_SIGNATURE, crc, entry.size, entry.size)
+
+    def _central_directory(self, crcs: List[int]) -> bytes:
+        """The central directory and end records, which follow the last entry."""
+        records = []
+        for entry, offset, crc in zip(self.entries, self.offsets, crcs):
+            name = entry.name.encode("utf-8")
+            # Values too large for their field are saturated and listed in the Zip64 extra, in this order
+            zip64_fields = []
+            size = entry.size
+            if size >= ZIP64_LIMIT:
+                zip64_fields += [size, size]
+                size = ZIP64_LIMIT
+            header_offset = offset
+            if header_offset >= ZIP64_LIMIT:
+                zip64_fields.append(header_offset)
+                header_offset = ZIP64_LIMIT
+            extra = b""
+            version = VERSION
+            if zip64_fields:
+                extra = struct.pack(f"<HH{len(zip64_fields)}Q", ZIP64_EXTRA_ID, 8 * len(zip64_fields), *zip64_fields)
+                version = VERSION_ZIP64
+            records.append(CENTRAL_HEADER.pack(
+                CENTRAL_HEADER_SIGNATURE, MADE_BY_UNIX | version, version, FLAGS, STORED, self.dos_time,
+                self.dos_date, crc, size, size, len(name), len(extra), 0, 0, 0, FILE_ATTRIBUTES, header_offset,
+            ) + name + extra)
+        central_directory = b"".join(records)
+
+        count = len(self.entries)
+        cd_size = len(central_directory)
+        cd_offset = self.central_directory_offset
+        end = b""
+        if count >= ZIP64_COUNT_LIMIT or cd_size >= ZIP64_LIMIT or cd_offset >= ZIP64_LIMIT:
+            zip64_eocd_offset = cd_offset + cd_size
+            end += ZIP64_EOCD.pack(
+                ZIP64_EOCD_SIGNATURE, ZIP64_EOCD.size - 12, MADE_BY_UNIX | VERSION_ZIP64, VERSION_ZIP64, 0, 0,
+                count, count, cd_size, cd_offset,
+            )
+            end += ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE, 0, zip64_eocd_offset, 1)
+        end += EOCD.pack(
+            EOCD_SIGNATURE, 0, 0, min(count, ZIP64_COUNT_LIMIT), min(count, ZIP64_COUNT_LIMIT),
+            min(cd_size, ZIP64_LIMIT), min(cd_offset, ZIP64_LIMIT), 0,
+        )
+        return central_directory + end
+
+    def stream(self, open_object: Callable) -> Iterator[bytes]:
+        """Yield the archive. `open_object(key)` returns a readable binary file object. Blocking."""
+        crcs = []
+        for entry in self.entries:
+            yield self._local_header(entry)
+            crc = 0
+            sent = 0
+            source = open_object(entry.object_key)
+            try:
+                while chunk := source.read(CHUNK_SIZE):
+                    sent += len(chunk)
+                    if sent > entry.size:
+                        break
+                    crc = zlib.crc32(chunk, crc)
+                    yield chunk
+            finally:
+                source.close()
+            if sent != entry.size:
+                # Replaced since it was sized; the promised Content-Length can no longer be kept
+                logger.error(f"Aborting bundle: {entry.object_key} changed size from {entry.size} bytes while streaming.")
+                raise ValueError(f"{entry.object_key} changed size while streaming")
+            crcs.append(crc)
+            yield self._descriptor(entry, crc)
+        yield self._central_directory(crcs)